@@ -1,11 +1,33 @@
 # authen.py
 # provides simple HMAC signatures of data
+#
+# Signer is what the lambdas use. It keys the hmac once per container and copies that state for
+# each request, and it signs a compact encoding of the data instead of sorted JSON. Its tokens
+# start with 'v2.' so they can't be mistaken for old ones. Old (getHMAC) tokens still verify
+# until legacyUntil, so puzzles handed out before a deploy can still be submitted, and each one
+# that does is logged (logger 'authen', WARNING) so it's clear when they've stopped coming in.
+#
+# digest() is for the puzzle's solution: getpuzzle signs a digest of it along with the puzzle,
+# and submitpuzzle just digests the submission and compares.
 
 import hmac
+import itertools
 import json 
+import logging
+import os
+import time
 
 
 TESTKEY1 = "development key"
+TOKEN_PREFIX = 'v2.'
+# unix time after which old JSON-format tokens stop verifying: 2026-10-20 00:00 UTC, a day and
+# a bit after v2 tokens shipped (longer than anyone takes over one puzzle). A fixed date, so
+# redeploys don't push it back. PSEUDOKU_LEGACY_HMAC_UNTIL overrides it
+LEGACY_UNTIL_DEFAULT = 1792454400
+LEGACY_UNTIL = float(os.environ.get('PSEUDOKU_LEGACY_HMAC_UNTIL', LEGACY_UNTIL_DEFAULT))
+DIGITS = bytes.maketrans(bytes(range(10)), b'0123456789')
+
+log = logging.getLogger(__name__)
 
 
 def getHMAC(data, key):
@@ -24,3 +46,81 @@ def checkHMAC(userdata, userHMAC, key):
     """Checks whether the provided user data matches the provided hmac. Return bool."""
     calcHMAC = getHMAC(userdata, key)
     return hmac.compare_digest(userHMAC, calcHMAC)
+
+
+def encodeValue(value):
+    """One value -> tagged string. Tags keep types apart (True vs 1, '1' vs 1), and a 9x9 board
+    of digits becomes just its 81 characters"""
+    if value is None:
+        return 'n'
+    if isinstance(value, bool):
+        return 'b1' if value else 'b0'
+    if isinstance(value, int):
+        return 'i' + str(value)
+    if isinstance(value, float):
+        return 'f' + repr(value)
+    if isinstance(value, str):
+        return 's' + value
+    if (isinstance(value, list) and len(value) == 9
+            and all(isinstance(row, list) and len(row) == 9 for row in value)):
+        try:
+            flat = bytes(itertools.chain.from_iterable(value))      # fails on non-ints, <0 or >255
+        except (TypeError, ValueError):
+            flat = None
+        if flat is not None and max(flat) <= 9:
+            return 'g' + flat.translate(DIGITS).decode()
+    return 'j' + json.dumps(value, sort_keys=True)
+
+def encode(data):
+    """Compact canonical bytes for a flat dict of data: key, then tagged value, each
+    length-prefixed, in key order. Length prefixes mean no value can spill into the next one."""
+    parts = []
+    for key in sorted(data):
+        value = encodeValue(data[key])
+        parts.append('{}:{}{}:{}'.format(len(key), key, len(value), value))
+    return ''.join(parts).encode()
+
+
+class Signer:
+    """HMAC signer for one key. Build one per container and reuse it."""
+
+    def __init__(self, key, legacyUntil=LEGACY_UNTIL):
+        self.key = key
+        self.base = hmac.new(bytes(key, 'utf-8'), digestmod='sha256')     # keyed once, copied per use
+        self.legacyUntil = legacyUntil
+
+    def sign(self, data):
+        """Returns token for a dict of data"""
+        h = self.base.copy()
+        h.update(encode(data))
+        return TOKEN_PREFIX + h.hexdigest()
+
+    def verify(self, data, token, now=None):
+        """True if token is our signature of data. Old getHMAC() tokens pass too, until legacyUntil"""
+        if not isinstance(token, str):
+            return False
+        if token.startswith(TOKEN_PREFIX):
+            return hmac.compare_digest(token, self.sign(data))
+        if (time.time() if now is None else now) >= self.legacyUntil:
+            return False
+        if not checkHMAC(data, token, self.key):
+            return False
+        log.warning('accepted legacy token for puzzleid %s (legacy tokens accepted until %.0f)',
+                    data.get('puzzleid') if isinstance(data, dict) else None, self.legacyUntil)
+        return True
+
+    def digest(self, board):
+        """Short keyed digest of a board, for putting a puzzle's solution in signed data without
+        giving it away. board is 9x9 lists or the compact 81-digit string--the same board gives
+        the same digest either way. 128 bits, and prefixed so it can't pass for a token"""
+        if isinstance(board, str) and len(board) == 81 and board.isascii() and board.isdigit():
+            value = 'g' + board
+        else:
+            value = encodeValue(board)
+        h = self.base.copy()
+        h.update(b'digest:' + value.encode())
+        return h.hexdigest()[:32]
+
+    def checkDigest(self, board, digest):
+        """True if board is the board digest() was made from"""
+        return isinstance(digest, str) and hmac.compare_digest(digest, self.digest(board))
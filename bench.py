@@ -0,0 +1,361 @@
+# bench.py
+# benchmark harness for the whole stack, from sudolib primitives up to both lambda handlers.
+# Replaces the old sudolib.speedTests(). Every case runs with a fixed random seed after a
+# warmup, and we report per-call percentiles rather than one total.
+#
+#   python bench.py                                  run everything, print a table
+#   python bench.py -k solve -k carve                only cases whose name contains these
+#   python bench.py --json out.json                  also write machine-readable results
+#   python bench.py --baseline bench_baseline.json   compare p50s, exit 1 on regression (or on a
+#                                                    case the baseline doesn't have yet)
+#   python bench.py --save-baseline                  overwrite bench_baseline.json
+#   python bench.py --seed 99                        different (but still fixed) workload
+#   python bench.py --repeat 3 --save-baseline       run the suite 3 times, keep each case's
+#                                                    median run (use the same for --baseline)
+
+import argparse
+import itertools
+import json
+import logging
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+import authen
+import sudolib
+
+
+SEED = 1234
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+
+# solve corpus, easiest to hardest. The last three need real search, not just singles
+CORPUS = {
+    'easy-s3':    sudolib.stringify(sudolib.s3),
+    'easy-s4':    sudolib.stringify(sudolib.s4),
+    'easy-s5':    sudolib.stringify(sudolib.s5),
+    'escargot':   '100007090;030020008;009600500;005300900;010080002;600004000;300000010;040000007;007000300',
+    'inkala2012': '800000000;003600000;070090200;050007000;000045700;000100030;001000068;008500010;090000400',
+    'seventeen':  '400000805;030000000;000700000;020000060;000080400;000010000;000603070;500200000;104000000',
+}
+
+
+class Case:
+    """One benchmark. setup() runs once (untimed) and returns the function to time."""
+
+    def __init__(self, name, setup, number=100, warmup=5):
+        self.name = name
+        self.setup = setup
+        self.number = number
+        self.warmup = warmup
+
+    def run(self, scale=1.0):
+        random.seed(SEED)
+        func = self.setup()
+        for _ in range(self.warmup):
+            func()
+
+        random.seed(SEED)
+        samples = []
+        for _ in range(max(1, int(self.number * scale))):
+            start = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - start)
+        return summarize(samples)
+
+
+def summarize(samples):
+    """seconds -> dict of microsecond stats"""
+    samples = sorted(samples)
+    pick = lambda p: samples[min(len(samples) - 1, int(p * len(samples)))] * 1e6
+    return {
+        'n': len(samples),
+        'mean': sum(samples) / len(samples) * 1e6,
+        'p50': pick(0.50),
+        'p90': pick(0.90),
+        'p99': pick(0.99),
+        'max': samples[-1] * 1e6,
+    }
+
+
+def median(runs):
+    """the run (stats dict) with the median p50"""
+    return sorted(runs, key=lambda stats: stats['p50'])[len(runs) // 2]
+
+
+#---------------CASES------------------------#
+
+def call(func, *args, **kwargs):
+    """setup for the common case: just time func(*args, **kwargs)"""
+    return lambda: lambda: func(*args, **kwargs)
+
+def once(build):
+    """Wraps an expensive fixture shared by several cases' setups: build() runs the first time
+    one of them asks, so a fixture only -k filtered-out cases need is never built"""
+    built = []
+    def get():
+        if not built:
+            built.append(build())
+        return built[0]
+    return get
+
+def primitiveCases():
+    s3 = sudolib.s3
+    return [
+        Case('rowGen', call(lambda: list(sudolib.rowGen(3, 3))), number=20000),
+        Case('getRowVals', call(sudolib.getRowVals, s3, 3, 3), number=20000),
+        Case('getSqrVals', call(sudolib.getSqrVals, s3, 3, 3), number=20000),
+        Case('getPoss', call(sudolib.getPoss, s3, 3, 3), number=20000),
+        Case('uniqueCheck', call(sudolib.uniqueCheck, s3, 3, 3), number=5000),
+        Case('checkConsistent', call(sudolib.checkConsistent, sudolib.f1), number=5000),
+        Case('generateCache', call(sudolib.generateCache, s3), number=2000),
+    ]
+
+def workload(count, diff):
+    """count generated puzzles, the same ones for a given SEED on every machine and every run"""
+    return [puzzle for _, puzzle, _, _ in sudolib.iterPuzzles(count, diff=diff, workers=0, seed=SEED)]
+
+def cycle(func, boards):
+    """setup: each timed call runs func on the next board of a fixed workload (boards() builds it)"""
+    def setup():
+        it = itertools.cycle(boards())
+        return lambda: func(next(it))
+    return setup
+
+def solverCases():
+    cases = []
+    for name, content in CORPUS.items():
+        board = sudolib.unstringify(content)
+        cases.append(Case('solve/' + name, call(sudolib.solve, board), number=50))
+        cases.append(Case('countSolutions/' + name, call(sudolib.countSolutions, board), number=50))
+    boards = once(lambda: workload(50, 55))
+    cases.append(Case('solve/workload', cycle(sudolib.solve, boards), number=100))
+    cases.append(Case('countSolutions/workload', cycle(sudolib.countSolutions, boards), number=100))
+    return cases
+
+def generatorCases():
+    rng = random.Random(SEED)       # one stream across the timed calls, not a reseed per call
+    return [
+        Case('generate', call(sudolib.generate), number=50),
+        Case('generate/rng', call(sudolib.generate, rng), number=50),
+        Case('carve', call(sudolib.carve, sudolib.f1), number=20),
+        Case('carve/30', call(sudolib.carve, sudolib.f1, count=30), number=50),
+        Case('getPuzzle', call(sudolib.getPuzzle), number=20),
+    ]
+
+def storageCases():
+    puzzle = sudolib.unstringify(CORPUS['easy-s5'])
+    compact = sudolib.Board.fromRows(puzzle)
+    content = CORPUS['easy-s5']
+    return [
+        Case('normalize', call(sudolib.normalize, puzzle), number=200),
+        Case('canonicalKey', call(sudolib.canonicalKey, compact), number=200),
+        Case('shuffle', call(sudolib.shuffle, puzzle), number=5000),
+        Case('shuffle/Board', call(sudolib.shuffle, compact), number=5000),
+        Case('stringify', call(sudolib.stringify, puzzle), number=20000),
+        Case('unstringify', call(sudolib.unstringify, content), number=20000),
+        Case('Board.fromString', call(sudolib.Board.fromString, content), number=20000),
+        Case('Board.fromPacked', call(sudolib.Board.fromPacked, compact.toPacked()), number=20000),
+    ]
+
+def authCases():
+    data = {'board': sudolib.s5, 'bitmap': sudolib.getBitmap(sudolib.s5),
+            'gentime': 1652400000.0, 'puzzleid': 42}
+    signature = authen.getHMAC(data, authen.TESTKEY1)
+    signer = authen.Signer(authen.TESTKEY1, legacyUntil=math.inf)
+    token = signer.sign(data)
+    logging.getLogger('authen').setLevel(logging.ERROR)    # no log line per legacy verify
+    return [
+        Case('getHMAC', call(authen.getHMAC, data, authen.TESTKEY1), number=5000),
+        Case('checkHMAC', call(authen.checkHMAC, data, signature, authen.TESTKEY1), number=5000),
+        Case('Signer.sign', call(signer.sign, data), number=5000),
+        Case('Signer.verify', call(signer.verify, data, token), number=5000),
+        Case('Signer.verify/legacy', call(signer.verify, data, signature), number=5000),
+        Case('Signer.checkDigest', call(signer.checkDigest, sudolib.f1, signer.digest(sudolib.f1)),
+             number=5000),
+    ]
+
+def highscoreCases():
+    import highscore
+
+    def recordSetup(store):
+        # a warm board: the top-k is full, so most solves get turned away from the cache
+        def setup():
+            rng = random.Random(SEED)
+            scores = highscore.HighScores(store())
+            solves = [(rng.randrange(100), 'two', rng.lognormvariate(5.5, 0.6), 'bench') for _ in range(5000)]
+            for solve in solves:
+                scores.record(*solve)
+            it = itertools.cycle(solves)
+            return lambda: scores.record(*next(it))
+        return setup
+
+    return [
+        Case('highscore/memory', recordSetup(highscore.MemoryStore), number=20000),
+        Case('highscore/sqlite', recordSetup(lambda: highscore.SQLiteStore(':memory:')), number=20000),
+    ]
+
+def lambdaCases(tmp):
+    """Both handlers, against a local S3 stand-in holding a freshly generated puzzle file"""
+
+    @once
+    def handlers():
+        # the puzzle file and the handler imports, for whichever of these cases runs first
+        import puzzledb
+
+        root = os.path.join(tmp, 's3')
+        os.makedirs(os.path.join(root, 'pseudoku-puzzle'))
+        db = puzzledb.openDB(os.path.join(root, 'pseudoku-puzzle', 'pseudoku.sqlite'))
+        rows = []
+        for carved in range(30, 60):
+            puzzle = sudolib.getPuzzle(diff=carved)
+            rows.append((sudolib.stringify(sudolib.normalize(puzzle)), sudolib.countZeros(puzzle)))
+        puzzledb.insertPuzzles(db, rows)
+        db.close()
+
+        os.environ['PSEUDOKU_LOCAL_S3'] = root
+        os.environ['PSEUDOKU_DB_PATH'] = os.path.join(tmp, 'my-db')
+        import getpuzzle
+        import metrics
+        import submitpuzzle
+
+        metrics.OUT = open(os.devnull, 'w')     # still built and written, just not onto our table
+        return getpuzzle, submitpuzzle, metrics
+
+    def getpuzzleSetup(proxy, query=None, metricsOn=True):
+        def setup():
+            getpuzzle, _, metrics = handlers()
+            event = {'pathParameters': {'proxy': proxy}}
+            if query:
+                event['queryStringParameters'] = query
+            if metricsOn:
+                return lambda: getpuzzle.lambda_handler(event, None)
+
+            def run():
+                metrics.ENABLED = False
+                try:
+                    return getpuzzle.lambda_handler(event, None)
+                finally:
+                    metrics.ENABLED = True
+            return run
+        return setup
+
+    def fetchTwo():
+        getpuzzle, submitpuzzle, _ = handlers()
+        body = json.loads(getpuzzle.lambda_handler({'pathParameters': {'proxy': 'two'}}, None)['body'])
+        return getpuzzle, submitpuzzle, body
+
+    def submitSetup():
+        # a real round trip: fetch a puzzle, then submit its solution
+        _, submitpuzzle, body = fetchTwo()
+        event = dict(body, submission=sudolib.solve(body['data']['board']))
+        return lambda: submitpuzzle.lambda_handler(event, None)
+
+    def legacySetup():
+        # same, but a token from before solution digests, which takes the full check
+        getpuzzle, submitpuzzle, body = fetchTwo()
+        data = dict(body['data'])
+        del data['solution']
+        event = {'data': data, 'hmac': getpuzzle.signer.sign(data),
+                 'submission': sudolib.solve(data['board'])}
+        return lambda: submitpuzzle.lambda_handler(event, None)
+
+    return [
+        Case('getpuzzle/difficulty', getpuzzleSetup('two'), number=2000),
+        Case('getpuzzle/nometrics', getpuzzleSetup('two', metricsOn=False), number=2000),
+        Case('getpuzzle/id', getpuzzleSetup('1'), number=2000),
+        Case('getpuzzle/compact', getpuzzleSetup('two', {'format': 'compact'}), number=2000),
+        Case('getpuzzle/batch5', getpuzzleSetup('two', {'n': '5', 'format': 'compact'}), number=1000),
+        Case('submitpuzzle', submitSetup, number=2000),
+        Case('submitpuzzle/legacy', legacySetup, number=2000),
+    ]
+
+
+#---------------REPORTING--------------------#
+
+def compare(results, baseline, threshold):
+    """Returns (regressions, missing): list of (name, baseline p50, now p50) for cases slower
+    than baseline by > threshold, and names of cases the baseline has no numbers for (so
+    nothing is gating them)"""
+    regressions, missing = [], []
+    for name, stats in results.items():
+        old = baseline.get('results', {}).get(name)
+        if not old:
+            missing.append(name)
+        elif stats['p50'] > old['p50'] * (1 + threshold):
+            regressions.append((name, old['p50'], stats['p50']))
+    return regressions, missing
+
+def main():
+    global SEED
+    parser = argparse.ArgumentParser(description='pseudoku benchmarks')
+    parser.add_argument('-k', dest='filters', action='append', default=[],
+                        help='only run cases whose name contains this (repeatable)')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply iteration counts')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--baseline', help='compare against this results file')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed p50 slowdown vs baseline (0.25 = 25%%)')
+    parser.add_argument('--save-baseline', action='store_true', help='write results to ' + BASELINE)
+    parser.add_argument('--seed', type=int, default=SEED, help='seed for every workload')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='run the suite this many times and keep each case\'s median-p50 run')
+    args = parser.parse_args()
+    SEED = args.seed
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # building cases is cheap: shared fixtures (the solver workload, the handlers' puzzle
+        # file) are once()s, built by the first selected case that needs them
+        cases = (primitiveCases() + solverCases() + generatorCases() + storageCases()
+                 + authCases() + highscoreCases() + lambdaCases(tmp))
+        if args.filters:
+            cases = [c for c in cases if any(f in c.name for f in args.filters)]
+
+        # the machine's speed drifts by tens of percent over seconds, so repeats go round the
+        # whole suite rather than running one case several times back to back
+        runs = {case.name: [] for case in cases}
+        results = {}
+        print('{:<28} {:>7} {:>11} {:>11} {:>11} {:>11}'.format('case', 'n', 'mean us', 'p50 us',
+                                                               'p90 us', 'p99 us'))
+        for repeat in range(max(1, args.repeat)):
+            last = repeat == max(1, args.repeat) - 1
+            for case in cases:
+                runs[case.name].append(case.run(scale=args.scale))
+                if not last:
+                    continue
+                stats = results[case.name] = median(runs[case.name])
+                print('{:<28} {n:>7} {mean:>11.1f} {p50:>11.1f} {p90:>11.1f} {p99:>11.1f}'.format(
+                    case.name, **stats))
+
+    out = {
+        'seed': SEED,
+        'repeat': max(1, args.repeat),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(out, f, indent=2)
+    if args.save_baseline:
+        with open(BASELINE, 'w') as f:
+            json.dump(out, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions, missing = compare(results, json.load(f), args.threshold)
+        for name, old, new in regressions:
+            print('REGRESSION {}: p50 {:.1f}us -> {:.1f}us ({:+.0f}%)'.format(
+                name, old, new, (new / old - 1) * 100))
+        for name in missing:
+            print('NOT IN BASELINE {}: rerun with --save-baseline to start gating it'.format(name))
+        if regressions or missing:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
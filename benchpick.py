@@ -0,0 +1,88 @@
+# benchpick.py
+# compares random-puzzle selection latency: the old ORDER BY random() queries in
+# getpuzzle.DIFFICULTY_MAP vs puzzledb.pickRandom() over the (pz_difficulty, pz_seq) index.
+# Builds throwaway puzzle files of each size (rows reuse one real puzzle string, since only
+# the row count and pz_carved_cells matter for the query plan). Each row already has a distinct
+# pz_canon_key and a pz_solution, so migrate() only numbers pz_seq--it doesn't canonicalize,
+# solve, or dedupe the copies down to one row.
+#
+#   python benchpick.py                         10k, 100k and 1M rows
+#   python benchpick.py --sizes 10000 --queries 500
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+import puzzledb
+import sudolib
+
+
+OLD_QUERIES = {
+    'one':   'SELECT pz_id, pz_content FROM puzzle WHERE pz_carved_cells < 40 ORDER BY random() LIMIT 1',
+    'two':   'SELECT pz_id, pz_content FROM puzzle WHERE pz_carved_cells BETWEEN 40 AND 47 ORDER BY random() LIMIT 1',
+    'three': 'SELECT pz_id, pz_content FROM puzzle WHERE pz_carved_cells BETWEEN 47 AND 54 ORDER BY random() LIMIT 1',
+    'four':  'SELECT pz_id, pz_content FROM puzzle WHERE pz_carved_cells > 54 ORDER BY random() LIMIT 1',
+}
+
+
+def buildDB(path, rows):
+    """Puzzle file without pz_difficulty/pz_seq, with rows puzzles. The row number stands in
+    for pz_canon_key, so none of the copies count as duplicates"""
+    content = sudolib.stringify(sudolib.s3)
+    solution = puzzledb.encodeLike(sudolib.solveExact(puzzledb.decodeBoard(content)), content)
+    db = sqlite3.connect(path)
+    db.execute('CREATE TABLE puzzle (pz_id INTEGER PRIMARY KEY, pz_content TEXT NOT NULL, \
+                pz_carved_cells INTEGER NOT NULL, pz_canon_key INTEGER, pz_solution TEXT)')
+    with db:
+        db.executemany('INSERT INTO puzzle (pz_content, pz_carved_cells, pz_canon_key, pz_solution) \
+                        VALUES (?, ?, ?, ?)',
+                       ((content, random.randint(30, 60), key, solution) for key in range(rows)))
+    return db
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda p: samples[min(len(samples) - 1, int(p * len(samples)))]
+    return pick(0.50) * 1000, pick(0.99) * 1000
+
+def timeQueries(query, count):
+    samples = []
+    for _ in range(count):
+        difficulty = random.choice(puzzledb.DIFFICULTIES)
+        start = time.perf_counter()
+        row = query(difficulty)
+        samples.append(time.perf_counter() - start)
+        assert row is not None
+    return percentiles(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark random puzzle selection')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--queries', type=int, default=200, help='picks timed per method')
+    parser.add_argument('--old-queries', type=int, default=40,
+                        help='picks timed for ORDER BY random() (slow on big files)')
+    args = parser.parse_args()
+    random.seed(0)
+
+    print('{:>9}  {:>22}  {:>22}  {:>8}'.format('rows', 'ORDER BY random() p50/p99',
+                                                'indexed pick p50/p99', 'migrate'))
+    for rows in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db = buildDB(os.path.join(tmp, 'bench.sqlite'), rows)
+            old = timeQueries(lambda d: db.execute(OLD_QUERIES[d]).fetchone(), args.old_queries)
+
+            start = time.perf_counter()
+            puzzledb.migrate(db)
+            migrateTime = time.perf_counter() - start
+            counts = puzzledb.loadCounts(db)
+            new = timeQueries(lambda d: puzzledb.pickRandom(db, d, counts), args.queries)
+            db.close()
+
+        print('{:>9}  {:>10.3f} / {:<9.3f}ms  {:>10.3f} / {:<9.3f}ms  {:>7.1f}s'.format(
+            rows, old[0], old[1], new[0], new[1], migrateTime))
+
+
+if __name__ == '__main__':
+    main()
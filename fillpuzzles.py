@@ -0,0 +1,147 @@
+# fillpuzzles.py
+# offline script that generates puzzles in bulk and writes them into the sqlite file
+# that getpuzzle.py serves from. Run locally, then upload the .sqlite file to S3.
+#
+#   python fillpuzzles.py pseudoku.sqlite --count 10000
+#   python fillpuzzles.py pseudoku.sqlite --count 500 --difficulty four --workers 8
+#   python fillpuzzles.py pseudoku.sqlite --count 100 --seed 7      same puzzles every run
+
+import argparse
+import multiprocessing
+import random
+import sys
+import time
+
+import grader
+import puzzledb
+import sudolib
+
+
+# carved cell ranges to carve within for each difficulty. Each row is filed under the
+# difficulty of its grade (see grader.py), not its clue count, so these overlap: they just keep
+# the carve near where puzzles of that grade usually turn up
+BUCKETS = {
+    'one':   (30, 39),
+    'two':   (40, 54),
+    'three': (44, 60),
+    'four':  (48, 64),
+}
+
+
+def makePuzzle(job):
+    """Worker: job is (difficulty, seed). Builds one puzzle for the difficulty, with its own rng
+    (seeded from os.urandom if seed is None). Carving stops as soon as the puzzle grades into
+    the difficulty, so easy puzzles are cheap. Returns (canonical string, carved cells,
+    canonical key, grade, grade steps, solution string), or None if the puzzle missed the
+    bucket or the grade."""
+    difficulty, seed = job
+    rng = random.Random(seed)
+    low, high = BUCKETS[difficulty]
+    grades = {g for g, d in enumerate(puzzledb.GRADE_DIFFICULTIES) if d == difficulty}
+    puzzle = grader.carveToGrade(sudolib.generate(rng), grades, count=high, minimum=low, rng=rng)
+    carved = sudolib.countZeros(puzzle)
+    if carved < low or carved > high:
+        return None
+
+    canon, key = sudolib.canonicalKey(puzzle)
+    board = sudolib.Board.fromString(canon)
+    level, steps = grader.grade(board)
+    if level not in grades:
+        return None
+    # solved again rather than reusing the full board, which isn't in canonical orientation
+    return canon, carved, key, level, steps, sudolib.solveExact(board).toString()
+
+def fill(db, difficulty, count, pool, batch=500, existing=None, seed=None, maxRejects=50):
+    """Generates count new puzzles for one difficulty and inserts them in batches. Returns number
+    inserted. With a seed, every job gets seed/difficulty/job number as its own seed and results
+    are taken in job order, so the same file + seed always inserts the same puzzles. Gives up
+    (with a message naming the bucket) once maxRejects * count jobs have been rejected or turned
+    out to be duplicates, so a bucket that can't make its grades doesn't spin forever."""
+    if existing is None:
+        existing = loadKeys(db)
+
+    inserted, dupes, rejects = 0, 0, 0
+    pending = []
+    start = time.perf_counter()
+    jobs = 0
+
+    while inserted + len(pending) < count:
+        if rejects + dupes >= maxRejects * count:
+            low, high = BUCKETS[difficulty]
+            print('{:>6}: giving up after {} rejected and {} dupes: carving {}-{} cells isn\'t '
+                  'making {} puzzles'.format(difficulty, rejects, dupes, low, high, difficulty))
+            break
+        needed = count - inserted - len(pending)
+        batchJobs = [(difficulty, None if seed is None else '{}/{}/{}'.format(seed, difficulty, k))
+                     for k in range(jobs, jobs + needed)]
+        jobs += needed
+        for result in pool.imap(makePuzzle, batchJobs, chunksize=16):
+            if result is None:
+                rejects += 1
+                continue
+            if result[2] in existing:
+                dupes += 1
+                continue
+            existing.add(result[2])
+            pending.append(result)
+
+            if len(pending) >= batch:
+                inserted += insertBatch(db, pending)
+                pending = []
+                report(difficulty, inserted, count, start)
+
+    if pending:
+        inserted += insertBatch(db, pending)
+        report(difficulty, inserted, count, start)
+    print('    {} dupes, {} rejected'.format(dupes, rejects))
+    return inserted
+
+def loadKeys(db):
+    """canonical keys already in the file. Equivalent puzzles share a key, not just equal strings"""
+    return set(row[0] for row in db.execute('SELECT pz_canon_key FROM puzzle'))
+
+def insertBatch(db, rows):
+    return puzzledb.insertPuzzles(db, rows)     # one transaction per batch
+
+def report(difficulty, done, count, start):
+    elapsed = time.perf_counter() - start
+    rate = done / elapsed if elapsed else 0.0
+    print('{:>6}: {:>8}/{:<8} {:10.1f} puzzles/sec'.format(difficulty, done, count, rate))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk-generate puzzles into a pseudoku sqlite file')
+    parser.add_argument('db', help='path to sqlite file (created if missing)')
+    parser.add_argument('--count', type=int, default=1000, help='puzzles to add per difficulty')
+    parser.add_argument('--difficulty', choices=list(BUCKETS), action='append',
+                        help='only fill this difficulty (repeatable). Default is all of them')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--batch', type=int, default=500, help='rows per insert transaction')
+    parser.add_argument('--seed', help='make a reproducible set of puzzles')
+    parser.add_argument('--max-rejects', type=int, default=50,
+                        help='give up on a difficulty after this many rejects/dupes per puzzle asked for')
+    args = parser.parse_args()
+
+    db = puzzledb.openDB(args.db)
+    existing = loadKeys(db)
+
+    start = time.perf_counter()
+    total = 0
+    short = []
+    with multiprocessing.Pool(args.workers) as pool:
+        for difficulty in args.difficulty or list(BUCKETS):
+            inserted = fill(db, difficulty, args.count, pool, batch=args.batch, existing=existing,
+                            seed=args.seed, maxRejects=args.max_rejects)
+            total += inserted
+            if inserted < args.count:
+                short.append('{} ({}/{})'.format(difficulty, inserted, args.count))
+
+    elapsed = time.perf_counter() - start
+    print('inserted {} puzzles in {:.1f}s ({:.1f} puzzles/sec)'.format(total, elapsed, total / elapsed))
+    db.close()
+    if short:
+        sys.exit('gave up on: ' + ', '.join(short))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,16 @@
 import json
-import sqlite3
-import boto3
+import os
 import time
 
 import authen
+import metrics
+import puzzledb
+import puzzlepool
 import sudolib
 
 BUCKET = 'pseudoku-puzzle'
 OBJECT = 'pseudoku.sqlite'
+# fallback for puzzle files that haven't been through puzzledb.migrate() yet
 DIFFICULTY_MAP = {
 	'one':'SELECT pz_id, pz_content FROM puzzle WHERE pz_carved_cells < 40 \
 		   ORDER BY random() LIMIT 1;',
@@ -19,61 +22,235 @@ DIFFICULTY_MAP = {
 			ORDER BY random() LIMIT 1;'
 }
 
+# How we get the .sqlite file on cold start (PSEUDOKU_DB_MODE):
+#   'cached'   - HEAD the S3 object, and reuse the /tmp copy or the bundled copy if its recorded
+#                ETag matches. Only download if neither does. (default)
+#   'bundled'  - use the copy shipped in the deployment package, no S3 calls at all. A package
+#                without one is a broken deploy, so that raises rather than going to S3
+#   'download' - always download (the old behaviour)
+# PSEUDOKU_DB_LAZY=1 defers all of this until the first request instead of module init.
+DB_MODE = os.environ.get('PSEUDOKU_DB_MODE', 'cached')
+DB_LAZY = bool(os.environ.get('PSEUDOKU_DB_LAZY'))
+download_path = os.environ.get('PSEUDOKU_DB_PATH', '/tmp/my-db')
+POOL_SIZE = int(os.environ.get('PSEUDOKU_POOL_SIZE', 32))	# puzzles kept per difficulty, 0 disables
+POOL_MAX_AGE = float(os.environ.get('PSEUDOKU_POOL_MAX_AGE', 600))
+bundled_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), OBJECT)
+signer = authen.Signer(authen.TESTKEY1)		# keyed once per container
 
-# download .sqlite file from S3
-download_path = '/tmp/my-db'
-s3 = boto3.client('s3')
-s3.download_file(BUCKET, OBJECT, download_path)
+# Response formats. The default is the original nested 9x9 lists. Clients that ask for compact
+# (?format=compact, or this in their Accept header) get board and bitmap as 81-char digit
+# strings instead, in a body about a third of the size.
+COMPACT_TYPE = 'application/vnd.pseudoku.compact+json'
+# ?n=5 returns {'puzzles': [...]}, up to this many, each shaped like a single response body
+MAX_BATCH = int(os.environ.get('PSEUDOKU_MAX_BATCH', 10))
 
-# load sqlite file into DB object
-db = sqlite3.connect(
-	download_path,
-	detect_types=sqlite3.PARSE_DECLTYPES,
-)
-db.row_factory = sqlite3.Row
 
+def getS3():
+	"""Creates the S3 client on first use, so the bundled mode never pays for it.
+	PSEUDOKU_LOCAL_S3 points at a directory standing in for S3 (see locals3.py), and
+	PSEUDOKU_LOCAL_S3_LATENCY (seconds per call) / _BANDWIDTH (bytes/sec) slow it down to taste"""
+	global s3
+	if s3 is None:
+		if os.environ.get('PSEUDOKU_LOCAL_S3'):
+			import locals3
+			bandwidth = os.environ.get('PSEUDOKU_LOCAL_S3_BANDWIDTH')
+			s3 = locals3.LocalS3(os.environ['PSEUDOKU_LOCAL_S3'],
+								 latency=float(os.environ.get('PSEUDOKU_LOCAL_S3_LATENCY', 0)),
+								 bandwidth=float(bandwidth) if bandwidth else None)
+		else:
+			import boto3
+			s3 = boto3.client('s3')
+	return s3
 
+def readETag(path):
+	"""ETag recorded next to a local copy of the DB, or None"""
+	try:
+		with open(path + '.etag') as f:
+			return f.read().strip()
+	except OSError:
+		return None
 
+def fetchDB():
+	"""Returns path of a local copy of the DB that's current with S3, downloading only if we have to"""
+	if DB_MODE == 'bundled':
+		if not os.path.exists(bundled_path):
+			raise FileNotFoundError('PSEUDOKU_DB_MODE=bundled, but there is no ' + bundled_path)
+		return bundled_path
 
+	etag = None
+	if DB_MODE != 'download':
+		etag = getS3().head_object(Bucket=BUCKET, Key=OBJECT)['ETag']
+		if os.path.exists(download_path) and readETag(download_path) == etag:
+			return download_path
+		if os.path.exists(bundled_path) and readETag(bundled_path) == etag:
+			return bundled_path
+
+	# whatever a recorded ETag described is about to be overwritten. 'download' mode doesn't
+	# know the new one, so it mustn't leave the old one around for a later 'cached' run to trust
+	if os.path.exists(download_path + '.etag'):
+		os.remove(download_path + '.etag')
+	getS3().download_file(BUCKET, OBJECT, download_path)
+	if etag:
+		with open(download_path + '.etag', 'w') as f:
+			f.write(etag)
+	return download_path
+
+def getDB(timer=metrics.NULL):
+	"""Opens the DB on first use. Later calls reuse the connection"""
+	global db, counts, select, pool
+	if db is None:
+		path = fetchDB()
+		timer.mark('s3')
+		db = puzzledb.openReadOnly(path)		# immutable, mmapped, tuple rows
+		counts = puzzledb.loadCounts(db)
+		select = puzzledb.pickColumns(db)
+		if POOL_SIZE:
+			pool = puzzlepool.PuzzlePool(db, counts, size=POOL_SIZE, maxAge=POOL_MAX_AGE,
+										 select=select)
+		timer.mark('open')
+	return db
 
-def lambda_handler(event, context):
-	
-	# pull puzzleid from path parameter. getpuzzle/puzzleid
-	puzzleid = event['pathParameters']['proxy'] 
 
+s3 = None
+db = None
+counts = None		# puzzles per difficulty, for puzzledb.pickRandom()
+select = puzzledb.PICK_COLUMNS		# plus pz_solution, if the file has it
+pool = None
+initTimer = metrics.timer('getpuzzle')		# reported with the first request, see metrics.py
+if not DB_LAZY:
+	getDB(initTimer)
 
-	# generic difficulty
+
+def wantsCompact(event):
+	"""True if the request opted in to the compact format"""
+	params = event.get('queryStringParameters') or {}
+	if params.get('format') == 'compact':
+		return True
+	for name, value in (event.get('headers') or {}).items():
+		if name.lower() == 'accept' and COMPACT_TYPE in value:
+			return True
+	return False
+
+def batchSize(event):
+	"""?n=5 asks for a batch of puzzles. Clamped to 1..MAX_BATCH, and 1 if it isn't a number"""
+	params = event.get('queryStringParameters') or {}
+	try:
+		n = int(params.get('n', 1))
+	except ValueError:
+		return 1
+	return max(1, min(n, MAX_BATCH))
+
+def pickPuzzles(puzzleid, n=1, timer=metrics.NULL):
+	"""Returns list of (pz_id, Board, solution Board or None). A difficulty gives up to n
+	different puzzles, from one query (or straight from the pool). A specific id gives just
+	that puzzle. Empty if there's nothing to give."""
+
+	# generic difficulty. Once grader.py has been run over the file, pz_difficulty (and so the
+	# pool / pickRandom) follows the technique grade rather than the carved cell count
 	if puzzleid in DIFFICULTY_MAP: 
-		query_result = db.execute(DIFFICULTY_MAP[puzzleid]).fetchone()
+		getDB(timer)
+		if pool:
+			puzzles = pool.popMany(puzzleid, n)
+			timer.mark('query')			# (a refill decodes in here too)
+			return puzzles
+		if n > 1:
+			rows = puzzledb.pickRandomMany(db, puzzleid, counts, n, select)
+		elif counts:
+			rows = [puzzledb.pickRandom(db, puzzleid, counts, select)]
+		else:
+			rows = [db.execute(DIFFICULTY_MAP[puzzleid]).fetchone()]
 
 	# specific puzzle id
 	else:
-		query_result = db.execute(
-			'SELECT pz_id, pz_content FROM puzzle WHERE pz_id = ?',
-			(puzzleid)
-		).fetchone()
+		rows = [getDB(timer).execute(
+			'SELECT {} FROM puzzle WHERE pz_id = ?'.format(select),
+			(puzzleid,)
+		).fetchone()]
 
+	timer.mark('query')
+	puzzles = [puzzledb.decodeRow(row) for row in rows if row is not None]
+	timer.mark('decode')
+	return puzzles
 
-	# generate puzzle data, put in dict --> JSON
-	puzzleid = query_result['pz_id']
-	puzzleString = query_result['pz_content']
-	board = sudolib.shuffle(sudolib.unstringify(puzzleString))
+def signPuzzle(puzzleid, board, solution=None, compact=False, difficulty=None, timer=metrics.NULL):
+	"""shuffles one puzzle and returns its signed {'data', 'hmac'} dict. With the solution, the
+	data also carries a digest of the solution shuffled the same way, so submitpuzzle can check
+	a submission with one comparison. difficulty (if the puzzle was picked by one) is signed
+	too, for the difficulty leaderboard"""
+	transform = sudolib.randomTransform()
+	if solution is None:
+		board = sudolib.applyTransform(board, transform)
+	else:
+		board, solution = sudolib.applyTransformMany((board, solution), transform)
+	timer.mark('shuffle')
 	bitmap = sudolib.getBitmap(board)
+	timer.mark('bitmap')
 	gentime = time.time()
 	outdata = {
-			"board": board,
-			"bitmap": bitmap,
+			"board": board.toDigits() if compact else board.toRows(),
+			"bitmap": bitmap.toDigits() if compact else bitmap.toRows(),
 			"gentime": gentime,
 			"puzzleid": puzzleid,
 	}
-	hmac = authen.getHMAC(outdata, authen.TESTKEY1)
-
-	return {
-		"isBase64Encoded": True,
-		"statusCode": 200,
-		"headers": {
-			"Access-Control-Allow-Origin" : "*"
-		},
-		"body": json.dumps({'data': outdata,
-							'hmac': hmac})
-	}
+	if solution is not None:
+		outdata["solution"] = signer.digest(solution.toDigits())
+	if difficulty is not None:
+		outdata["difficulty"] = difficulty
+	signed = {'data': outdata, 'hmac': signer.sign(outdata)}
+	timer.mark('hmac')
+	return signed
+
+def lambda_handler(event, context):
+	global initTimer
+	timer = metrics.timer('getpuzzle', init=initTimer)
+	initTimer = None
+	
+	# pull puzzleid from path parameter. getpuzzle/puzzleid
+	puzzleid = event['pathParameters']['proxy'] 
+	compact = wantsCompact(event)
+	n = batchSize(event)
+	timer.set('n', n)
+	timer.set('compact', compact)
+
+	# generate puzzle data, put in dict --> JSON. Each puzzle in a batch is shuffled and
+	# signed on its own, so it can be submitted on its own
+	difficulty = puzzleid if puzzleid in DIFFICULTY_MAP else None
+	puzzles = [signPuzzle(pz_id, board, solution, compact, difficulty, timer)
+			   for pz_id, board, solution in pickPuzzles(puzzleid, n, timer)]
+	if not puzzles:
+		timer.emit()
+		return {
+			"statusCode": 404,
+			"headers": {
+				"Access-Control-Allow-Origin" : "*"
+			},
+			"body": json.dumps({'message': 'no such puzzle'})
+		}
+	if n > 1:
+		body = {'puzzles': puzzles}
+	else:
+		body = puzzles[0]
+
+	if compact:
+		response = {
+			"isBase64Encoded": False,
+			"statusCode": 200,
+			"headers": {
+				"Access-Control-Allow-Origin" : "*",
+				"Content-Type": COMPACT_TYPE,
+				"Vary": "Accept",
+			},
+			"body": json.dumps(body, separators=(',', ':'))
+		}
+	else:
+		response = {
+			"isBase64Encoded": True,
+			"statusCode": 200,
+			"headers": {
+				"Access-Control-Allow-Origin" : "*"
+			},
+			"body": json.dumps(body)
+		}
+	timer.mark('json')
+	timer.emit()
+	return response
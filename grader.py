@@ -0,0 +1,257 @@
+# grader.py
+# human-style difficulty grading. Solves a puzzle the way a person would--always with the
+# easiest technique that still makes progress--and records the hardest technique it needed
+# plus how many steps it took. Clue count alone is a poor guess at how hard a puzzle feels.
+#
+#   python grader.py pseudoku.sqlite                grades every ungraded row, in parallel
+#   python grader.py pseudoku.sqlite --regrade      grades every row again
+
+import argparse
+import itertools
+import multiprocessing
+import time
+
+import puzzledb
+import sudolib
+from sudolib import ALL_DIGITS, CELL_COL, CELL_ROW, MASK_COUNT, MASK_DIGITS, PEERS, UNITS
+
+
+# techniques, easiest first. A puzzle's grade is the index of the hardest one it needed.
+# GUESS means none of them got anywhere and a person would have to guess (or use something
+# fancier than we check for)
+TECHNIQUES = ('naked single', 'hidden single', 'pointing', 'naked pair', 'hidden pair',
+              'naked triple', 'x-wing', 'guess')
+NAKED_SINGLE, HIDDEN_SINGLE, POINTING, NAKED_PAIR, HIDDEN_PAIR, NAKED_TRIPLE, X_WING, GUESS = \
+    range(len(TECHNIQUES))
+
+ROWS, COLS, SQRS = UNITS[:9], UNITS[9:18], UNITS[18:]
+# for each sqr, the three (sqr cells in line, rest of line) pairs for its rows, then its cols
+SQR_LINES = tuple(
+    tuple((tuple(i for i in sqr if CELL_ROW[i] == r), tuple(i for i in ROWS[r] if i not in sqr))
+          for r in sorted({CELL_ROW[i] for i in sqr}))
+    + tuple((tuple(i for i in sqr if CELL_COL[i] == c), tuple(i for i in COLS[c] if i not in sqr))
+            for c in sorted({CELL_COL[i] for i in sqr}))
+    for sqr in SQRS)
+
+
+class Grader:
+    """Candidate grid for one puzzle. Unlike sudolib.MaskBoard the candidates are stored per
+    cell, since pairs, pointing and x-wings remove candidates that no placed value explains."""
+
+    def __init__(self, board):
+        self.values = list(sudolib.flatten(board))
+        self.cands = [0] * 81
+        for i, value in enumerate(self.values):
+            if not value:
+                used = 0
+                for j in PEERS[i]:
+                    used |= 1 << self.values[j]
+                self.cands[i] = ALL_DIGITS & ~used
+
+    def place(self, i, value):
+        bit = ~(1 << value)
+        self.values[i] = value
+        self.cands[i] = 0
+        for j in PEERS[i]:
+            self.cands[j] &= bit
+
+    def eliminate(self, cells, mask):
+        """Removes mask from the candidates of cells. Returns True if anything changed"""
+        cands = self.cands
+        changed = False
+        for i in cells:
+            if cands[i] & mask:
+                cands[i] &= ~mask
+                changed = True
+        return changed
+
+    # each technique makes one deduction and returns True, or returns False if it can't
+
+    def nakedSingle(self):
+        for i, cand in enumerate(self.cands):
+            if MASK_COUNT[cand] == 1:
+                self.place(i, MASK_DIGITS[cand][0])
+                return True
+        return False
+
+    def hiddenSingle(self):
+        cands = self.cands
+        for unit in UNITS:
+            once = twice = 0
+            for i in unit:
+                twice |= once & cands[i]
+                once |= cands[i]
+            single = once & ~twice
+            if single:
+                value = MASK_DIGITS[single][0]
+                for i in unit:
+                    if cands[i] >> value & 1:
+                        self.place(i, value)
+                        return True
+        return False
+
+    def pointing(self):
+        """locked candidates: a digit confined to one line within a sqr (pointing), or to one sqr
+        within a line (claiming)"""
+        cands = self.cands
+        for lines in SQR_LINES:
+            for group in (lines[:3], lines[3:]):
+                masks = []
+                for inside, outside in group:
+                    inMask = outMask = 0
+                    for i in inside:
+                        inMask |= cands[i]
+                    for i in outside:
+                        outMask |= cands[i]
+                    masks.append((inMask, outMask))
+
+                for k, (inMask, outMask) in enumerate(masks):
+                    rest = 0
+                    for j in range(3):
+                        if j != k:
+                            rest |= masks[j][0]
+                    pointed = inMask & outMask & ~rest      # only on this line in the sqr
+                    claimed = inMask & rest & ~outMask      # only in this sqr on the line
+                    if pointed and self.eliminate(group[k][1], pointed):
+                        return True
+                    if claimed:
+                        others = [i for j in range(3) if j != k for i in group[j][0]]
+                        if self.eliminate(others, claimed):
+                            return True
+        return False
+
+    def nakedSubset(self, size):
+        """size cells in a unit whose candidates fit in size digits--those digits go elsewhere"""
+        cands = self.cands
+        for unit in UNITS:
+            loose = [i for i in unit if 2 <= MASK_COUNT[cands[i]] <= size]
+            for cells in itertools.combinations(loose, size):
+                mask = 0
+                for i in cells:
+                    mask |= cands[i]
+                if MASK_COUNT[mask] == size:
+                    if self.eliminate([i for i in unit if i not in cells], mask):
+                        return True
+        return False
+
+    def hiddenPair(self):
+        """two digits that only fit in the same two cells of a unit--those cells take nothing else"""
+        cands = self.cands
+        for unit in UNITS:
+            where = {}
+            for value in range(1, 10):
+                cells = tuple(i for i in unit if cands[i] >> value & 1)
+                if len(cells) == 2:
+                    where.setdefault(cells, []).append(value)
+            for cells, values in where.items():
+                if len(values) == 2:
+                    mask = 1 << values[0] | 1 << values[1]
+                    if self.eliminate(cells, ALL_DIGITS & ~mask):
+                        return True
+        return False
+
+    def xWing(self):
+        cands = self.cands
+        for lines, crossLines, crossOf in ((ROWS, COLS, CELL_COL), (COLS, ROWS, CELL_ROW)):
+            for value in range(1, 10):
+                bit = 1 << value
+                pairs = {}
+                for line in lines:
+                    cells = [i for i in line if cands[i] & bit]
+                    if len(cells) == 2:
+                        cross = (crossOf[cells[0]], crossOf[cells[1]])
+                        pairs.setdefault(cross, []).append(set(cells))
+                for cross, found in pairs.items():
+                    if len(found) >= 2:
+                        keep = found[0] | found[1]
+                        others = [i for c in cross for i in crossLines[c] if i not in keep]
+                        if self.eliminate(others, bit):
+                            return True
+        return False
+
+    def solve(self):
+        """Runs the techniques until solved or stuck. Returns (grade, steps)"""
+        techniques = ((NAKED_SINGLE, self.nakedSingle),
+                      (HIDDEN_SINGLE, self.hiddenSingle),
+                      (POINTING, self.pointing),
+                      (NAKED_PAIR, lambda: self.nakedSubset(2)),
+                      (HIDDEN_PAIR, self.hiddenPair),
+                      (NAKED_TRIPLE, lambda: self.nakedSubset(3)),
+                      (X_WING, self.xWing))
+        hardest, steps = NAKED_SINGLE, 0
+        while 0 in self.values:
+            for level, technique in techniques:
+                if technique():
+                    hardest = max(hardest, level)
+                    steps += 1
+                    break
+            else:
+                return GUESS, steps
+        return hardest, steps
+
+
+def grade(board):
+    """Returns (grade, steps) for a puzzle. grade indexes TECHNIQUES"""
+    return Grader(board).solve()
+
+def carveToGrade(board, grades, count=64, minimum=0, rng=None):
+    """Carves a full board until its grade is one of grades (checked once at least minimum
+    cells are out), or until count cells are out. Returns the puzzle--check its grade, since
+    not every board can reach every grade."""
+    return sudolib.carve(board, count=count, rng=rng,
+                         until=lambda puzzle, removes: removes >= minimum and grade(puzzle)[0] in grades)
+
+def gradeRow(row):
+    """Worker: (pz_id, pz_content) -> (grade, steps, pz_id), ready for the UPDATE"""
+    pz_id, content = row
+    return grade(puzzledb.decodeBoard(content)) + (pz_id,)
+
+def gradeTable(db, workers=None, regrade=False, batch=2000):
+    """Grades the puzzle table in parallel, writes pz_grade/pz_grade_steps, then renumbers so
+    difficulties follow the grades. Returns number of rows graded."""
+    puzzledb.migrate(db)
+    where = '' if regrade else ' WHERE pz_grade IS NULL'
+    rows = db.execute('SELECT pz_id, pz_content FROM puzzle' + where).fetchall()
+
+    done = 0
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers) as pool:
+        pending = []
+        for result in pool.imap_unordered(gradeRow, rows, chunksize=64):
+            pending.append(result)
+            if len(pending) >= batch:
+                done += saveGrades(db, pending)
+                pending = []
+                print('{:>8}/{:<8} {:8.1f} puzzles/sec'.format(done, len(rows),
+                                                              done / (time.perf_counter() - start)))
+        done += saveGrades(db, pending)
+
+    puzzledb.migrate(db)
+    return done
+
+def saveGrades(db, results):
+    with db:
+        db.executemany('UPDATE puzzle SET pz_grade = ?, pz_grade_steps = ? WHERE pz_id = ?', results)
+    return len(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Grade every puzzle in a pseudoku sqlite file')
+    parser.add_argument('db', help='path to sqlite file')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--regrade', action='store_true', help='grade rows that already have a grade')
+    args = parser.parse_args()
+
+    db = puzzledb.openDB(args.db)
+    start = time.perf_counter()
+    done = gradeTable(db, args.workers, args.regrade)
+    print('graded {} puzzles in {:.1f}s'.format(done, time.perf_counter() - start))
+    for level, name in enumerate(TECHNIQUES):
+        count = db.execute('SELECT count(*) FROM puzzle WHERE pz_grade = ?', (level,)).fetchone()[0]
+        print('{:>14}: {}'.format(name, count))
+    print(puzzledb.loadCounts(db))
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+# highscore.py
+# leaderboards behind submitpuzzle's HSrecordid/newhighscore. A solved puzzle is offered to two
+# boards: its own puzzle's ('puzzle/42') and, if we know it, its difficulty's
+# ('difficulty/two'). Each board only ever keeps its K fastest times.
+#
+# Storage is pluggable--anything with top() and insert() like the two stores here works.
+# MemoryStore lives and dies with the process (tests, local runs). SQLiteStore is one table with
+# a (board, time) index, so inserts, trims and top-K reads never scan. HighScores sits in front
+# and caches each board's current top-K times, sorted, for a bounded number of boards. Most
+# solves can't place, and those are turned away with one bisect and no storage call.
+#
+#   python highscore.py                                  load test: concurrent submissions, in memory
+#   python highscore.py --db hs.sqlite --threads 16      same, against a sqlite file
+
+import bisect
+import collections
+import sqlite3
+import threading
+import time
+
+
+K = 10              # times kept per board
+MAX_NAME = 32       # usernames are cut to this
+
+
+def puzzleBoard(puzzleid):
+    return 'puzzle/{}'.format(puzzleid)
+
+def difficultyBoard(difficulty):
+    return 'difficulty/{}'.format(difficulty)
+
+
+class MemoryStore:
+    """Boards as sorted lists in a dict. Thread safe, not shared between processes."""
+
+    def __init__(self):
+        self.boards = {}        # board -> sorted list of (usertime, recordid, username, puzzleid)
+        self.lastId = 0
+        self.lock = threading.Lock()
+
+    def top(self, board, k):
+        """Fastest k rows of board, fastest first: (usertime, recordid, username, puzzleid)"""
+        with self.lock:
+            return self.boards.get(board, [])[:k]
+
+    def insert(self, board, k, usertime, username, puzzleid):
+        """Adds a time to board if it makes the top k, and drops whatever falls off. Returns
+        (recordid, top k rows after), with recordid None if it didn't place"""
+        with self.lock:
+            rows = self.boards.setdefault(board, [])
+            self.lastId += 1
+            row = (usertime, self.lastId, username, puzzleid)
+            at = bisect.bisect_right(rows, row)
+            if at >= k:
+                return None, rows[:k]
+            rows.insert(at, row)
+            del rows[k:]
+            return self.lastId, rows[:]
+
+
+class SQLiteStore:
+    """Boards in one sqlite table. One connection shared by every thread, behind a lock."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS highscore (
+            hs_id           INTEGER PRIMARY KEY,
+            hs_board        TEXT NOT NULL,
+            hs_usertime     REAL NOT NULL,
+            hs_username     TEXT,
+            hs_puzzleid     TEXT,
+            hs_created      REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS highscore_board_time ON highscore (hs_board, hs_usertime, hs_id);
+    """
+    TOP_QUERY = 'SELECT hs_usertime, hs_id, hs_username, hs_puzzleid FROM highscore \
+                 WHERE hs_board = ? ORDER BY hs_usertime, hs_id LIMIT ?'
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        if path != ':memory:':
+            self.db.execute('PRAGMA journal_mode = WAL')
+            self.db.execute('PRAGMA synchronous = NORMAL')     # safe with WAL, no fsync per commit
+        self.db.executescript(self.SCHEMA)
+        self.lock = threading.Lock()
+
+    def top(self, board, k):
+        with self.lock:
+            return self.db.execute(self.TOP_QUERY, (board, k)).fetchall()
+
+    def insert(self, board, k, usertime, username, puzzleid):
+        """Same as MemoryStore.insert(). The check, insert and trim are one transaction, so a
+        stale cache (or another container) can't push a board past k"""
+        with self.lock, self.db:
+            last = self.db.execute('SELECT hs_usertime FROM highscore WHERE hs_board = ? \
+                                    ORDER BY hs_usertime, hs_id LIMIT 1 OFFSET ?', (board, k - 1)).fetchone()
+            if last is not None and usertime >= last[0]:
+                return None, self.db.execute(self.TOP_QUERY, (board, k)).fetchall()
+
+            recordid = self.db.execute('INSERT INTO highscore (hs_board, hs_usertime, hs_username, \
+                                        hs_puzzleid, hs_created) VALUES (?, ?, ?, ?, ?)',
+                                       (board, usertime, username, str(puzzleid), time.time())).lastrowid
+            top = self.db.execute(self.TOP_QUERY, (board, k)).fetchall()
+            if last is not None:
+                self.db.execute('DELETE FROM highscore WHERE hs_board = ? AND hs_usertime >= ? \
+                                 AND hs_id NOT IN ({})'.format(','.join('?' * len(top))),
+                                [board, top[-1][0]] + [row[1] for row in top])
+            return recordid, top
+
+
+class HighScores:
+    """Top-k leaderboards over a store. The cache holds the sorted top-k times of up to
+    maxBoards boards (least recently used go first), each trusted for maxAge seconds--other
+    containers write to the same store, so a board can't stay cached forever."""
+
+    def __init__(self, store, k=K, maxBoards=1024, maxAge=60):
+        self.store = store
+        self.k = k
+        self.maxBoards = maxBoards
+        self.maxAge = maxAge
+        self.cache = collections.OrderedDict()      # board -> (time loaded, sorted top-k times)
+        self.lock = threading.Lock()
+
+    def times(self, board):
+        """board's top-k times, fastest first, from the cache if it's fresh"""
+        with self.lock:
+            entry = self.cache.get(board)
+            if entry and time.monotonic() - entry[0] <= self.maxAge:
+                self.cache.move_to_end(board)
+                return entry[1]
+        times = [row[0] for row in self.store.top(board, self.k)]
+        self.remember(board, times)
+        return times
+
+    def remember(self, board, times):
+        with self.lock:
+            self.cache[board] = (time.monotonic(), times)
+            self.cache.move_to_end(board)
+            while len(self.cache) > self.maxBoards:
+                self.cache.popitem(last=False)
+
+    def places(self, board, usertime):
+        """True if usertime would make board's top k. One bisect over the cached times"""
+        times = self.times(board)
+        return bisect.bisect_right(times, usertime) < self.k
+
+    def top(self, board):
+        """board's leaders: list of (usertime, recordid, username, puzzleid), fastest first"""
+        return self.store.top(board, self.k)
+
+    def record(self, puzzleid, difficulty, usertime, username=None):
+        """Offers a solve to its puzzle's board, and its difficulty's if difficulty isn't None.
+        Returns (HSrecordid, newhighscore): the record id (as a string) of the first board it
+        placed on, or '' if it placed on neither"""
+        boards = [puzzleBoard(puzzleid)]
+        if difficulty is not None:
+            boards.append(difficultyBoard(difficulty))
+        username = str(username or '')[:MAX_NAME]
+
+        recordid = ''
+        for board in boards:
+            if not self.places(board, usertime):
+                continue
+            placed, top = self.store.insert(board, self.k, usertime, username, puzzleid)
+            self.remember(board, [row[0] for row in top])
+            if placed is not None and not recordid:
+                recordid = str(placed)
+        return recordid, bool(recordid)
+
+
+def main():
+    import argparse
+    import concurrent.futures
+    import random
+
+    from bench import summarize
+
+    parser = argparse.ArgumentParser(description='Load test the high score store with concurrent submissions')
+    parser.add_argument('--db', help='sqlite file to use (default: MemoryStore)')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--submissions', type=int, default=20000)
+    parser.add_argument('--puzzles', type=int, default=100, help='distinct puzzle ids submitted to')
+    parser.add_argument('--k', type=int, default=K)
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    difficulties = ('one', 'two', 'three', 'four')
+    jobs = [(rng.randrange(args.puzzles), rng.choice(difficulties), rng.lognormvariate(5.5, 0.6),
+             'user{}'.format(rng.randrange(500))) for _ in range(args.submissions)]
+
+    store = SQLiteStore(args.db) if args.db else MemoryStore()
+    scores = HighScores(store, k=args.k)
+
+    def submit(job):
+        start = time.perf_counter()
+        placed = scores.record(*job)[1]
+        return time.perf_counter() - start, placed
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(args.threads) as pool:
+        results = list(pool.map(submit, jobs, chunksize=64))
+    elapsed = time.perf_counter() - start
+
+    stats = summarize([seconds for seconds, _ in results])
+    placed = sum(1 for _, p in results if p)
+    print('{} submissions, {} threads, {}: {:.0f}/sec, {} placed'.format(
+        args.submissions, args.threads, args.db or 'memory', args.submissions / elapsed, placed))
+    print('per call us: mean {mean:.1f}  p50 {p50:.1f}  p90 {p90:.1f}  p99 {p99:.1f}  max {max:.1f}'.format(**stats))
+    for difficulty in difficulties:
+        times = scores.times(difficultyBoard(difficulty))
+        print('{:>6}: {} times, fastest {:.1f}s'.format(difficulty, len(times), times[0]))
+
+
+if __name__ == '__main__':
+    main()
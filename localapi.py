@@ -0,0 +1,437 @@
+# localapi.py
+# local stand-in for API Gateway + Lambda, so both handlers can be run and load tested without
+# deploying anything. getpuzzle gets proxy-integration events (GET /getpuzzle/{proxy+}) and
+# submitpuzzle gets the request body as its event (POST /submitpuzzle), same as the real API.
+# S3 is locals3.LocalS3 over a directory.
+#
+# Each function runs in emulated containers. A container is its own fresh import of the handler
+# module (with its own /tmp DB path), serves one request at a time, and is reused while warm.
+# A request that finds no idle container pays a cold start; containers idle for longer than
+# idleTimeout are thrown away, and past maxContainers requests get a 429, like a throttle.
+#
+#   python localapi.py serve                         generate a small puzzle file and serve it
+#   python localapi.py serve --s3 <root> --port 8000 serve <root>/pseudoku-puzzle/pseudoku.sqlite
+#   python localapi.py load --concurrency 16         load test, in process over real HTTP
+#   python localapi.py load --url http://host:8000   load test something already running
+
+import argparse
+import importlib
+import json
+import os
+import re
+import socket
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import types
+import urllib.parse
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import sudolib
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BUCKET = 'pseudoku-puzzle'
+OBJECT = 'pseudoku.sqlite'
+CORS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Accept',
+}
+GET_ROUTE = re.compile(r'^(?:/[^/]+)?/getpuzzle/(.+)$')     # with or without a stage, eg /dev
+SUBMIT_ROUTE = re.compile(r'^(?:/[^/]+)?/submitpuzzle/?$')
+
+# module-level handler state is read from the environment at import, so containers have to be
+# imported one at a time
+importLock = threading.Lock()
+
+
+def localModules():
+    """names of the loaded modules that live in this directory, besides this one"""
+    return [name for name, module in list(sys.modules.items())
+            if name not in (__name__, '__main__')
+            and os.path.dirname(os.path.abspath(getattr(module, '__file__', None) or '/')) == HERE]
+
+
+class Throttled(Exception):
+    pass
+
+
+class Container:
+    def __init__(self, module, initSeconds):
+        self.module = module
+        self.initSeconds = initSeconds
+        self.lastUsed = time.monotonic()
+        self.requests = 0
+
+
+class Function:
+    """One lambda function: a handler module name plus its pool of containers. env is applied
+    while a container starts; every container gets its own PSEUDOKU_DB_PATH under tmp."""
+
+    def __init__(self, name, tmp, env=None, maxContainers=None, idleTimeout=300):
+        self.name = name
+        self.tmp = tmp
+        self.env = env or {}
+        self.maxContainers = maxContainers
+        self.idleTimeout = idleTimeout
+        self.idle = []              # warm containers, most recently used last
+        self.active = 0
+        self.started = 0
+        self.coldStarts = []        # init seconds of every cold start
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Cold start: a fresh import of the handler module, timed"""
+        with importLock:
+            self.started += 1
+            env = dict(self.env, PSEUDOKU_DB_PATH=os.path.join(
+                self.tmp, '{}-{}-db'.format(self.name, self.started)))
+            saved = {key: os.environ.get(key) for key in env}
+            os.environ.update(env)
+            # our own modules (sudolib, puzzledb...) are imported fresh too, like a real cold start.
+            # Anything installed (boto3, numpy) stays cached
+            modules = {name: sys.modules.pop(name) for name in localModules()}
+            try:
+                start = time.perf_counter()
+                module = importlib.import_module(self.name)
+                seconds = time.perf_counter() - start
+            finally:
+                for name in localModules():             # the container holds the only references
+                    del sys.modules[name]
+                sys.modules.update(modules)
+                for key, value in saved.items():
+                    if value is None:
+                        os.environ.pop(key, None)
+                    else:
+                        os.environ[key] = value
+        with self.lock:
+            self.coldStarts.append(seconds)
+        return Container(module, seconds)
+
+    def acquire(self):
+        """Returns (container, cold), or (None, False) if we're at maxContainers"""
+        with self.lock:
+            now = time.monotonic()
+            self.idle = [c for c in self.idle if now - c.lastUsed <= self.idleTimeout]
+            if self.idle:
+                self.active += 1
+                return self.idle.pop(), False
+            if self.maxContainers and self.active >= self.maxContainers:
+                self.throttled += 1
+                return None, False
+            self.active += 1
+        try:
+            return self.start(), True
+        except BaseException:
+            with self.lock:
+                self.active -= 1
+            raise
+
+    def release(self, container):
+        with self.lock:
+            container.lastUsed = time.monotonic()
+            container.requests += 1
+            self.active -= 1
+            self.idle.append(container)
+
+    def invoke(self, event):
+        """Runs the handler like lambda would. Returns (result, cold), raising Throttled or whatever
+        the handler raised"""
+        container, cold = self.acquire()
+        if container is None:
+            raise Throttled(self.name)
+        try:
+            context = types.SimpleNamespace(function_name=self.name, aws_request_id=str(time.time_ns()),
+                                            get_remaining_time_in_millis=lambda: 3000)
+            return container.module.lambda_handler(event, context), cold
+        finally:
+            self.release(container)
+
+    def stats(self):
+        with self.lock:
+            return {'containers': self.started, 'warm': len(self.idle), 'throttled': self.throttled,
+                    'coldStartMs': [round(s * 1000, 2) for s in self.coldStarts]}
+
+
+class Gateway:
+    """Turns HTTP requests into lambda events and lambda results back into responses"""
+
+    def __init__(self, getpuzzle, submitpuzzle):
+        self.getpuzzle = getpuzzle
+        self.submitpuzzle = submitpuzzle
+
+    def handle(self, method, path, headers, body):
+        """Returns (status, headers, body bytes)"""
+        url = urllib.parse.urlsplit(path)
+        if method == 'OPTIONS':
+            return 204, dict(CORS), b''
+
+        match = GET_ROUTE.match(url.path)
+        if match and method == 'GET':
+            query = dict(urllib.parse.parse_qsl(url.query))
+            event = {
+                'resource': '/getpuzzle/{proxy+}',
+                'path': url.path,
+                'httpMethod': 'GET',
+                'headers': dict(headers),
+                'queryStringParameters': query or None,     # API Gateway sends null, not {}
+                'pathParameters': {'proxy': urllib.parse.unquote(match.group(1))},
+                'body': None,
+                'isBase64Encoded': False,
+            }
+            return self.proxy(self.getpuzzle, event)
+
+        if SUBMIT_ROUTE.match(url.path) and method == 'POST':
+            try:
+                event = json.loads(body or b'null')
+            except ValueError:
+                return self.error(400, 'Could not parse request body into json')
+            return self.custom(self.submitpuzzle, event)
+
+        return self.error(403 if method in ('GET', 'POST') else 405, 'Missing Authentication Token')
+
+    def proxy(self, function, event):
+        """lambda proxy integration: the handler's return value is the response. The body is
+        passed through as is (this API has no binary media types, so isBase64Encoded is ignored)"""
+        try:
+            result, _ = function.invoke(event)
+        except Throttled:
+            return self.error(429, 'Rate Exceeded.')
+        except Exception:
+            traceback.print_exc()
+            return self.error(502, 'Internal server error')
+        if not isinstance(result, dict) or 'statusCode' not in result:
+            return self.error(502, 'Internal server error')
+        body = result.get('body') or ''
+        return (result['statusCode'], dict(result.get('headers') or {}),
+                body.encode() if isinstance(body, str) else json.dumps(body).encode())
+
+    def custom(self, function, event):
+        """non-proxy integration: the handler's return value, as JSON, is the 200 body"""
+        try:
+            result, _ = function.invoke(event)
+        except Throttled:
+            return self.error(429, 'Rate Exceeded.')
+        except Exception:
+            traceback.print_exc()
+            return self.error(502, 'Internal server error')
+        return 200, {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, \
+            json.dumps(result).encode()
+
+    def error(self, status, message):
+        return status, dict(CORS, **{'Content-Type': 'application/json'}), \
+            json.dumps({'message': message}).encode()
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'       # keep-alive, so the load generator doesn't time connects
+    gateway = None
+
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)     # no 40ms delayed-ack stalls
+
+    def respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else None
+        status, headers, out = self.gateway.handle(self.command, self.path, self.headers.items(), body)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    do_GET = do_POST = do_OPTIONS = respond
+
+    def log_message(self, format, *args):
+        pass
+
+
+def makeServer(gateway, host='127.0.0.1', port=0):
+    """ThreadingHTTPServer serving gateway. port=0 picks a free one (see server.server_address)"""
+    handler = type('Handler', (RequestHandler,), {'gateway': gateway})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def makeGateway(s3root, tmp, maxContainers=None, idleTimeout=300, latency=0.0, bandwidth=None,
+                metrics=False):
+    # env only applies while a container imports, so the DB has to be fetched then too: lazy
+    # mode would go looking for PSEUDOKU_LOCAL_S3 after it's gone (and the init is the cold
+    # start we want to see anyway)
+    env = {'PSEUDOKU_LOCAL_S3': s3root, 'PSEUDOKU_LOCAL_S3_LATENCY': str(latency),
+           'PSEUDOKU_METRICS': '1' if metrics else '0', 'PSEUDOKU_DB_LAZY': ''}
+    if bandwidth:
+        env['PSEUDOKU_LOCAL_S3_BANDWIDTH'] = str(bandwidth)
+    return Gateway(Function('getpuzzle', tmp, env, maxContainers, idleTimeout),
+                   Function('submitpuzzle', tmp, env, maxContainers, idleTimeout))
+
+def makeS3(root, count=200, seed=1234):
+    """Writes a puzzle file of count generated puzzles into a local S3 root. Returns root"""
+    import puzzledb
+
+    os.makedirs(os.path.join(root, BUCKET), exist_ok=True)
+    db = puzzledb.openDB(os.path.join(root, BUCKET, OBJECT))
+    for diff in (35, 43, 50, 58):       # something in each carved-cell difficulty
+        rows = [(sudolib.stringify(sudolib.normalize(puzzle)), sudolib.countZeros(puzzle))
+                for _, puzzle, _, _ in sudolib.iterPuzzles(count // 4, diff=diff, seed=seed)]
+        puzzledb.insertPuzzles(db, rows)
+    db.close()
+    return root
+
+
+#---------------LOAD GENERATOR---------------#
+
+class Client:
+    """One keep-alive HTTP connection. request() returns (status, parsed json body)"""
+
+    def __init__(self, url):
+        import http.client
+        parts = urllib.parse.urlsplit(url)
+        self.prefix = parts.path.rstrip('/')
+        self.conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+
+    def request(self, method, path, data=None):
+        body = None if data is None else json.dumps(data)
+        headers = {'Content-Type': 'application/json'} if body else {}
+        self.conn.request(method, self.prefix + path, body=body, headers=headers)
+        response = self.conn.getresponse()
+        raw = response.read()
+        return response.status, json.loads(raw) if raw else None
+
+
+def loadTest(url, requests=2000, concurrency=8, submitRatio=0.5, batch=1, compact=True, seed=1234):
+    """Mixed traffic from concurrency threads: each step GETs a puzzle of a random difficulty,
+    then (with probability submitRatio) solves and submits it. requests counts GETs. Returns
+    {'seconds', 'get': [...], 'submit': [...], 'errors': {status: count}} with per-request
+    latencies in seconds. Solving is done off the clock."""
+    import puzzledb
+    import random
+
+    latencies = {'get': [], 'submit': []}
+    errors = {}
+    lock = threading.Lock()
+
+    def worker(index, count):
+        rng = random.Random('{}/{}'.format(seed, index))
+        client = Client(url)
+        mine = {'get': [], 'submit': []}
+        failed = {}
+        for _ in range(count):
+            query = [('format', 'compact')] if compact else []
+            if batch > 1:
+                query.append(('n', batch))
+            path = '/getpuzzle/{}'.format(rng.choice(puzzledb.DIFFICULTIES))
+            if query:
+                path += '?' + urllib.parse.urlencode(query)
+
+            start = time.perf_counter()
+            status, body = client.request('GET', path)
+            mine['get'].append(time.perf_counter() - start)
+            if status != 200:
+                failed[status] = failed.get(status, 0) + 1
+                continue
+            if rng.random() >= submitRatio:
+                continue
+
+            puzzle = (body.get('puzzles') or [body])[0]
+            board = puzzle['data']['board']
+            if isinstance(board, str):
+                board = sudolib.Board.fromString(board).toRows()
+            event = dict(puzzle, submission=sudolib.solveExact(board), username='load{}'.format(index))
+
+            start = time.perf_counter()
+            status, body = client.request('POST', '/submitpuzzle', event)
+            mine['submit'].append(time.perf_counter() - start)
+            if status != 200 or not body['body']['data']['complete']:
+                key = status if status != 200 else 'incomplete'
+                failed[key] = failed.get(key, 0) + 1
+        with lock:
+            for key in latencies:
+                latencies[key] += mine[key]
+            for status, n in failed.items():
+                errors[status] = errors.get(status, 0) + n
+
+    shares = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+    threads = [threading.Thread(target=worker, args=(i, n)) for i, n in enumerate(shares)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return dict(latencies, seconds=time.perf_counter() - start, errors=errors)
+
+def report(results):
+    from bench import summarize
+
+    total = len(results['get']) + len(results['submit'])
+    print('{} requests in {:.2f}s: {:.0f} req/s, errors {}'.format(
+        total, results['seconds'], total / results['seconds'], results['errors'] or 'none'))
+    print('{:<8} {:>7} {:>9} {:>9} {:>9} {:>9} {:>9}'.format('route', 'n', 'mean ms', 'p50 ms',
+                                                             'p90 ms', 'p99 ms', 'max ms'))
+    for route in ('get', 'submit'):
+        if results[route]:
+            stats = summarize(results[route])
+            print('{:<8} {n:>7} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f}'.format(
+                route, *(stats[k] / 1000 for k in ('mean', 'p50', 'p90', 'p99', 'max')), n=stats['n']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local API Gateway + Lambda emulator for pseudoku')
+    parser.add_argument('command', choices=('serve', 'load'))
+    parser.add_argument('--s3', help='local S3 root holding {}/{} (default: generate one)'.format(BUCKET, OBJECT))
+    parser.add_argument('--generate', type=int, default=200, help='puzzles to generate without --s3')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000, help='serve port (load uses a free one)')
+    parser.add_argument('--max-containers', type=int, help='per function, then 429s')
+    parser.add_argument('--idle-timeout', type=float, default=300, help='seconds before a warm container goes cold')
+    parser.add_argument('--s3-latency', type=float, default=0.0, help='seconds added to every S3 call')
+    parser.add_argument('--s3-bandwidth', type=float, help='bytes/sec for S3 downloads')
+    parser.add_argument('--metrics', action='store_true', help="print the handlers' EMF log lines")
+    parser.add_argument('--url', help='load: target this server instead of starting one')
+    parser.add_argument('--requests', type=int, default=2000, help='load: GETs to send')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--submit-ratio', type=float, default=0.5, help='load: fraction of GETs followed by a submit')
+    parser.add_argument('--batch', type=int, default=1, help='load: ?n= per GET')
+    parser.add_argument('--nested', action='store_true', help='load: original format instead of compact')
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.url
+        if url is None:
+            s3root = args.s3 or makeS3(os.path.join(tmp, 's3'), args.generate, args.seed)
+            gateway = makeGateway(s3root, tmp, args.max_containers, args.idle_timeout,
+                                  args.s3_latency, args.s3_bandwidth, args.metrics)
+            server = makeServer(gateway, args.host, args.port if args.command == 'serve' else 0)
+            url = 'http://{}:{}'.format(*server.server_address[:2])
+            if args.command == 'serve':
+                print('serving {} from {} (ctrl-c to stop)'.format(url, s3root))
+                try:
+                    server.serve_forever()
+                except KeyboardInterrupt:
+                    pass
+                return
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        results = loadTest(url, args.requests, args.concurrency, args.submit_ratio, args.batch,
+                           not args.nested, args.seed)
+        report(results)
+        if args.url is None:
+            server.shutdown()
+            for function in (gateway.getpuzzle, gateway.submitpuzzle):
+                stats = function.stats()
+                cold = stats['coldStartMs']
+                print('{:<13} {} containers, {} throttled, cold starts ms: {}'.format(
+                    function.name, stats['containers'], stats['throttled'],
+                    ', '.join('{:.1f}'.format(ms) for ms in cold[:8]) + (' ...' if len(cold) > 8 else '')))
+
+
+if __name__ == '__main__':
+    main()
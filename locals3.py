@@ -0,0 +1,93 @@
+# locals3.py
+# stand-in for the boto3 S3 client, backed by a local directory. Lets us run the lambdas
+# (and time their cold starts) without AWS. Objects live at <root>/<bucket>/<key>.
+#
+# getpuzzle.py uses it instead of boto3 when PSEUDOKU_LOCAL_S3=<root> is set.
+#
+#   python locals3.py <root>        times a getpuzzle cold start under each DB mode
+
+import hashlib
+import os
+import shutil
+import time
+
+
+class LocalS3:
+    """Implements the bits of the boto3 S3 client we use: head_object() and download_file().
+    latency (seconds) is added to every call, and bandwidth (bytes/sec) to downloads, so cold
+    starts can be measured with something like real network costs."""
+
+    def __init__(self, root, latency=0.0, bandwidth=None):
+        self.root = root
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.calls = []             # (method, key) log, handy for checking what a cold start did
+
+    def path(self, bucket, key):
+        return os.path.join(self.root, bucket, key)
+
+    def head_object(self, Bucket, Key):
+        self.calls.append(('head_object', Key))
+        time.sleep(self.latency)
+        path = self.path(Bucket, Key)
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        return {
+            'ETag': '"{}"'.format(fileETag(path)),
+            'ContentLength': os.path.getsize(path),
+        }
+
+    def download_file(self, Bucket, Key, Filename):
+        self.calls.append(('download_file', Key))
+        time.sleep(self.latency)
+        path = self.path(Bucket, Key)
+        if self.bandwidth:
+            time.sleep(os.path.getsize(path) / self.bandwidth)
+        shutil.copyfile(path, Filename)
+
+
+def fileETag(path):
+    """S3 ETag for a single-part upload is the md5 of the content"""
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def timeColdStart(root, mode, lazy=False, dbPath='/tmp/pseudoku-coldstart', clearTmp=True):
+    """Imports a fresh copy of getpuzzle against the local S3 root, like a new lambda container.
+    Returns (seconds, list of S3 calls made)"""
+    import importlib
+    import sys
+
+    os.environ['PSEUDOKU_LOCAL_S3'] = root
+    os.environ['PSEUDOKU_DB_MODE'] = mode
+    os.environ['PSEUDOKU_DB_LAZY'] = '1' if lazy else ''
+    os.environ['PSEUDOKU_DB_PATH'] = dbPath
+    if clearTmp:
+        for path in (dbPath, dbPath + '.etag'):
+            if os.path.exists(path):
+                os.remove(path)
+    sys.modules.pop('getpuzzle', None)
+
+    start = time.perf_counter()
+    module = importlib.import_module('getpuzzle')
+    elapsed = time.perf_counter() - start
+    return elapsed, module.s3.calls if module.s3 else []
+
+
+if __name__ == '__main__':
+    import sys
+
+    root = sys.argv[1]
+    for mode, lazy, clear in (('download', False, True), ('cached', False, True),
+                              ('cached', False, False), ('bundled', False, False),
+                              ('cached', True, True)):
+        try:
+            seconds, calls = timeColdStart(root, mode, lazy=lazy, clearTmp=clear)
+        except FileNotFoundError as e:        # bundled, with no pseudoku.sqlite in the package
+            print('{:>8} skipped: {}'.format(mode, e))
+            continue
+        print('{:>8} lazy={:<5} warm /tmp={:<5} {:8.2f}ms  {}'.format(
+            mode, str(lazy), str(not clear), seconds * 1000, calls))
@@ -0,0 +1,142 @@
+# metrics.py
+# per-phase request timings for the lambdas, logged as one CloudWatch embedded metric format
+# (EMF) JSON line per request. CloudWatch turns each phase into a metric (dimension Function),
+# so p99 per phase can go straight on a dashboard without any extra API calls.
+#
+# A handler makes a Timer per request and calls mark('phase') after each phase. mark() only
+# takes the time; when the line is written each phase is charged the time since the mark before
+# it, so a phase that runs several times (a batch) adds up. Module init gets its own Timer, and
+# its phases ride along (as init_<phase>) on the first request, which is also the one flagged
+# ColdStart.
+#
+# PSEUDOKU_METRICS=0 turns it all off: timer() hands back NULL, whose methods do nothing.
+
+import json
+import os
+import sys
+import time
+
+
+ENABLED = os.environ.get('PSEUDOKU_METRICS', '1') != '0'
+NAMESPACE = os.environ.get('PSEUDOKU_METRICS_NAMESPACE', 'Pseudoku')
+OUT = sys.stdout        # lambda ships stdout to CloudWatch logs
+LINES = {}              # (function, property names, marks, init's marks) -> lineTemplate()
+
+
+class Timer:
+    """Monotonic (perf_counter) phase timings for one request, in milliseconds"""
+
+    def __init__(self, function, init=None):
+        self.function = function
+        self.init = init        # module init's Timer, if this request is the container's first
+        self.marks = []         # (phase, perf_counter()) per mark(), in order
+        self.properties = {}
+        self.start = time.perf_counter()
+
+    def mark(self, phase):
+        """Charges the time since the last mark (or the start) to phase. Only takes the time--
+        the adding up waits for the log line"""
+        self.marks.append((phase, time.perf_counter()))
+
+    def set(self, key, value):
+        """Extra field for the log line (searchable in Logs Insights, not a metric)"""
+        self.properties[key] = value
+
+    def deltas(self):
+        """ms charged by each mark, in order"""
+        ms = []
+        last = self.start
+        for _, now in self.marks:
+            ms.append((now - last) * 1000)
+            last = now
+        return ms
+
+    def line(self):
+        """The EMF JSON line for this request: the _aws metric definitions, Function, ColdStart,
+        any set() fields, then each phase in ms (total is start to now). Everything but the
+        numbers only depends on which fields and marks there are, so it's built once per
+        combination (see lineTemplate()), and each line is the deltas and one short format"""
+        end = time.perf_counter()
+        init = self.init
+        key = (self.function, tuple(self.properties), tuple([phase for phase, _ in self.marks]),
+               init and tuple([phase for phase, _ in init.marks]))
+        template = LINES.get(key)
+        if template is None:
+            template = LINES[key] = lineTemplate(*key)
+        head, tail, slots = template
+
+        ms = self.deltas()
+        if init is not None:
+            ms += init.deltas()
+        if slots is not None:
+            added = [0.0] * (max(slots) + 1)
+            for slot, value in zip(slots, ms):
+                added[slot] += value
+            ms = added
+        ms.append((end - self.start) * 1000)
+        return head + tail % (time.time() * 1000, init is not None,
+                              *[jsonValue(value) for value in self.properties.values()], *ms)
+
+    def emit(self):
+        """Writes the log line. Never fails the request over it"""
+        try:
+            OUT.write(self.line() + '\n')
+        except (OSError, ValueError):
+            pass
+
+
+def lineTemplate(function, properties, marks, initMarks=None):
+    """(head, tail, slots) for the log lines of one combination of fields and marks. head is
+    the _aws metric definitions, as is. tail is a % template for the rest: Timestamp and
+    ColdStart, then a %s per property and a %.4f per phase. Each phase is a metric once, in
+    first-marked order, init's after the request's as init_<phase>, and total last. slots maps
+    each mark's delta to its phase when some phase was marked more than once (None when it's
+    one to one). Function, property and phase names are all ours, so they go in without
+    escaping"""
+    names = list(marks) + ['init_' + phase for phase in initMarks or ()]
+    phases = list(dict.fromkeys(names))
+    slots = None if len(phases) == len(names) else [phases.index(name) for name in names]
+    phases.append('total')
+
+    metrics = [{'Name': name, 'Unit': 'Milliseconds'} for name in phases]
+    metrics.append({'Name': 'ColdStart', 'Unit': 'Count'})
+    head = '{"_aws":' + json.dumps({'CloudWatchMetrics': [{
+        'Namespace': NAMESPACE, 'Dimensions': [['Function']], 'Metrics': metrics}]},
+        separators=(',', ':'))[:-1]
+    parts = [',"Timestamp":%d},"Function":"' + function + '","ColdStart":%d']
+    parts += ['"{}":%s'.format(name) for name in properties]
+    parts += ['"{}":%.4f'.format(name) for name in phases]
+    return head, ','.join(parts) + '}', slots
+
+
+class NullTimer:
+    """Timer that records nothing, for when metrics are off"""
+
+    function = init = None
+
+    def mark(self, phase):
+        pass
+
+    def set(self, key, value):
+        pass
+
+    def emit(self):
+        pass
+
+NULL = NullTimer()
+
+
+def jsonValue(value):
+    """json.dumps() for one value, minus its overhead for the usual bools and numbers"""
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if type(value) in (int, float):
+        return repr(value)
+    return json.dumps(value)
+
+
+def timer(function, init=None):
+    """A Timer starting now, or NULL if metrics are off"""
+    return Timer(function, init) if ENABLED else NULL
@@ -0,0 +1,281 @@
+# puzzledb.py
+# schema and maintenance helpers for the pseudoku.sqlite puzzle file. fillpuzzles.py writes
+# it, getpuzzle.py reads it.
+#
+# Random picks: every puzzle gets a difficulty and a dense per-difficulty sequence number
+# (pz_seq = 0..count-1), with a unique index on (pz_difficulty, pz_seq). The per-difficulty
+# counts are kept in their own little table. So picking a random puzzle is one randrange()
+# in python plus one index lookup, instead of ORDER BY random() scanning the whole bucket.
+# Sequence numbers have to stay dense--after deleting rows, run migrate() again to renumber.
+#
+# Dedupe: pz_canon_key is sudolib.canonicalKey() of the puzzle, with a unique index, so the
+# same puzzle under any relabeling/swap/transpose can only be stored once. Inserts that hit
+# an existing key are just skipped.
+#
+# Grades: grader.py fills pz_grade (hardest technique needed, see grader.TECHNIQUES) and
+# pz_grade_steps. Once a row has a grade, its difficulty comes from the grade instead of the
+# carved cell count, so the same (pz_difficulty, pz_seq) pick serves by real hardness.
+#
+# Solutions: pz_solution is the puzzle's solution, in the same orientation and format as
+# pz_content, so getpuzzle can shuffle both with one transform and sign a digest of the
+# solution (see authen.Signer.digest). migrate() solves any rows that don't have one yet.
+#
+# Packed files: pack() writes a copy of a puzzle file where pz_content is toPacked()'s 41-byte
+# BLOB instead of the 89-char string. Everything else (clue count, difficulty, seq, keys,
+# grades) carries over, so readers only have to decode pz_content with decodeBoard(). Packed
+# files are for serving--generate into a normal file and pack it before upload.
+#
+#   python puzzledb.py pseudoku.sqlite                      migrates an existing file in place
+#   python puzzledb.py pseudoku.sqlite --pack packed.sqlite writes a packed copy
+
+import os
+import random
+import sqlite3
+import urllib.parse
+
+import sudolib
+
+
+DIFFICULTIES = ('one', 'two', 'three', 'four')
+CARVED_RANGES = {           # inclusive, same buckets as difficultyOf()
+    'one':   (0, 39),
+    'two':   (40, 46),
+    'three': (47, 54),
+    'four':  (55, 81),
+}
+# grader.TECHNIQUES index -> difficulty: naked singles only, hidden singles, pointing through
+# naked triples, and x-wings or worse
+GRADE_DIFFICULTIES = ('one', 'two', 'three', 'three', 'three', 'three', 'four', 'four')
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS puzzle (
+        pz_id           INTEGER PRIMARY KEY,
+        pz_content      TEXT NOT NULL,
+        pz_carved_cells INTEGER NOT NULL,
+        pz_difficulty   TEXT,
+        pz_seq          INTEGER,
+        pz_canon_key    INTEGER,
+        pz_grade        INTEGER,
+        pz_grade_steps  INTEGER,
+        pz_solution     TEXT
+    );
+    CREATE TABLE IF NOT EXISTS difficulty_count (
+        difficulty      TEXT PRIMARY KEY,
+        count           INTEGER NOT NULL
+    );
+"""
+INDEX = 'CREATE UNIQUE INDEX IF NOT EXISTS puzzle_difficulty_seq ON puzzle (pz_difficulty, pz_seq)'
+CANON_INDEX = 'CREATE UNIQUE INDEX IF NOT EXISTS puzzle_canon_key ON puzzle (pz_canon_key)'
+PICK_COLUMNS = 'pz_id, pz_content'
+PICK_QUERY = 'SELECT {} FROM puzzle WHERE pz_difficulty = ? AND pz_seq = ?'
+
+
+def decodeBoard(content):
+    """pz_content (string, or packed BLOB) -> sudolib.Board"""
+    if isinstance(content, bytes):
+        return sudolib.Board.fromPacked(content)
+    return sudolib.Board.fromString(content)
+
+def decodeRow(row):
+    """picked row -> (pz_id, Board, solution Board or None). The solution is only there if the
+    row was picked with pickColumns()"""
+    solution = row[2] if len(row) > 2 else None
+    return row[0], decodeBoard(row[1]), None if solution is None else decodeBoard(solution)
+
+def encodeLike(board, content):
+    """board in the same format as pz_content (string, or packed BLOB)"""
+    return board.toPacked() if isinstance(content, bytes) else board.toString()
+
+def pickColumns(db):
+    """columns for the pick queries: the solution as well, if this file has them"""
+    if 'pz_solution' in columns(db, 'puzzle'):
+        return PICK_COLUMNS + ', pz_solution'
+    return PICK_COLUMNS
+
+def openReadOnly(path, mmapSize=64 << 20, cacheKB=8192):
+    """Opens a puzzle file for serving. The file is never written, so it's opened immutable
+    (no locking or change checks), memory mapped, with plain tuple rows and no decltype
+    parsing. Repeated queries reuse their prepared statements from the connection's cache."""
+    # quoted, so a '?' or '#' or '%' in the path can't end it early or add URI parameters
+    uri = 'file:{}?mode=ro&immutable=1'.format(urllib.parse.quote(os.path.abspath(path)))
+    db = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=256)
+    db.execute('PRAGMA mmap_size = {}'.format(int(mmapSize)))
+    db.execute('PRAGMA cache_size = {}'.format(-int(cacheKB)))
+    return db
+
+def difficultyOf(carved, grade=None):
+    """Difficulty bucket for a puzzle with this many carved cells, or with this grade if it has one"""
+    if grade is not None:
+        return GRADE_DIFFICULTIES[grade]
+    if carved < 40:
+        return 'one'
+    elif carved < 47:
+        return 'two'
+    elif carved <= 54:
+        return 'three'
+    return 'four'
+
+def openDB(path):
+    """Opens (or creates) a puzzle file for writing, with the current schema"""
+    db = sqlite3.connect(path)
+    if loadCounts(db) is None:
+        migrate(db)
+    return db
+
+def columns(db, table):
+    return [row[1] for row in db.execute('PRAGMA table_info({})'.format(table))]
+
+def migrate(db):
+    """Brings an older puzzle file up to the current schema, and (re)numbers pz_seq densely.
+    Rows without a pz_canon_key get one, and rows without a pz_solution get solved. Rows that
+    turn out to duplicate an earlier row are deleted (the lowest pz_id is kept)."""
+    if 'puzzle' in [row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type='table'")]:
+        for column in ('pz_difficulty', 'pz_seq', 'pz_canon_key', 'pz_grade', 'pz_grade_steps',
+                       'pz_solution'):
+            if column not in columns(db, 'puzzle'):
+                db.execute('ALTER TABLE puzzle ADD COLUMN {}'.format(column))
+    db.executescript(SCHEMA)
+
+    with db:
+        db.execute('DROP INDEX IF EXISTS puzzle_difficulty_seq')
+        db.execute('DROP INDEX IF EXISTS puzzle_canon_key')
+
+        # keys for old rows. canonicalKey() is a few ms a puzzle, so this is the slow part. Rows
+        # that already have one are walked too, in the same pz_id order, so a keyed row never
+        # beats an older copy of itself that hasn't been keyed yet
+        seen = set()
+        keys, dupes = [], []
+        for pz_id, content, key in db.execute('SELECT pz_id, CASE WHEN pz_canon_key IS NULL \
+                                               THEN pz_content END, pz_canon_key FROM puzzle \
+                                               ORDER BY pz_id').fetchall():
+            if key is None:
+                key = sudolib.canonicalKey(decodeBoard(content))[1]
+                keys.append((key, pz_id))
+            if key in seen:
+                dupes.append((pz_id,))
+            else:
+                seen.add(key)
+        db.executemany('UPDATE puzzle SET pz_canon_key = ? WHERE pz_id = ?', keys)
+        db.executemany('DELETE FROM puzzle WHERE pz_id = ?', dupes)
+        db.execute(CANON_INDEX)
+
+        solutions = []
+        for pz_id, content in db.execute('SELECT pz_id, pz_content FROM puzzle \
+                                          WHERE pz_solution IS NULL').fetchall():
+            solution = sudolib.solveExact(decodeBoard(content))
+            if solution is not None:
+                solutions.append((encodeLike(solution, content), pz_id))
+        db.executemany('UPDATE puzzle SET pz_solution = ? WHERE pz_id = ?', solutions)
+
+        counts = dict.fromkeys(DIFFICULTIES, 0)
+        updates = []
+        for pz_id, carved, grade in db.execute('SELECT pz_id, pz_carved_cells, pz_grade FROM puzzle \
+                                                ORDER BY pz_id'):
+            difficulty = difficultyOf(carved, grade)
+            updates.append((difficulty, counts[difficulty], pz_id))
+            counts[difficulty] += 1
+        db.executemany('UPDATE puzzle SET pz_difficulty = ?, pz_seq = ? WHERE pz_id = ?', updates)
+        db.execute(INDEX)
+        saveCounts(db, counts)
+
+def loadCounts(db):
+    """Returns {difficulty: count}, or None if this file hasn't been migrated"""
+    try:
+        return dict(db.execute('SELECT difficulty, count FROM difficulty_count').fetchall())
+    except sqlite3.OperationalError:
+        return None
+
+def saveCounts(db, counts):
+    db.executemany('INSERT OR REPLACE INTO difficulty_count (difficulty, count) VALUES (?, ?)',
+                   counts.items())
+
+def insertPuzzles(db, rows):
+    """Inserts (pz_content, pz_carved_cells[, pz_canon_key[, pz_grade, pz_grade_steps
+    [, pz_solution]]]) rows in one transaction, keeping pz_seq dense. The key and solution are
+    computed if they're left off. Rows whose key is already in the file are skipped. Returns the
+    number actually inserted."""
+    with db:
+        counts = loadCounts(db)
+        inserted = 0
+        for row in rows:
+            content, carved = row[0], row[1]
+            key = row[2] if len(row) > 2 else sudolib.canonicalKey(sudolib.Board.fromString(content))[1]
+            grade, steps = row[3:5] if len(row) > 3 else (None, None)
+            if len(row) > 5:
+                solution = row[5]
+            else:
+                solved = sudolib.solveExact(sudolib.Board.fromString(content))
+                solution = None if solved is None else solved.toString()
+            difficulty = difficultyOf(carved, grade)
+            cursor = db.execute('INSERT OR IGNORE INTO puzzle (pz_content, pz_carved_cells, \
+                                 pz_difficulty, pz_seq, pz_canon_key, pz_grade, pz_grade_steps, \
+                                 pz_solution) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                (content, carved, difficulty, counts.get(difficulty, 0), key,
+                                 grade, steps, solution))
+            if cursor.rowcount:
+                counts[difficulty] = counts.get(difficulty, 0) + 1
+                inserted += 1
+        saveCounts(db, counts)
+    return inserted
+
+def pickRandom(db, difficulty, counts, select=PICK_COLUMNS):
+    """Random puzzle row in this difficulty via the (pz_difficulty, pz_seq) index. None if empty"""
+    if not counts.get(difficulty):
+        return None
+    return db.execute(PICK_QUERY.format(select),
+                      (difficulty, random.randrange(counts[difficulty]))).fetchone()
+
+
+def pickRandomMany(db, difficulty, counts, n, select=PICK_COLUMNS):
+    """Up to n distinct random puzzle rows in this difficulty, in one query. Works on files that
+    haven't been migrated too (counts is None), with the old carved cell buckets"""
+    if counts is None:
+        low, high = CARVED_RANGES[difficulty]
+        return db.execute('SELECT {} FROM puzzle WHERE pz_carved_cells BETWEEN ? AND ? \
+                           ORDER BY random() LIMIT ?'.format(select), (low, high, n)).fetchall()
+    count = counts.get(difficulty, 0)
+    seqs = random.sample(range(count), min(n, count))
+    return db.execute('SELECT {} FROM puzzle WHERE pz_difficulty = ? AND pz_seq IN ({})'.format(
+        select, ','.join('?' * len(seqs))), [difficulty] + seqs).fetchall()
+
+def pack(src, dst):
+    """Writes a packed copy of the puzzle file open as src, to path dst (which mustn't exist
+    yet). Returns the new connection"""
+    out = sqlite3.connect(dst)
+    out.executescript(SCHEMA)
+    cols = columns(src, 'puzzle')
+    boards = [i for i, col in enumerate(cols) if col in ('pz_content', 'pz_solution')]
+    insert = 'INSERT INTO puzzle ({}) VALUES ({})'.format(', '.join(cols), ', '.join('?' * len(cols)))
+    rows = src.execute('SELECT {} FROM puzzle'.format(', '.join(cols)))
+
+    def packRow(row):
+        row = list(row)
+        for i in boards:
+            if row[i] is not None:
+                row[i] = decodeBoard(row[i]).toPacked()
+        return row
+
+    with out:
+        out.executemany(insert, map(packRow, rows))
+        out.execute(INDEX)
+        out.execute(CANON_INDEX)
+        saveCounts(out, loadCounts(src) or {})
+    out.execute('VACUUM')
+    return out
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Migrate a pseudoku puzzle file, and optionally pack it')
+    parser.add_argument('db', help='path to sqlite file')
+    parser.add_argument('--pack', metavar='DST', help='also write a packed copy here')
+    args = parser.parse_args()
+
+    db = sqlite3.connect(args.db)
+    migrate(db)
+    print(loadCounts(db))
+    if args.pack:
+        pack(db, args.pack).close()
+        print('{}: {} bytes -> {}: {} bytes'.format(args.db, os.path.getsize(args.db),
+                                                     args.pack, os.path.getsize(args.pack)))
+    db.close()
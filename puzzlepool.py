@@ -0,0 +1,55 @@
+# puzzlepool.py
+# in-memory pool of ready-to-serve puzzles for each difficulty, kept by a warm lambda container.
+# Puzzles are stored pre-decoded as compact sudolib.Board objects (81 bytes, plus the solution
+# if the file has them), and each difficulty is refilled in bulk with a single query when it
+# runs dry. So the hot path in getpuzzle is a list pop + shuffle, with no SQL.
+
+import random
+import time
+
+import puzzledb
+
+
+class PuzzlePool:
+    """Holds up to size decoded puzzles per difficulty. A difficulty's puzzles are thrown away
+    once they're older than maxAge seconds, so a long-lived container still rotates through
+    the whole DB instead of serving one batch forever."""
+
+    def __init__(self, db, counts=None, size=32, maxAge=600, select=puzzledb.PICK_COLUMNS):
+        self.db = db
+        self.counts = counts
+        self.select = select    # puzzledb.pickColumns(), to get solutions too
+        self.size = size
+        self.maxAge = maxAge
+        self.pools = {}         # difficulty -> list of (pz_id, Board, solution Board or None)
+        self.loaded = {}        # difficulty -> time of last refill
+
+    def popMany(self, difficulty, n):
+        """Returns up to n (pz_id, Board, solution) for this difficulty. Whatever the pool has
+        goes first, and only the shortfall comes from a refill (one query, of at least n, so
+        a batch bigger than the pool still comes back whole)"""
+        pool = self.pools.get(difficulty)
+        if not pool or time.monotonic() - self.loaded[difficulty] > self.maxAge:
+            pool = []
+        out = pool[-n:]
+        del pool[-n:]
+        if len(out) < n:
+            served = set(puzzle[0] for puzzle in out)
+            pool = [puzzle for puzzle in self.refill(difficulty, n) if puzzle[0] not in served]
+            self.pools[difficulty] = pool
+            more = n - len(out)
+            out += pool[-more:]
+            del pool[-more:]
+        return out
+
+    def refill(self, difficulty, n=0):
+        """Replaces the pool for difficulty with a fresh batch of size (or n, if that's more),
+        in one query"""
+        # (a file that hasn't been migrated gets the same bucket query getpuzzle used to run)
+        rows = puzzledb.pickRandomMany(self.db, difficulty, self.counts or None,
+                                       max(self.size, n), self.select)
+        pool = [puzzledb.decodeRow(row) for row in rows]
+        random.shuffle(pool)        # IN (...) comes back in index order
+        self.pools[difficulty] = pool
+        self.loaded[difficulty] = time.monotonic()
+        return pool
@@ -14,6 +14,19 @@ import * as timer     from "./modules/timer.js";
 const ENDPOINT = 'https://5kcv9tmm3k.execute-api.us-east-2.amazonaws.com/dev'; 
 const TIMER = new timer.Timer(); 
 
+// prefetch queue, only for skipping through puzzles: a puzzle's signed gentime starts when it's
+// fetched, so time spent waiting in the queue counts against the solver (and the timer on screen
+// doesn't show it). Puzzles are prefetched (PREFETCH at a time) only while the user is skipping
+// quickly, and go stale after a second, so a queued puzzle costs the solver at most that.
+const PREFETCH = 3;
+const QUEUE_LOW = 2;                // top up when fewer than this are left
+const QUEUE_MAX_AGE = 1000;         // ms
+const RAPID_SKIP = 1000;            // ms. Moving on this soon after a puzzle showed is skipping.
+                                    // No longer than QUEUE_MAX_AGE, or the prefetches go stale
+let puzzleQueue = {one: [], two: [], three: [], four: []};
+let queueFetching = {};
+let lastShown = 0;
+
 let clientState = {
     puzzleid: null,
     difficulty: 'one',
@@ -46,9 +59,36 @@ window.addEventListener("load", init);
 // --------- HIGH LEVEL ---------- //
 
 function getpuzzle(puzzleid) {
-    // fetch() from API and populate(). puzzleid can be int or one/two/three/four (which is 
+    // get a puzzle and populate(). puzzleid can be int or one/two/three/four (which is 
     // probably not the best choice). Also saves info to clientState, and sets up submit button callback
+    // Difficulties come out of the prefetch queue when it has any, so rapid "next"s don't wait
+    // on the API. Otherwise it's one puzzle per request, and nothing is fetched ahead
+
+    let queue = puzzleQueue[puzzleid];
+    if (!queue) {
+        fetchPuzzles(puzzleid, 1).then( (puzzles) => { if (puzzles.length) showPuzzle(puzzles[0]); } );
+        return;
+    }
 
+    // drop puzzles that sat around too long--their signed gentime would count against the timer
+    while (queue.length && Date.now() - queue[0].fetched > QUEUE_MAX_AGE) queue.shift();
+    let skipping = Date.now() - lastShown < RAPID_SKIP;
+
+    if (queue.length) {
+        showPuzzle(queue.shift().puzzle);
+        if (skipping) topUpQueue(puzzleid);
+    } else {
+        fetchPuzzles(puzzleid, skipping ? PREFETCH : 1).then( (puzzles) => {
+            if (!puzzles.length) return;
+            showPuzzle(puzzles.shift());
+            queuePuzzles(puzzleid, puzzles);
+        });
+    }
+}
+
+function fetchPuzzles(puzzleid, n) {
+    // fetch() n puzzles in one request. Resolves to a list of {data, hmac}, empty if the API
+    // had none (a 404 for an unknown puzzle id) or failed, so the current puzzle stays up
     let myHeaders = new Headers();
     myHeaders.append("Content-Type", "application/json");
 
@@ -59,11 +99,33 @@ function getpuzzle(puzzleid) {
         redirect: 'follow'
     };
 
-    fetch(ENDPOINT + "/getpuzzle/" + puzzleid, requestOptions)
-    .then( (indata) => indata.json() )
-    .then( (indata) => populate(indata) )
-    .then( (indata) => savePuzzleIdToClientState(indata) )
-    .then( (indata) => setUpSubmitButton(indata) );
+    // compact format: board and bitmap come as 81-char strings. See decodeGrid()
+    let url = ENDPOINT + "/getpuzzle/" + puzzleid + "?format=compact";
+    if (n > 1) url += "&n=" + n;
+    return fetch(url, requestOptions)
+    .then( (response) => response.ok ? response.json() : {puzzles: []} )
+    .then( (indata) => indata.puzzles || [indata] );
+}
+
+function showPuzzle(indata) {
+    lastShown = Date.now();
+    populate(indata);
+    savePuzzleIdToClientState(indata);
+    setUpSubmitButton(indata);
+}
+
+function topUpQueue(difficulty) {
+    // refill in the background once the queue runs low. One request in flight at a time
+    if (puzzleQueue[difficulty].length >= QUEUE_LOW || queueFetching[difficulty]) return;
+    queueFetching[difficulty] = true;
+    fetchPuzzles(difficulty, PREFETCH)
+    .then( (puzzles) => queuePuzzles(difficulty, puzzles) )
+    .finally( () => { queueFetching[difficulty] = false; } );
+}
+
+function queuePuzzles(difficulty, puzzles) {
+    let now = Date.now();
+    puzzles.forEach( (puzzle) => puzzleQueue[difficulty].push({puzzle: puzzle, fetched: now}) );
 }
 
 function submitpuzzle(outdata) {
@@ -124,11 +186,13 @@ function populate(indata) {
     // populates puzzle table using data from response object. Also resets and starts timer.
     // If no arg, it will clear the puzzle 
     let cell;
+    let board = indata && decodeGrid(indata.data.board);
+    let bitmap = indata && decodeGrid(indata.data.bitmap);
     for (let y=0; y<9; y++){
         for (let x=0; x<9; x++){
             cell = document.getElementById('a' + y + x).children[0];
-            if (indata && indata.data.bitmap[y][x]){
-                cell.value = indata.data.board[y][x];
+            if (indata && bitmap[y][x]){
+                cell.value = board[y][x];
                 cell.className = "serverCell";
                 cell.readOnly = true;
             } else {
@@ -142,6 +206,16 @@ function populate(indata) {
     TIMER.start();
     return indata // so that later functions in .then() chain can work
 }
+function decodeGrid(grid) {
+    // 81-char digit string (compact format) -> 9x9 array. Legacy 9x9 arrays pass straight
+    // through. The response data itself is left alone, since it goes back signed on submit
+    if (typeof grid !== "string") return grid;
+    let out = [];
+    for (let y=0; y<9; y++){
+        out.push(Array.from(grid.slice(y*9, y*9 + 9), Number));
+    }
+    return out;
+}
 function savePuzzleIdToClientState(indata){
     clientState['puzzleid'] = indata['data']['puzzleid'];
     return indata;
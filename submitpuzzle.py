@@ -1,14 +1,33 @@
 import json
+import os
 import time
 
 import authen
-import sudolib
+import highscore
+import metrics
+import validate
 
+initTimer = metrics.timer('submitpuzzle')   # reported with the first request, see metrics.py
+signer = authen.Signer(authen.TESTKEY1)     # keyed once per container
+# leaderboards. PSEUDOKU_HIGHSCORE_DB is a sqlite file; without it they only last as long as
+# the container, which is fine locally but not for real
+HIGHSCORE_DB = os.environ.get('PSEUDOKU_HIGHSCORE_DB')
+highscores = highscore.HighScores(highscore.SQLiteStore(HIGHSCORE_DB) if HIGHSCORE_DB
+                                  else highscore.MemoryStore())
+initTimer.mark('highscore')
 
 def lambda_handler(event, context):
+    global initTimer
+    timer = metrics.timer('submitpuzzle', init=initTimer)
+    initTimer = None
+
     # first check to make sure data we're using is valid
     indata = event
-    if not authen.checkHMAC(indata['data'], indata['hmac'], authen.TESTKEY1):
+    verified = signer.verify(indata['data'], indata['hmac'])
+    timer.mark('hmac')
+    if not verified:
+        timer.set('error', 'hmac')
+        timer.emit()
         return "error"                                    
 
     # calculate user time to solve, prep outgoing data
@@ -21,12 +40,28 @@ def lambda_handler(event, context):
             "newhighscore": False,
     }
 
-    # check for completion
-    if sudolib.checkComplete(indata['submission']) and sudolib.checkConsistent(indata['submission']):
+    # check for completion. New tokens carry a digest of the solution, so that's one compare
+    # (and it can't be passed without keeping the clues). Older ones get the full check
+    if 'solution' in indata['data']:
+        outdata['complete'] = signer.checkDigest(indata['submission'], indata['data']['solution'])
+    elif (validate.validateBoard(indata['submission'])
+          and validate.keepsClues(indata['submission'], indata['data']['board'])):
         outdata['complete'] = True
+    timer.mark('validate')
+    timer.set('digest', 'solution' in indata['data'])
+    timer.set('complete', outdata['complete'])
+
+    # solves go up on the puzzle's leaderboard, and its difficulty's if it was asked for by one
+    if outdata['complete']:
+        outdata['HSrecordid'], outdata['newhighscore'] = highscores.record(
+            indata['data']['puzzleid'], indata['data'].get('difficulty'), usertime,
+            indata.get('username'))
+        timer.mark('highscore')
 
     # authenticate outgoing data and return as json
-    hmac = authen.getHMAC(outdata, authen.TESTKEY1)
+    hmac = signer.sign(outdata)
+    timer.mark('sign')
+    timer.emit()
     return {
 		"isBase64Encoded": True,
 		"statusCode": 200,
@@ -14,6 +14,10 @@ in board, that creates a cache of possible values.
 uniqueCheck() compares *possible values* for a given cell, against possible values 
 for its entire row/sqr/col. If there's a unique possible value, it must be answer.
 
+Under the hood these all run on the BITMASK ENGINE (MaskBoard). It holds the board as 81
+cells plus a digit bitmask per row/col/sqr, and updates the masks as cells get placed, so we
+never rebuild the possibility cache from scratch while solving.
+
 Solve() runs checkunique over and over, until hopefully puzzle is solved. THere's also
 a recursion clause, where we make an arbitrary guess about a hard cell and check it.
 
@@ -22,10 +26,13 @@ running solve() on entire board to catch any determined cells. Usually this resu
 legal board, but if not, it repeats until we get legal.
 
 Once we have full and legal board, we run carve() to randomly remove cells (while
-keeping puzzle solveable. We have to check that puzzle is solveable for each removed
-cell, but thankfully solve() is fast. At first we remove random cells, at end we loop
+keeping puzzle solveable. We have to check that puzzle still has exactly one solution for
+each removed cell, but thankfully countSolutions() is fast--it stops as soon as it finds
+a second solution. At first we remove random cells, at end we loop
 through all to get any remaining unnecessary cells.
 
+iterPuzzles() streams puzzles from a process pool, for scripts that want lots of them.
+
 
 STORAGE section just includes utitilities for storing a given puzzle in DB. We normalize
 the puzzle, eg rotate it (consistently) and order it--this prevents us from storing different
@@ -33,11 +40,91 @@ permutations of the same underlying puzzle. On retrieving a puzzle, we use shuff
 and un-order it, creating a different random permutation each time its retrieved.
 
 We use stringify() and unstringify() to serialize a puzzle into a string, for storage.
+
+Boards are normally 9 lists of 9 ints. Board is a compact alternative (one flat 81-byte
+array) for hot paths like the lambdas--it indexes the same way (board[y][x]), and functions
+that build new boards give back whichever kind they were passed.
 """
 
 
+import hashlib
+import itertools
+import operator
 import random
 import time
+from array import array
+
+
+#---------------INDEX TABLES-----------------#
+
+# Everything in the lib that walks a row/col/sqr uses these, instead of building a fresh
+# generator per call. They're computed once at import. A cell is either a (y, x) coord or a
+# flat index i = y*9 + x.
+
+COORDS = tuple(divmod(i, 9) for i in range(81))
+CELL_ROW = tuple(i // 9 for i in range(81))
+CELL_COL = tuple(i % 9 for i in range(81))
+CELL_SQR = tuple((i // 27) * 3 + (i % 9) // 3 for i in range(81))
+
+# the 27 units (9 rows, then 9 cols, then 9 sqrs), the 3 units of each cell, and the 20 peers
+# of each cell (every other cell that shares a unit with it)
+UNITS = (tuple(tuple(y*9 + x for x in range(9)) for y in range(9))            # rows
+        + tuple(tuple(y*9 + x for y in range(9)) for x in range(9))           # cols
+        + tuple(tuple(i for i in range(81) if CELL_SQR[i] == s) for s in range(9)))  # sqrs
+CELL_UNITS = tuple((UNITS[CELL_ROW[i]], UNITS[9 + CELL_COL[i]], UNITS[18 + CELL_SQR[i]])
+                   for i in range(81))
+PEERS = tuple(tuple(sorted(set(CELL_UNITS[i][0] + CELL_UNITS[i][1] + CELL_UNITS[i][2]) - {i}))
+              for i in range(81))
+
+# coords of the unit each cell is in, inclusive and exclusive of the cell itself
+def unitCoords(kind, inclusive):
+    return tuple(tuple(COORDS[j] for j in CELL_UNITS[i][kind] if inclusive or j != i)
+                 for i in range(81))
+
+ROW_COORDS, ROW_PEER_COORDS = unitCoords(0, True), unitCoords(0, False)
+COL_COORDS, COL_PEER_COORDS = unitCoords(1, True), unitCoords(1, False)
+SQR_COORDS, SQR_PEER_COORDS = unitCoords(2, True), unitCoords(2, False)
+PEER_COORDS = tuple(tuple(COORDS[j] for j in PEERS[i]) for i in range(81))
+
+EXCLUSIVE_COORDS = tuple(((y*3 + y//3 + x) % 9, x) for y in range(9) for x in range(9))
+FUNNY_COORDS = tuple((cy*3 + cy2, cx*3 + cx2)
+                     for cx, cy in zip([0,1,2,0,1,2,0,1,2], [0,1,2,2,0,1,1,2,0])
+                     for cx2, cy2 in zip([0,1,2,0,1,2,0,1,2], [0,1,2,2,0,1,1,2,0]))
+
+# ROTATIONS[r][i] is the cell that ends up at index i after r clockwise 90 degree turns
+ROTATE_CW = tuple((8 - i % 9) * 9 + i // 9 for i in range(81))
+ROTATIONS = (tuple(range(81)),
+             ROTATE_CW,
+             tuple(ROTATE_CW[j] for j in ROTATE_CW),
+             tuple(ROTATE_CW[ROTATE_CW[j]] for j in ROTATE_CW))
+
+# rotateNormal() weights. SIDE_WEIGHTS[side][i] is what a filled cell i adds to that side's
+# score (sides are top, right, bottom, left). Kept as ints (x1000) so sums compare exactly.
+def sideWeights():
+    top = [0] * 81
+    for y, weight in ((0, 1114), (1, 1326), (2, 1453)):
+        for x in range(9):
+            top[y*9 + x] += weight
+    for sqr, weight in ((0, 1242), (1, 1141), (2, 1242)):
+        for i in UNITS[18 + sqr]:
+            top[i] += weight
+    # the right side is the top side turned clockwise, and so on
+    sides = [tuple(top)]
+    for _ in range(3):
+        prev = sides[-1]
+        sides.append(tuple(prev[ROTATE_CW[i]] for i in range(81)))
+    return tuple(sides)
+
+SIDE_WEIGHTS = sideWeights()
+
+# byte translation tables between pz_content characters and raw cell values
+DIGIT_BYTES = bytes.maketrans(b'0123456789', bytes(range(10)))
+BYTE_DIGITS = bytes.maketrans(bytes(range(10)), b'0123456789')
+# packed byte -> its high / low nibble, for Board.fromPacked()
+HIGH_NIBBLE = bytes(b >> 4 for b in range(256))
+LOW_NIBBLE = bytes(b & 15 for b in range(256))
+# cell value -> 1 if given, 0 if not, for getBitmap()
+BITMAP_BYTES = bytes(1) + bytes([1]) * 255
 
 
 #---------------BOARD UTILITY----------------#
@@ -95,6 +182,72 @@ if True:
             [4, 8, 7, 2, 9, 6, 1, 5, 3], 
             [9, 1, 2, 3, 7, 5, 6, 4, 8]]
 
+class Board:
+    """Compact board: 81 cells in one flat signed-byte array (index = y*9 + x), instead of 9
+    lists of 9 ints. board[y] is a zero-copy view of the row, so board[y][x] reads and writes
+    just like on a list board, and the rest of the lib takes either kind. Functions that build
+    a new board hand back the same kind they were given."""
+
+    __slots__ = ('cells',)
+    __hash__ = None
+
+    def __init__(self, cells=None):
+        self.cells = array('b', bytes(81) if cells is None else cells)
+
+    @classmethod
+    def fromRows(cls, rows):
+        return cls([value for row in rows for value in row])
+
+    @classmethod
+    def fromString(cls, boardString):
+        """from stringify()/pz_content format"""
+        return cls(boardString.replace(';', '').encode().translate(DIGIT_BYTES))
+
+    def toRows(self):
+        flat = self.cells.tolist()
+        return [flat[y:y+9] for y in range(0, 81, 9)]
+
+    def toString(self):
+        flat = self.cells.tobytes().translate(BYTE_DIGITS).decode()
+        return ';'.join(flat[y:y+9] for y in range(0, 81, 9))
+
+    def toDigits(self):
+        """81 digit characters, no separators. fromString() reads this too"""
+        return self.cells.tobytes().translate(BYTE_DIGITS).decode()
+
+    @classmethod
+    def fromPacked(cls, packed):
+        """from toPacked()'s 41 bytes"""
+        cells = bytearray(82)
+        cells[0::2] = packed.translate(HIGH_NIBBLE)
+        cells[1::2] = packed.translate(LOW_NIBBLE)
+        return cls(cells[:81])
+
+    def toPacked(self):
+        """41 bytes, two cells per byte (high nibble first, last low nibble unused)"""
+        c = self.cells.tolist() + [0]
+        return bytes([c[i] << 4 | c[i + 1] for i in range(0, 82, 2)])
+
+    def copy(self):
+        return Board(self.cells)
+
+    def __getitem__(self, y):
+        return memoryview(self.cells)[y*9:y*9+9]
+
+    def __len__(self):
+        return 9
+
+    def __iter__(self):
+        return (self[y] for y in range(9))
+
+    def __eq__(self, other):
+        if isinstance(other, Board):
+            return self.cells == other.cells
+        return self.toRows() == other
+
+    def __repr__(self):
+        return 'Board({!r})'.format(self.toString())
+
 def getEmptyBoard():
     out = [[0,0,0,0,0,0,0,0,0],
             [0,0,0,0,0,0,0,0,0],
@@ -127,125 +280,95 @@ def printBoard(board, hidezeros=True):
         
 def copyBoard(board):
     """Normally assigning a var to an existing board just copies the reference. this creates a 
-    entire new copy. Use with getEmptyBoard() as the copy"""
-    copy = getEmptyBoard()
-    for y, x in fullGen():
-        copy[y][x] = board[y][x]
-    return copy
+    entire new copy."""
+    if isinstance(board, Board):
+        return board.copy()
+    return [list(row) for row in board]
+
+def flatten(board):
+    """The 81 cell values in index order (y*9 + x), for either kind of board"""
+    if isinstance(board, Board):
+        return board.cells
+    return [value for row in board for value in row]
 
 def getBitmap(board):
     """has 1 for all given cells, 0 for undecided cells"""
-    out = getEmptyBoard()
-    for y, x in fullGen():
-        if board[y][x] != 0:
-            out[y][x] = 1
-    return out
+    if isinstance(board, Board):
+        return Board(board.cells.tobytes().translate(BITMAP_BYTES))
+    return [[1 if value else 0 for value in row] for row in board]
 
 def getOrigPermutation(board, bitmap):
-    """Returns original problem board, based on bitmap
-    
-    I'm sure there's an elegant (complex) one-liner that could accomplish this,
-    with nested generators. But this is easier I think.
-    """
-    out = getEmptyBoard()
-    for y, x in fullGen():
-        out[y][x] = board[y][x] * bitmap[y][x]
-    return out
+    """Returns original problem board, based on bitmap"""
+    return [[value * bit for value, bit in zip(row, bits)] for row, bits in zip(board, bitmap)]
 
 # generators to return coordinates of each cell in a row, column, or square. Replace nested loops.
+# These just walk the precomputed INDEX TABLES now--hot code should use the tables directly.
 def rowGen(y, x, inclusive=True):
     """Return generator that gives coord tuples (y,x) for this row"""
-    return ((y, x1) for x1 in range(9) if (inclusive) or (x1 != x))
+    return iter((ROW_COORDS if inclusive else ROW_PEER_COORDS)[y*9 + x])
             
 def colGen(y, x, inclusive=True):
     """Return generator that gives coord tuples (y,x) for the col"""
-    return ((y1, x) for y1 in range(9) if (inclusive) or (y1 != y))
+    return iter((COL_COORDS if inclusive else COL_PEER_COORDS)[y*9 + x])
                 
 def sqrGen(y, x, inclusive=True):
     """Return generator that gives coord tuples (y,x) for the sqr"""
-    cY = (y // 3) * 3   # calculate top-left corner of square, for
-    cX = (x // 3) * 3   # the provided cell
-    return ((y1, x1) for y1 in range(cY, cY+3) for x1 in range(cX, cX+3)
-            if (inclusive) or (y1 != y) or (x1 != x))
+    return iter((SQR_COORDS if inclusive else SQR_PEER_COORDS)[y*9 + x])
 
 def fullGen():
     """Returns generator that gives coord tuples (y,x) for whole board"""
-    return ((y1, x1) for y1 in range(9) for x1 in range(9))
+    return iter(COORDS)
             
 def exclusiveGen():
-    a = lambda x, y: ((x*3 + x//3 + y) % 9)
-    return ((a(y1, x1), x1) for y1 in range(9) for x1 in range(9)) 
+    return iter(EXCLUSIVE_COORDS)
 
 def funnyGen():
-    xs = [0,1,2,0,1,2,0,1,2]
-    ys = [0,1,2,2,0,1,1,2,0]
-    for sqr in range(9):
-        cornerY = ys[sqr] * 3
-        cornerX = xs[sqr] * 3
-        for cel in range(9):
-            yield cornerY + ys[cel], cornerX + xs[cel]
+    return iter(FUNNY_COORDS)
 
 def rotate(start, rotates=1):
     """spins board clockwise 90 degrees for each 'rotate'. Returns new board"""
-    workboard = copyBoard(start)
-    for i in range(rotates):
-        temp = getEmptyBoard()
-        for y, x in fullGen():
-            y1 = x 
-            x1 = abs(8 - y)
-            temp[y1][x1] = workboard[y][x]
-        workboard = temp
-    return workboard 
+    rotation = ROTATIONS[rotates % 4]
+    if isinstance(start, Board):
+        cells = start.cells
+        return Board([cells[j] for j in rotation])
+    flat = flatten(start)
+    flat = [flat[j] for j in rotation]
+    return [flat[y:y+9] for y in range(0, 81, 9)]
     
 
 #---------------GET VALUES-------------------#
 
 # Return list of KNOWN values within a row/sqr/col.         
-def getRowVals(board, y, x, inclusive=True):
-    """Returns list of values of already set cells in row"""
+def unitVals(board, y, x, coords):
     out = []
-    for y1, x1 in rowGen(y, x, inclusive=inclusive):
-        if board[y1][x1] == 0:
+    single = type(board[y][x]) == int      # normal board, rather than a cache board of sets
+    for y1, x1 in coords:
+        value = board[y1][x1]
+        if value == 0:
             continue 
-        elif type(board[y][x]) == int:
-            out.append(board[y1][x1])
+        elif single:
+            out.append(value)
         else:
-            out += board[y1][x1]
-    return out   
+            out += value
+    return out
+
+def getRowVals(board, y, x, inclusive=True):
+    """Returns list of values of already set cells in row"""
+    return unitVals(board, y, x, (ROW_COORDS if inclusive else ROW_PEER_COORDS)[y*9 + x])
     
 def getColVals(board, y, x, inclusive=True):
     """Returns list of values of already set cells in col"""
-    out = []
-    for y1, x1 in colGen(y, x, inclusive=inclusive):
-        if board[y1][x1] == 0:
-            continue 
-        elif type(board[y][x]) == int:
-            out.append(board[y1][x1])
-        else:
-            out += board[y1][x1]
-    return out
+    return unitVals(board, y, x, (COL_COORDS if inclusive else COL_PEER_COORDS)[y*9 + x])
 
 def getSqrVals(board, y, x, inclusive=True):
     """Returns list of values of already set cells in sqr"""
-    out = []
-    for y1, x1 in sqrGen(y, x, inclusive=inclusive):
-        if board[y1][x1] == 0:
-            continue 
-        elif type(board[y][x]) == int:
-            out.append(board[y1][x1])
-        else:
-            out += board[y1][x1]
-    return out
+    return unitVals(board, y, x, (SQR_COORDS if inclusive else SQR_PEER_COORDS)[y*9 + x])
 
 def getPoss(board, y, x):
     """Returns set of possible values for a cell. Returns single-value set if cell is decided."""
     if board[y][x] != 0:
         return [board[y][x]]
-
-    return ({1,2,3,4,5,6,7,8,9}
-            -set(getRowVals(board, y, x))
-            -set(getColVals(board, y, x))
-            -set(getSqrVals(board, y, x)))
+    return {1,2,3,4,5,6,7,8,9} - {board[y1][x1] for y1, x1 in PEER_COORDS[y*9 + x]}
 
 def countZeros(board):
     """Returns count of zeros (eg carved cells) in a provided board. 
@@ -254,137 +377,347 @@ def countZeros(board):
     
     if type(board) == str:
         return board.count('0')
-        
-    zeros = 0
-    for y, x in fullGen():
-        if board[y][x] == 0:
-            zeros += 1
-    return zeros
+    return flatten(board).count(0)
+
+
+#---------------BITMASK ENGINE---------------#
+
+# The engine keeps the board as a flat list of 81 cells (index = y*9 + x), plus one bitmask
+# per row, col and sqr holding the digits already placed in that unit. Digit d is bit (1 << d),
+# so a cell's possibilities are just ALL_DIGITS & ~(row | col | sqr). Placing a value only
+# touches three masks, instead of rebuilding a whole cache board.
+
+ALL_DIGITS = 0b1111111110
+MASK_DIGITS = tuple(tuple(d for d in range(1, 10) if m >> d & 1) for m in range(1024))
+MASK_COUNT = tuple(len(digits) for digits in MASK_DIGITS)
+CELL_RCS = tuple(zip(CELL_ROW, CELL_COL, CELL_SQR))
+
+
+class MaskBoard:
+    """Mutable solver state. Unlike the rest of the lib this is NOT pure--place() and propagate()
+    change it in place. To branch, take a checkpoint(), try something, and rollback() to it:
+    every cell write goes on an undo trail, so undoing only touches the cells that changed
+    (plus the 27 unit masks, which are saved whole). copy() still works too, for when you want
+    to keep both."""
+
+    __slots__ = ('cells', 'rows', 'cols', 'sqrs', 'broken', 'trail')
+
+    def __init__(self, board=None):
+        self.cells = [0] * 81
+        self.rows = [0] * 9
+        self.cols = [0] * 9
+        self.sqrs = [0] * 9
+        self.broken = False         # raised once we hit a contradiction
+        self.trail = []             # cells written since construction, for rollback()
+        if board is not None:
+            flat = board.cells if isinstance(board, Board) else [v for row in board for v in row]
+            for i, value in enumerate(flat):
+                if value > 0:
+                    self.place(i, value)
+                elif value < 0:     # keep error cells, they already fail the board
+                    self.cells[i] = value
+                    self.broken = True
+            self.trail = []
+
+    def copy(self):
+        out = MaskBoard.__new__(MaskBoard)
+        out.cells = self.cells[:]
+        out.rows = self.rows[:]
+        out.cols = self.cols[:]
+        out.sqrs = self.sqrs[:]
+        out.broken = self.broken
+        out.trail = []
+        return out
+
+    def checkpoint(self):
+        """Marks the current state, for rollback()"""
+        return len(self.trail), self.broken, self.rows[:], self.cols[:], self.sqrs[:]
+
+    def rollback(self, mark):
+        """Undoes every write since checkpoint() returned mark"""
+        length, self.broken, rows, cols, sqrs = mark
+        trail, cells = self.trail, self.cells
+        for i in trail[length:]:
+            cells[i] = 0
+        del trail[length:]
+        self.rows[:] = rows
+        self.cols[:] = cols
+        self.sqrs[:] = sqrs
+
+    def toBoard(self, like=None):
+        """list board, or a Board if like (the board we were given) is one"""
+        if isinstance(like, Board):
+            return Board(self.cells)
+        c = self.cells
+        return [c[y:y+9] for y in range(0, 81, 9)]
+
+    def candidates(self, i):
+        """bitmask of possible values for cell i (only meaningful for empty cells)"""
+        return ALL_DIGITS & ~(self.rows[CELL_ROW[i]] | self.cols[CELL_COL[i]] | self.sqrs[CELL_SQR[i]])
+
+    def place(self, i, value):
+        """Sets cell i and updates unit masks. Returns False (and marks board broken) if value clashes"""
+        bit = 1 << value
+        r, c, s = CELL_ROW[i], CELL_COL[i], CELL_SQR[i]
+        self.cells[i] = value
+        self.trail.append(i)
+        if (self.rows[r] | self.cols[c] | self.sqrs[s]) & bit:
+            self.broken = True
+            return False
+        self.rows[r] |= bit
+        self.cols[c] |= bit
+        self.sqrs[s] |= bit
+        return True
+
+    def assign(self, i, value):
+        """place() plus propagate(). Returns False if that hits a contradiction"""
+        return self.place(i, value) and self.propagate()
+
+    def remove(self, i):
+        """Clears cell i (which has to hold a value that placed cleanly). Undoes place(), but
+        isn't recorded on the trail--use rollback() to undo a branch"""
+        bit = ~(1 << self.cells[i])
+        self.cells[i] = 0
+        self.rows[CELL_ROW[i]] &= bit
+        self.cols[CELL_COL[i]] &= bit
+        self.sqrs[CELL_SQR[i]] &= bit
+
+    def unique(self, i):
+        """Same contract as uniqueCheck(): 1-9 if determined, 0 if inconclusive, -1 if no possibilities"""
+        cand = self.candidates(i)
+        if MASK_COUNT[cand] == 1:
+            return MASK_DIGITS[cand][0]
+        elif cand == 0:
+            return -1
+
+        cells = self.cells
+        for unit in CELL_UNITS[i]:
+            others = 0
+            for j in unit:
+                if j == i:
+                    continue
+                others |= (1 << cells[j]) if cells[j] else self.candidates(j)
+            if cand & ~others:
+                return MASK_DIGITS[cand & ~others][0]
+        return 0
+
+    def propagate(self):
+        """Fills naked and hidden singles until nothing changes. Returns False on contradiction,
+        with the offending cell set to -1 (like uniqueCheck)."""
+        cells, rows, cols, sqrs = self.cells, self.rows, self.cols, self.sqrs
+        changed = True
+        while changed:
+            changed = False
+
+            # naked singles: cell has only one possibility
+            for i in range(81):
+                if cells[i] == 0:
+                    r, c, s = CELL_RCS[i]
+                    cand = ALL_DIGITS & ~(rows[r] | cols[c] | sqrs[s])
+                    if cand == 0:
+                        cells[i] = -1
+                        self.trail.append(i)
+                        self.broken = True
+                        return False
+                    if MASK_COUNT[cand] == 1:
+                        self.place(i, MASK_DIGITS[cand][0])
+                        changed = True
+
+            # hidden singles: value has only one possible cell in a unit
+            for unit in UNITS:
+                once, twice = 0, 0
+                for j in unit:
+                    if cells[j] == 0:
+                        r, c, s = CELL_RCS[j]
+                        cand = ALL_DIGITS & ~(rows[r] | cols[c] | sqrs[s])
+                        twice |= once & cand
+                        once |= cand
+                hidden = once & ~twice
+                if not hidden:
+                    continue
+                for j in unit:
+                    if cells[j] == 0 and self.candidates(j) & hidden:
+                        value = MASK_DIGITS[self.candidates(j) & hidden][0]
+                        if not self.place(j, value):
+                            cells[j] = -1
+                            return False
+                        changed = True
+        return not self.broken
+
+    def complete(self):
+        return 0 not in self.cells
+
+
+def solveMask(mb, nest=0):
+    """solve(), but over a MaskBoard. Changes mb, and returns the board holding the result
+    (which might be a copy of a solved branch rather than mb)"""
+    mb.propagate()
+    if mb.broken:
+        return mb
+    solved = mb.complete()
+
+    #recurse clause (up to 3 times)
+    if not solved and nest < 3:
+        lp, lpCand = 0, 0       #lynchpin cell. Find cell with most possibilities.
+        for i in range(81):
+            if mb.cells[i] == 0:
+                cand = mb.candidates(i)
+                if MASK_COUNT[cand] > MASK_COUNT[lpCand]:
+                    lp, lpCand = i, cand
+
+        #now we check EACH possibility for lynchpin, to see if we get a solve
+        #(once one works, the later branches used to start from that solved board and clash
+        #straight away, so we just stop at the first one)
+        for value in MASK_DIGITS[lpCand]:
+            mark = mb.checkpoint()              #branch in place, and roll back after
+            mb.place(lp, value)                 #make assumption about lynchpin
+            test = solveMask(mb, nest=nest+1)
+
+            if test.complete() and not test.broken:
+                return test
+            mb.rollback(mark)
+    return mb
+
+def countMask(mb, limit=2):
+    """Exact backtracking search over a MaskBoard. Counts solutions, but gives up as soon as it
+    has found limit of them. Changes mb."""
+    if not mb.propagate():
+        return 0
+    if mb.complete():
+        return 1
+
+    #branch on the most constrained cell (fewest possibilities), so the tree stays narrow
+    cells, rows, cols, sqrs = mb.cells, mb.rows, mb.cols, mb.sqrs
+    best, bestCand = -1, 0
+    for i in range(81):
+        if cells[i] == 0:
+            r, c, s = CELL_RCS[i]
+            cand = ALL_DIGITS & ~(rows[r] | cols[c] | sqrs[s])
+            if best < 0 or MASK_COUNT[cand] < MASK_COUNT[bestCand]:
+                best, bestCand = i, cand
+                if MASK_COUNT[cand] == 2:
+                    break
+
+    found = 0
+    for value in MASK_DIGITS[bestCand]:
+        mark = mb.checkpoint()
+        mb.place(best, value)
+        found += countMask(mb, limit - found)
+        mb.rollback(mark)
+        if found >= limit:
+            break
+    return found
+
+def countSolutions(board, limit=2):
+    """Returns number of solutions for board, capped at limit. With the default limit=2 this is a
+    uniqueness check: 0 is unsolveable, 1 is a proper puzzle, 2 means ambiguous."""
+    return countMask(MaskBoard(board), limit=limit)
+
+def findMask(mb):
+    """countMask()'s search, but stops at the first solution. Returns a solved MaskBoard, or
+    None if there isn't one. Changes mb."""
+    if not mb.propagate():
+        return None
+    if mb.complete():
+        return mb.copy()
+
+    cells, rows, cols, sqrs = mb.cells, mb.rows, mb.cols, mb.sqrs
+    best, bestCand = -1, 0
+    for i in range(81):
+        if cells[i] == 0:
+            r, c, s = CELL_RCS[i]
+            cand = ALL_DIGITS & ~(rows[r] | cols[c] | sqrs[s])
+            if best < 0 or MASK_COUNT[cand] < MASK_COUNT[bestCand]:
+                best, bestCand = i, cand
+                if MASK_COUNT[cand] == 2:
+                    break
+
+    for value in MASK_DIGITS[bestCand]:
+        mark = mb.checkpoint()
+        mb.place(best, value)
+        solved = findMask(mb)
+        if solved is not None:
+            return solved
+        mb.rollback(mark)
+    return None
+
+def solveExact(board):
+    """Solution of board (same kind of board as given), or None if it has none. Unlike solve()
+    this searches as deep as it needs to, so it always finishes a valid puzzle. For a puzzle
+    with several solutions it's whichever one turns up first."""
+    solved = findMask(MaskBoard(board))
+    return None if solved is None else solved.toBoard(like=board)
+
 
 #---------------SOLVER-----------------------#
 
 def generateCache(board):
     """returns parallel cache board, holding set of possibilities for each cell"""
-    out = getEmptyBoard()
-    for y, x in fullGen():
-        out[y][x] = getPoss(board, y, x)
+    mb = MaskBoard(board)
+    out = mb.toBoard()
+    for i in range(81):
+        y, x = CELL_ROW[i], CELL_COL[i]
+        if out[y][x] == 0:
+            out[y][x] = set(MASK_DIGITS[mb.candidates(i)])
+        else:
+            out[y][x] = [out[y][x]]
     return out
-    
+
 def uniqueCheck(board, y, x, cache=None):
-    """Tries to solve cell. Return 1-9 if found, 0 if inconclusive, -1 if no possibilities. 
-    
-        Looks like this is 16x faster w cache provided. Also if we calc cache here, we're doing a lot of
-        work to get possibilities for cells we won't access. 
-        
-        Works by getting the set of possible values
-        for the cell, then comparing with the possible values for every other cell in its row/col/sqr.
+    """Tries to solve cell. Return 1-9 if found, 0 if inconclusive, -1 if no possibilities.
+
+        Works by getting the set of possible values for the cell, then comparing with the possible
+        values for every other cell in its row/col/sqr. The masks are cheap enough to rebuild that
+        cache is no longer needed--it's only kept so old callers don't break.
     """
-    
-    #run cheap, naive checks first
-    cellPoss = getPoss(board, y, x)
-    if len(cellPoss) == 1:      #if cell has one poss, must be answer
-        return cellPoss.pop()
-    elif len(cellPoss) == 0:    #if no poss for cell, must be error in board
-        return -1
-
-    #if no cache, we do have to generate one
-    if cache == None:
-        cache = generateCache(board)
+    if board[y][x] != 0:
+        return board[y][x]
+    return MaskBoard(board).unique(y*9 + x)
 
-    #compare cell possibilities to unit possibilities. Looking for UNIQUE poss in cell
-    if cellPoss - set(getRowVals(cache, y, x, inclusive=False)):
-        return (cellPoss - set(getRowVals(cache, y, x, inclusive=False))).pop()
-    if cellPoss - set(getColVals(cache, y, x, inclusive=False)):
-        return (cellPoss - set(getColVals(cache, y, x, inclusive=False))).pop()
-    if cellPoss - set(getSqrVals(cache, y, x, inclusive=False)):
-        return (cellPoss - set(getSqrVals(cache, y, x, inclusive=False))).pop()
-    
-    #if inconclusive, just return nothing
-    return 0
-            
 def solve(board, nest=0):
-    """This is best-effort solve. Tries its best, but may return an incomplete or inconsistent 
-        board. If error, should have that cell as -1. 
+    """This is best-effort solve. Tries its best, but may return an incomplete or inconsistent
+        board. If error, should have that cell as -1.
     """
-    wb = copyBoard(board)   #pure function--dont change original board arg
-    c = generateCache(wb)
-    solved = False
-    changed = True
-
-    while not solved and changed:           # iterate over board
-        changed = False
-        for y, x in fullGen():              # use uniqueCheck() against whole board
-            if wb[y][x] == 0:               # but skip already solved cells
-                wb[y][x] = uniqueCheck(wb, y, x, cache=c)
-                if wb[y][x] > 0:
-                    c = generateCache(wb)       #regen cache if we hit an answer
-                    changed = True              #if solved, raise the flag
-
-        if checkComplete(wb):               #now check if it's finished
-            solved = True
-
-    #recurse clause (up to 3 times)
-    if not solved and nest < 3:
-        lpy, lpx = 0, 0     #lynchpin cell coords. Find cell with most possibilities.
-        for y, x in fullGen():
-            if len(c[y][x]) > len(c[lpy][lpx]):
-                lpy, lpx = y, x
-
-        #now we check EACH possibility for lynchpin, to see if we get a solve
-        for value in c[lpy][lpx]:
-            testWB = copyBoard(wb)              #testWB is a branch--doesn't change orig state of wb
-            testWB[lpy][lpx] = value            #make assumption about lynchpin  
-            testWB = solve(testWB, nest=nest+1) #try to solve
-
-            if checkComplete(testWB) and checkConsistent(testWB):
-                if not solved:
-                    wb = testWB
-                    solved = True
-                else:                           #if board already solved, means multiple solutions
-                    print("Error: recursion uncovered multiple valid solutions")
-                    wb[0][0] = 0                #in case of multiple valid solutions, fail the board
-
     #output the now-solved (maybe incomplete) (and maybe inconsistent) board
-    return wb 
+    return solveMask(MaskBoard(board), nest=nest).toBoard(like=board)
 
 def checkComplete(board):
     """Naive check whether each cell has been filled (or if its still 0)"""
-    for y, x in fullGen():
-        if board[y][x] == 0:
-            return False 
-    return True
+    return 0 not in flatten(board)
         
 def checkConsistent(board):
-    """Loop through board. If a cell matches another cell in its unit, its not consistent"""
+    """Loop through units. If a cell matches another cell in its unit, its not consistent"""
+    flat = flatten(board)
 
     #check for -1 first, this automatically means error
-    if not checkConsistentCheap(board):
+    if -1 in flat:
         return False
     
-    for y, x in fullGen():
-        if board[y][x] == 0:    #ignore unset cells
-            continue  
-
-        temp = (  
-            getRowVals(board, y, x, inclusive=False) 
-            + getColVals(board, y, x, inclusive=False)
-            + getSqrVals(board, y, x, inclusive=False)
-        )
-        if board[y][x] in temp:
+    for unit in UNITS:
+        values = [flat[i] for i in unit if flat[i] != 0]    #ignore unset cells
+        if len(values) != len(set(values)):
             return False
-
     return True
 
 def checkConsistentCheap(board):
-    for y, x in fullGen():
-        if board[y][x] == -1:
-            return False
-    return True
+    return -1 not in flatten(board)
 
 
 #---------------GENERATOR--------------------#
 
-def picker(board, y, x, cache=None):
+# Everything random in the lib takes an optional rng: a random.Random, or a seed to make one.
+# Left off, it's the global random module like always. Pass your own to get a reproducible
+# workload, or so parallel workers each have their own stream.
+
+def getRNG(rng=None):
+    """rng argument -> something with the random module's methods"""
+    if rng is None:
+        return random
+    if rng is random or isinstance(rng, random.Random):
+        return rng
+    return random.Random(rng)
+
+def picker(board, y, x, cache=None, rng=None):
     #short-circuit, if y/x has val already
     if board[y][x] != 0:    
         return board[y][x]
@@ -401,80 +734,159 @@ def picker(board, y, x, cache=None):
     # if no existing val, solve, or error, pick randomly from valid opt    
     else:             
         options = list(cache[y][x])
-        return options[random.randint(0, len(options)-1)]
+        return options[getRNG(rng).randint(0, len(options)-1)]
 
-def generate():
+def generate(rng=None):
+    rng = getRNG(rng)
     done = False
     while not done:
-        n = getEmptyBoard()
-        for y, x in fullGen():          # loop through entire board
-            n[y][x] = picker(n, y, x)   # picker solves cell if possible, otherwise gives random
+        mb = MaskBoard()
+        for i in range(81):             # loop through entire board
+            if mb.cells[i] == 0:        # same as picker(): solve cell if possible, otherwise random
+                value = mb.unique(i)
+                if value == 0:
+                    options = MASK_DIGITS[mb.candidates(i)]
+                    value = options[rng.randint(0, len(options)-1)]
+                if value < 0:
+                    break
+                mb.place(i, value)
 
-            if y > 5:                   # heuristic: once board is mostly full
-                n = solve(n, nest=4)    # start trying to solve remaining cells
-                if checkComplete(n):    
+            if i >= 54:                 # heuristic: once board is mostly full
+                mb.propagate()          # start trying to solve remaining cells
+                if mb.broken or mb.complete():
                     break
 
-        if checkConsistent(n):
+        if mb.complete() and not mb.broken:
             done = True
-    return n
-
-def removable(board, y, x, nest=4):
-    """ Tests whether board can still be solved without given y/x cell. Returns true/false"""
-    test = copyBoard(board)        
-    test[y][x] = 0
-    test = solve(test, nest=nest)  # test to see if board is still solveable after remove
-
-    if checkComplete(test) and checkConsistent(test):
-        return True 
-    else:
-        return False
+    return mb.toBoard()
+
+def removable(board, y, x):
+    """ Tests whether board still has exactly one solution without given y/x cell. Returns true/false.
+    board has to have exactly one solution to begin with."""
+    return removeMask(MaskBoard(board), y*9 + x)
+
+def removeMask(mb, i):
+    """Incremental uniqueness check for carving. mb holds a puzzle with exactly one solution.
+    Clears cell i, and keeps it cleared if the puzzle is still unique. Returns True/False.
+
+    We don't need to count solutions from scratch: the puzzle minus cell i can only have a new
+    solution if that solution puts some other value in cell i. So we just try each other
+    candidate there, and usually the first propagate() kills it. Cells whose value is forced
+    by their peers don't need any search at all."""
+    value = mb.cells[i]
+    mb.remove(i)
+    others = mb.candidates(i) & ~(1 << value)
+    for other in MASK_DIGITS[others]:
+        mark = mb.checkpoint()
+        mb.place(i, other)
+        found = countMask(mb, limit=1)
+        mb.rollback(mark)
+        if found:
+            mb.place(i, value)
+            return False
+    return True
 
-def rm(wb, forbid, ry, rx, nest=4):
+def rm(wb, forbid, ry, rx):
     """checks whether a cell is removable or not. If yes, removes it. Returns 1 or 0, if removed.
     
     This is NOT PURE. It changes the wb and forbid lists that are passed to it.
     """
     if wb[ry][rx] == 0 or forbid[ry][rx] == 1: 
         return 0
-    if removable(wb, ry, rx, nest=nest):       # if board solveable after removing this coord
+    if removable(wb, ry, rx):       # if board solveable after removing this coord
         wb[ry][rx] = 0              # remove that cell and continue
         return 1
     else:
         forbid[ry][rx] = 1          # if test fails, forbid value so we dont retest it
         return 0
 
-def carve(board, count=60):
+def carve(board, count=60, until=None, rng=None):
     """ Takes a full board, and removes cells so that puzzle is still solveable. Removes up to
-    count cells (if it can. In practice, we're removing ~60 cells max right now)
+    count cells (if it can. In practice, we're removing ~60 cells max right now). Returns the
+    same kind of board it was given.
+
+    Stops as soon as count cells are gone, or as soon as until(puzzle, removes) returns True--
+    use that to carve to a target grade instead of a clue count. So an easy puzzle only pays
+    for the ~30 checks it needs, not a crawl of the whole board.
+
+    Works on one MaskBoard the whole way (see removeMask()). Cells we find to be necessary
+    stay necessary as more cells come out, so each cell gets tested at most once. Cells
+    whose value is forced by their peers are free to remove, so those go first.
     """
-    wb = copyBoard(board)
-    forbid = getEmptyBoard()            # if a cell is necessary for solve, save coords 
+    mb = MaskBoard(board)
     removes = 0
-    attempts = 0
-
-    # stage one: try removing random coords (up to 50 times
-    while removes < count and attempts < 50:  
-        attempts += 1
-        ry = random.randint(0, 8)  
-        rx = random.randint(0, 8)
-        if rm(wb, forbid, ry, rx):      # rm() tries remove, updates wb and forbid, returns t/f
+    order = getRNG(rng).sample(range(81), 81)
+    necessary = set()
+
+    for cheap in (True, False):
+        for i in order:
+            if removes >= count:
+                break
+            if mb.cells[i] == 0 or i in necessary:
+                continue
+            if cheap and MASK_COUNT[mb.candidates(i) | 1 << mb.cells[i]] > 1:
+                continue            # not forced. Leave it for the second pass
+            if not removeMask(mb, i):
+                necessary.add(i)
+                continue
             removes += 1
-            
-    # stage two: crawl entire board and try remove
-    if removes < count:
-        for ry, rx in exclusiveGen():
-            if rm(wb, forbid, ry, rx): # nest=1):   # can use nesting to get ~5 extra carves (at time cost)
-                removes += 1
-                if removes == count:
-                    break
-                
-    #print(removes)
-    return wb 
+            if until is not None and until(mb.toBoard(like=board), removes):
+                return mb.toBoard(like=board)
+    return mb.toBoard(like=board)
 
-def getPuzzle(diff=40):
+def getPuzzle(diff=40, rng=None):
     """feed it the number of cells to remove. 60 is hard, 25 is easy"""
-    return carve(generate(), count=diff)
+    rng = getRNG(rng)
+    return carve(generate(rng), count=diff, rng=rng)
+
+def puzzleJob(job):
+    """One iterPuzzles() job: (seed, diff) -> (solution, puzzle, clue count, gen time). Each job
+    has its own rng from its seed, so it gives the same puzzle whichever process runs it."""
+    seed, diff = job
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    solution = generate(rng)
+    puzzle = carve(solution, count=diff, rng=rng)
+    return solution, puzzle, 81 - countZeros(puzzle), time.perf_counter() - start
+
+def iterPuzzles(count=None, diff=40, workers=None, seed=None, queue=None):
+    """Generator of (solution, puzzle, clue count, gen time) tuples, made on a process pool.
+    count=None keeps going forever. diff is cells to remove, like getPuzzle().
+
+    With a seed, the output is the same sequence every time, whatever the number of workers:
+    puzzle k comes from its own seed and they're yielded in order. At most queue puzzles (default
+    4 per worker) are in flight or waiting, so a slow consumer holds the workers back instead of
+    piling up results in memory. Closing the generator (or breaking out of the loop) stops
+    the pool. workers=0 generates in this process, with no pool."""
+    import collections          # not at the top: the lambdas import sudolib, and never need these
+    import multiprocessing
+    import os
+
+    if seed is None:
+        seed = random.getrandbits(64)
+    indexes = itertools.count() if count is None else range(count)
+    jobs = (('{}/{}'.format(seed, k), diff) for k in indexes)     # str seeds hash the same everywhere
+
+    if workers == 0:
+        for job in jobs:
+            yield puzzleJob(job)
+        return
+
+    workers = workers or os.cpu_count()
+    pool = multiprocessing.Pool(workers)
+    try:
+        queue = queue or 4 * workers
+        pending = collections.deque()
+        for job in itertools.islice(jobs, queue):
+            pending.append(pool.apply_async(puzzleJob, (job,)))
+        while pending:
+            result = pending.popleft().get()
+            for job in itertools.islice(jobs, 1):
+                pending.append(pool.apply_async(puzzleJob, (job,)))
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
 
 
 #---------------STORAGE----------------------#
@@ -499,39 +911,9 @@ def rotateNormal(board):
     weights decreases the chance of that (hopefully)
     
     """
-    a, b, c, d = 0, 0, 0, 0            # these hold sum of weights for each side
-
-    t1 = sum(1.114 for y, x in rowGen(0,4) if board[y][x] != 0)
-    t2 = sum(1.326 for y, x in rowGen(1,4) if board[y][x] != 0)
-    t3 = sum(1.453 for y, x in rowGen(2,4) if board[y][x] != 0)
-    t4 = sum(1.242 for y, x in sqrGen(0,0) if board[y][x] != 0)
-    t5 = sum(1.141 for y, x in sqrGen(0,3) if board[y][x] != 0)
-    t6 = sum(1.242 for y, x in sqrGen(0,6) if board[y][x] != 0)
-    a = t1 + t2 + t3 + t4 + t5 + t6
-
-    t1 = sum(1.114 for y, x in colGen(4,8) if board[y][x] != 0)
-    t2 = sum(1.326 for y, x in colGen(4,7) if board[y][x] != 0)
-    t3 = sum(1.453 for y, x in colGen(4,6) if board[y][x] != 0)
-    t4 = sum(1.242 for y, x in sqrGen(0,8) if board[y][x] != 0)
-    t5 = sum(1.141 for y, x in sqrGen(3,8) if board[y][x] != 0)
-    t6 = sum(1.242 for y, x in sqrGen(6,8) if board[y][x] != 0)
-    b = t1 + t2 + t3 + t4 + t5 + t6
-
-    t1 = sum(1.114 for y, x in rowGen(8,4) if board[y][x] != 0)
-    t2 = sum(1.326 for y, x in rowGen(7,4) if board[y][x] != 0)
-    t3 = sum(1.453 for y, x in rowGen(6,4) if board[y][x] != 0)
-    t4 = sum(1.242 for y, x in sqrGen(8,0) if board[y][x] != 0)
-    t5 = sum(1.141 for y, x in sqrGen(8,3) if board[y][x] != 0)
-    t6 = sum(1.242 for y, x in sqrGen(8,6) if board[y][x] != 0)
-    c = t1 + t2 + t3 + t4 + t5 + t6
-
-    t1 = sum(1.114 for y, x in colGen(4,0) if board[y][x] != 0)
-    t2 = sum(1.326 for y, x in colGen(4,1) if board[y][x] != 0)
-    t3 = sum(1.453 for y, x in colGen(4,2) if board[y][x] != 0)
-    t4 = sum(1.242 for y, x in sqrGen(0,0) if board[y][x] != 0)
-    t5 = sum(1.141 for y, x in sqrGen(3,0) if board[y][x] != 0)
-    t6 = sum(1.242 for y, x in sqrGen(6,0) if board[y][x] != 0)
-    d = t1 + t2 + t3 + t4 + t5 + t6
+    # these hold sum of weights for each side (top, right, bottom, left). See SIDE_WEIGHTS
+    flat = flatten(board)
+    a, b, c, d = (sum(w for w, value in zip(weights, flat) if value != 0) for weights in SIDE_WEIGHTS)
 
 
     if a>b and a>c and a>d:
@@ -545,69 +927,206 @@ def rotateNormal(board):
     else:
         print('error, two values collide')
         print('a: ', a, 'b: ', b, 'c: ', c, 'd: ', d)
-        return getEmptyBoard()
+        return Board() if isinstance(board, Board) else getEmptyBoard()
     
 def orderNormal(board):
-    """ Re-orders values in puzzle, without changing logic. Goal is consistency"""
-
-    temp = copyBoard(board)
-    for digit in range(1, 9):           # go through 1 - 9, to ensure puzzle is in order
-        for y, x in fullGen():          # check through entire board
-            if temp[y][x] < digit:     # if cell is 0 or smaller number, ignore since already in order
-                continue 
-            elif temp[y][x] == digit:  # if next cell we come to is our digit, break since already in order
-                break
-            else:                       # if cell is out of order, swap all occurences of number w digit 
-                old = 1*temp[y][x]                 # get old, out of order num
-                for y1, x1 in fullGen():            # new loop through board
-                    if temp[y1][x1] == old:        # swap
-                        temp[y1][x1] = digit 
-                    elif temp[y1][x1] == digit:
-                        temp[y1][x1] = old
-                break
-    return temp
+    """ Re-orders values in puzzle, without changing logic. Goal is consistency.
+
+    Digits get relabeled in order of first appearance (reading left to right, top to bottom),
+    so the first digit we come to becomes 1, the next new one becomes 2, etc."""
+    relabel = {}
+    for value in flatten(board):
+        if value > 0 and value not in relabel:
+            relabel[value] = len(relabel) + 1
+    flat = [relabel.get(value, value) for value in flatten(board)]
+    if isinstance(board, Board):
+        return Board(flat)
+    return [flat[y:y+9] for y in range(0, 81, 9)]
 
 def normalize(board):
-    """returns normalized form of board--all permutations should result in same normal form"""
-    return orderNormal(rotateNormal(board))
-
-def shuffle(board):
-    digits = [1, 2, 3, 4, 5, 6, 7, 8, 9]
-    out = copyBoard(board)
-
-    for old in range(1, 10):
-        digit = digits[random.randint(0, len(digits)-1)]
-        digits.remove(digit)
-        for y, x in fullGen():
-            if out[y][x] == old:
-                out[y][x] = digit 
-            elif out[y][x] == digit:
-                out[y][x] = old 
-    
-    r = random.randint(0, 3)
-    return rotate(out, rotates=r) 
+    """returns normalized form of board--all permutations should result in same normal form.
+
+    This used to be orderNormal(rotateNormal(board)), which only covered rotations + relabeling
+    (and gave up on symmetric boards). It's the full canonical form now."""
+    return canonicalize(board)
+
+
+#---------------CANONICAL FORM---------------#
+
+# Two boards are the same puzzle if one can be turned into the other by: relabeling digits,
+# reordering bands (or stacks), reordering rows within a band (or cols within a stack), and
+# transposing. Rotations and reflections are combinations of those. That's 2 * 6^8 =
+# 3,359,232 positional transforms (times 9! relabelings), so we can't just try them all.
+#
+# canonicalize() picks the transform whose result is smallest, comparing first the pattern
+# of filled cells and then the digits (relabeled in order of first appearance, so digit
+# relabelings drop out). It searches in two phases:
+#   1. filled-cell pattern. For a given column order, the best row order is just "sort rows
+#      within each band, then sort the bands", so we only branch on columns, one stack at a
+#      time. Unplaced columns count as empty, which gives a lower bound, and we prune any
+#      branch whose bound is already worse than the best full pattern.
+#   2. digits. Only the few column orders that tie for the best pattern survive, and for those
+#      we branch on rows (only rows whose pattern matches the best one), pruning on the
+#      relabeled prefix.
+# Puzzles have few symmetries so this stays fast. Completely full (or empty) boards tie
+# everywhere in phase 1 and are slow--don't feed it solutions.
+
+PERMS3 = tuple(itertools.permutations(range(3)))
+
+def sortedPattern(rowBits):
+    """best row order for these row patterns: sort within each band, then sort the bands"""
+    bands = sorted(tuple(sorted(rowBits[b:b+3])) for b in (0, 3, 6))
+    return bands[0] + bands[1] + bands[2]
+
+def bestPatterns(grids):
+    """phase 1. Returns (best pattern, list of (grid, column order) that reach it)"""
+    best = [None, []]       # pattern, winners
+
+    def search(grid, chunks, depth, used, partial, cols):
+        shift = 3 * (2 - depth)
+        for s in range(3):
+            if s in used:
+                continue
+            for p, perm in enumerate(PERMS3):
+                rowBits = [partial[r] << 3 | chunks[r][s][p] for r in range(9)]
+                # columns we haven't placed yet can only add bits, so this is a lower bound
+                pattern = sortedPattern([v << shift for v in rowBits])
+                if best[0] is not None and pattern > best[0]:
+                    continue
+                newCols = cols + [3*s + perm[0], 3*s + perm[1], 3*s + perm[2]]
+                if depth < 2:
+                    search(grid, chunks, depth + 1, used + (s,), rowBits, newCols)
+                elif best[0] is None or pattern < best[0]:
+                    best[0] = pattern
+                    best[1] = [(grid, newCols)]
+                else:
+                    best[1].append((grid, newCols))
+
+    for grid in grids:
+        filled = [[1 if v else 0 for v in row] for row in grid]
+        # chunks[r][s][p]: 3 bits of row r, stack s, with the stack's cols in order PERMS3[p]
+        chunks = [[[f[3*s + a] << 2 | f[3*s + b] << 1 | f[3*s + c] for a, b, c in PERMS3]
+                   for s in range(3)] for f in filled]
+        search(grid, chunks, 0, (), [0] * 9, [])
+    return best[0], best[1]
+
+def bestDigits(pattern, candidates):
+    """phase 2. Returns the smallest relabeled cell tuple over row orders matching pattern"""
+    best = [None]
+
+    def search(rows, rowBits, k, used, labels, out):
+        if k == 9:
+            best[0] = out
+            return
+        if k % 3 == 0:      # starting a new band, so any row from an unused band
+            options = [r for r in range(9) if r // 3 not in {u // 3 for u in used}]
+        else:               # otherwise stay in the current band
+            band = used[-1] // 3
+            options = [r for r in range(band*3, band*3 + 3) if r not in used]
+
+        for r in options:
+            if rowBits[r] != pattern[k]:
+                continue
+            newLabels = dict(labels)
+            seg = []
+            for v in rows[r]:
+                if v and v not in newLabels:
+                    newLabels[v] = len(newLabels) + 1
+                seg.append(newLabels[v] if v else 0)
+            newOut = out + tuple(seg)
+            if best[0] is not None and newOut > best[0][:len(newOut)]:
+                continue
+            search(rows, rowBits, k + 1, used + (r,), newLabels, newOut)
+
+    for grid, cols in candidates:
+        rows = [[row[c] for c in cols] for row in grid]
+        rowBits = [int(''.join('1' if v else '0' for v in row), 2) for row in rows]
+        search(rows, rowBits, 0, (), {}, ())
+    return best[0]
+
+def canonicalize(board):
+    """Returns the canonical form of board (same kind of board as given). Every board that's
+    the same puzzle up to relabeling/band/stack/row/col swaps/transposing gives the same result."""
+    grid = [list(row) for row in board]
+    transposed = [list(col) for col in zip(*grid)]
+    pattern, candidates = bestPatterns((grid, transposed))
+    flat = list(bestDigits(pattern, candidates))
+    if isinstance(board, Board):
+        return Board(flat)
+    return [flat[y:y+9] for y in range(0, 81, 9)]
+
+def canonicalKey(board):
+    """Returns (canonical string, key). The string is stringify() of the canonical form, and the
+    key is a signed 64 bit hash of it--small enough for an INTEGER column with a unique index."""
+    canon = stringify(canonicalize(board))
+    digest = hashlib.blake2b(canon.encode(), digest_size=8).digest()
+    return canon, int.from_bytes(digest, 'big', signed=True)
+
+#---------------TRANSFORMS-------------------#
+
+# A transform is (index, table): cell i of the result is table[board cell index[i]]. Any
+# number of symmetry-preserving moves compose into one index map ahead of time, so applying
+# the whole thing is a single pass over the board no matter how many moves went into it.
+
+DIGITS = [1, 2, 3, 4, 5, 6, 7, 8, 9]
+# every order of the 9 rows (or cols) that keeps bands together: 6 band orders * 6^3 in-band
+LINE_ORDERS = tuple(tuple(3*b + r for b, inner in zip(bands, inners) for r in inner)
+                    for bands in PERMS3 for inners in itertools.product(PERMS3, repeat=3))
+# the 4 rotations, with and without a transpose first, as (y, x) of the source cell
+TRANSPOSE = tuple((i % 9) * 9 + i // 9 for i in range(81))
+DIHEDRAL_YX = tuple(tuple(divmod(flip[j], 9) for j in rotation)
+                    for flip in (ROTATIONS[0], TRANSPOSE) for rotation in ROTATIONS)
+
+def randomTransform(rng=None):
+    """Random element of the sudoku symmetry group: digit relabeling, band and stack order,
+    row order within each band, col order within each stack, then one of the 8 rotations /
+    reflections. That's 9! * 1296^2 * 2 ~ 1.2e12 variants of each stored puzzle (the other
+    reflections are already in there), up from 9! * 4 with the old shuffle."""
+    rng = getRNG(rng)
+    rows = rng.choice(LINE_ORDERS)
+    cols = rng.choice(LINE_ORDERS)
+    index = tuple([rows[y]*9 + cols[x] for y, x in rng.choice(DIHEDRAL_YX)])
+
+    digits = DIGITS[:]
+    rng.shuffle(digits)
+    table = bytes([0] + digits) + bytes(range(10, 256))
+    return index, table
+
+def applyTransform(board, transform):
+    """Returns transformed copy of board (same kind of board as given), in one pass"""
+    index, table = transform
+    if isinstance(board, Board):
+        return Board(bytes(operator.itemgetter(*index)(board.cells)).translate(table))
+    flat = flatten(board)
+    flat = [table[flat[j]] for j in index]
+    return [flat[y:y+9] for y in range(0, 81, 9)]
+
+def applyTransformMany(boards, transform):
+    """applyTransform() for several Boards (a puzzle and its solution) under the same transform:
+    the gather is built once and shared, which is most of the cost"""
+    index, table = transform
+    gather = operator.itemgetter(*index)
+    return [Board(bytes(gather(board.cells)).translate(table)) for board in boards]
+
+def shuffle(board, rng=None):
+    """random-looking but equivalent copy of board (same kind of board as given)"""
+    return applyTransform(board, randomTransform(rng))
 
 def stringify(board):
-    """Serializes board (a 2D list) into a flat string divided by semicolons"""
-    outString = ""
-    for y, x in fullGen():
-        outString += str(board[y][x])
-        if x == 8 and y != 8:
-            outString += ";"
-    return outString
-
-def unstringify(boardString):
-    """reconstructs board (a 2D list) from a flat string"""
-    out = getEmptyBoard()
-    temp = boardString.split(";")
-    for y, x in fullGen():
-        out[y][x] = int(temp[y][x])
-    return out 
+    """Serializes board (a 2D list or Board) into a flat string divided by semicolons"""
+    if isinstance(board, Board):
+        return board.toString()
+    return ';'.join(''.join(map(str, row)) for row in board)
+
+def unstringify(boardString, compact=False):
+    """reconstructs board (a 2D list, or a Board with compact=True) from a flat string"""
+    board = Board.fromString(boardString)
+    return board if compact else board.toRows()
 
 
 #---------------TEST SUITE-------------------#
 
-import timeit
+# (benchmarks live in bench.py)
 
 def test_rowGen():
     
@@ -726,91 +1245,9 @@ def test_getSqrVals():
         print("passed.")
 
 
-    
-
-
-
-def quick(inString):
-    return timeit.timeit(stmt=inString, globals=globals(), number=10000)
-def slow(inString):
-    return timeit.timeit(stmt=inString, globals=globals(), number=500) 
-def verySlow(inString):
-    return timeit.timeit(stmt=inString, globals=globals(), number=50) 
-def superSlow(inString):
-    return timeit.timeit(stmt=inString, globals=globals(), number=5)
-
-def speedTests():
-    import timeit
-
-    def quick(inString):
-        return timeit.timeit(stmt=inString, globals=globals(), number=10000)
-    def slow(inString):
-        return timeit.timeit(stmt=inString, globals=globals(), number=500) 
-    def verySlow(inString):
-        return timeit.timeit(stmt=inString, globals=globals(), number=50) 
-
-    print("rowGen()", "---",        quick("rowGen(3,3)"))
-    print("colGen()", "---",        quick("colGen(3,3)"))
-    print("sqrGen()", "---",        quick("sqrGen(3,3)"))
-    print("fullGen()", "---",       quick("fullGen()"))
-    print()
-    print("getRowVals()", "---",    quick("getRowVals(s3,3,3)"))
-    print("getColVals()", "---",    quick("getColVals(s3,3,3)"))
-    print("getSqrVals()", "---",    quick("getSqrVals(s3,3,3)"))
-    print()
-    print("getPoss()", "---",       quick("getPoss(s3,3,3)"))
-    print("uniqueCheck()", "---",   quick("uniqueCheck(s3,3,3)"))
-    print()
-    print("===================================")
-    print("generateCache()", "---", slow("generateCache(s3)"))
-    print("solve()", "---",         slow("solve(s3)"))
-    print("checkConsistent()", "---", slow("checkConsistent(s3)"))
-    print()
-    print("===================================")
-    print("generate()", "---", verySlow("generate()"))
-    print("carve()", "---", verySlow("carve(f1)"))
-    print()
-    print("getPuzzle()", "---", verySlow("getPuzzle()"))
-
 def testGen(genFunc):
     board = getEmptyBoard()
     for y, x in genFunc():
         board[y][x] = 'X'
         printBoard(board)
         print('----------------------')
-
-
-#5/12/22 test results
-"""
-    rowGen() --- 0.0055575
-    colGen() --- 0.0052339
-    sqrGen() --- 0.0033147999999999997
-    fullGen() --- 0.003064299999999999
-
-    getRowVals() --- 0.0418316
-    getColVals() --- 0.03638910000000001
-    getSqrVals() --- 0.053771999999999986
-
-    getPoss() --- 0.12813639999999998
-    uniqueCheck() --- 8.199947700000001
-
-    ===================================
-    generateCache() --- 0.39510630000000013
-    solve() --- 21.26534
-    checkConsistent() --- 0.23430940000000078
-
-    ===================================
-    generate() --- 19.191720000000004
-    carve() --- 5.075975199999995
-
-    getPuzzle() --- 21.846923900000007
-
-
-    NOTES:
-    everything builds off the previous primitive. getRowVals() needs rowGen(). 
-    getPoss() uses getRowVals, getColVals, getSqrVals.
-    uniqueCheck() uses getPoss for every unit 
-    generateCache() runs uniqueCheck() for every cell. So the call stack grows multiplicatively.
-    
-"""
-
@@ -0,0 +1,104 @@
+# test_authen.py
+# Signer tokens: round trips, tampering, the compact encoding, and old getHMAC() tokens. Then
+# solution digests.
+#
+#   python -m pytest test_authen.py
+
+import math
+import os
+
+import authen
+import sudolib
+
+
+DATA = {'board': sudolib.s5, 'bitmap': sudolib.getBitmap(sudolib.s5), 'gentime': 1652400000.25,
+        'puzzleid': 42, 'difficulty': 'two'}
+
+
+def test_sign_verify():
+    signer = authen.Signer(authen.TESTKEY1)
+    token = signer.sign(DATA)
+    assert token.startswith(authen.TOKEN_PREFIX)
+    assert signer.verify(DATA, token)
+    assert signer.verify(dict(DATA), token)         # key order doesn't matter
+
+def test_verify_tampered():
+    signer = authen.Signer(authen.TESTKEY1)
+    token = signer.sign(DATA)
+    assert not signer.verify(dict(DATA, gentime=DATA['gentime'] + 60), token)
+    assert not signer.verify(dict(DATA, puzzleid=43), token)
+    board = [list(row) for row in DATA['board']]
+    board[0][0] = 9 - board[0][0]
+    assert not signer.verify(dict(DATA, board=board), token)
+    assert not signer.verify(dict(DATA, extra=None), token)
+    assert not signer.verify(DATA, token[:-1] + ('0' if token[-1] != '0' else '1'))
+    assert not signer.verify(DATA, None)
+    assert not signer.verify(DATA, 12345)
+
+def test_verify_other_key():
+    token = authen.Signer('some other key').sign(DATA)
+    assert not authen.Signer(authen.TESTKEY1).verify(DATA, token)
+
+def test_encode_keeps_types_apart():
+    encodings = [authen.encode({'v': value}) for value in (True, 1, '1', 1.0, None, 'n', [1], '[1]')]
+    assert len(set(encodings)) == len(encodings)
+
+def test_encode_no_spill():
+    # without length prefixes these two would encode the same
+    assert authen.encode({'a': 'x1:b', 'c': 'y'}) != authen.encode({'a': 'x', 'b': 'y', 'c': 'y'})
+    assert authen.encode({'ab': 'c'}) != authen.encode({'a': 'bc'})
+
+def test_encode_boards():
+    assert authen.encodeValue(sudolib.s5) == 'g' + ''.join(str(v) for row in sudolib.s5 for v in row)
+    # not a board of digits: falls back to JSON rather than failing
+    assert authen.encodeValue([[10] * 9] * 9).startswith('j')
+    assert authen.encodeValue([['1'] * 9] * 9).startswith('j')
+    assert authen.encodeValue([[-1] * 9] * 9).startswith('j')
+
+def test_legacy_tokens_until_cutoff():
+    signer = authen.Signer(authen.TESTKEY1, legacyUntil=1000.0)
+    legacy = authen.getHMAC(DATA, authen.TESTKEY1)
+    assert signer.verify(DATA, legacy, now=999.0)
+    assert not signer.verify(DATA, legacy, now=1000.0)
+    assert not signer.verify(dict(DATA, puzzleid=43), legacy, now=999.0)
+    # v2 tokens don't care about the cutoff
+    assert signer.verify(DATA, signer.sign(DATA), now=2000.0)
+
+def test_legacy_accept_is_logged(caplog):
+    signer = authen.Signer(authen.TESTKEY1, legacyUntil=math.inf)
+    with caplog.at_level('WARNING', logger='authen'):
+        assert signer.verify(DATA, authen.getHMAC(DATA, authen.TESTKEY1))
+    assert 'legacy token' in caplog.text and '42' in caplog.text
+
+def test_legacy_cutoff_default_is_fixed():
+    assert authen.LEGACY_UNTIL == authen.LEGACY_UNTIL_DEFAULT or 'PSEUDOKU_LEGACY_HMAC_UNTIL' in os.environ
+    assert math.isfinite(authen.LEGACY_UNTIL)
+    assert authen.Signer(authen.TESTKEY1).legacyUntil == authen.LEGACY_UNTIL
+
+
+def test_digest_board_forms_agree():
+    signer = authen.Signer(authen.TESTKEY1)
+    solution = sudolib.solveExact(sudolib.Board.fromRows(sudolib.s5))
+    digest = signer.digest(solution.toRows())
+    assert len(digest) == 32
+    assert signer.digest(solution.toDigits()) == digest         # getpuzzle digests this form
+    assert signer.checkDigest(solution.toRows(), digest)
+    assert signer.checkDigest(solution.toDigits(), digest)
+
+def test_check_digest_rejects():
+    signer = authen.Signer(authen.TESTKEY1)
+    solution = sudolib.solveExact(sudolib.Board.fromRows(sudolib.s5)).toRows()
+    digest = signer.digest(solution)
+    wrong = [list(row) for row in solution]
+    wrong[0][0], wrong[0][1] = wrong[0][1], wrong[0][0]
+    assert not signer.checkDigest(wrong, digest)
+    assert not signer.checkDigest(sudolib.s5, digest)
+    assert not signer.checkDigest(solution, None)
+    assert not signer.checkDigest(solution, digest.upper() + 'x')
+    assert not authen.Signer('some other key').checkDigest(solution, digest)
+
+def test_digest_is_not_a_token():
+    signer = authen.Signer(authen.TESTKEY1)
+    # a digest of a value must never pass as the token for a dict holding it
+    assert not signer.verify({'board': sudolib.s5}, signer.digest(sudolib.s5))
+    assert not signer.verify({'board': sudolib.s5}, authen.TOKEN_PREFIX + signer.digest(sudolib.s5))
@@ -0,0 +1,184 @@
+# test_getpuzzle.py
+# getpuzzle's handler against a small packed puzzle file: ?n batches (clamped, served whole from
+# the pool), the 404 for puzzles that aren't there, and the compact format (asked for by query or
+# Accept header). Then fetchDB() under each DB mode, against a local S3 (locals3.py).
+#
+#   python -m pytest test_getpuzzle.py
+
+import json
+import os
+
+import pytest
+
+os.environ.setdefault('PSEUDOKU_DB_LAZY', '1')     # no S3 at import, the fixture hands it a file
+
+import getpuzzle
+import metrics
+import puzzledb
+import puzzlepool
+import sudolib
+
+
+@pytest.fixture
+def served(tmp_path, monkeypatch):
+    """getpuzzle serving 12 different 'two' puzzles (ids 1-12) from a pool of 4"""
+    solution = sudolib.solveExact(sudolib.s5)
+    text = puzzledb.openDB(str(tmp_path / 'text.sqlite'))
+    puzzledb.insertPuzzles(text, [(sudolib.stringify(sudolib.carve(solution, count=44, rng=seed)), 44)
+                                  for seed in range(12)])
+    path = str(tmp_path / 'packed.sqlite')
+    puzzledb.pack(text, path).close()
+
+    db = puzzledb.openReadOnly(path)
+    counts, select = puzzledb.loadCounts(db), puzzledb.pickColumns(db)
+    monkeypatch.setattr(getpuzzle, 'db', db)
+    monkeypatch.setattr(getpuzzle, 'counts', counts)
+    monkeypatch.setattr(getpuzzle, 'select', select)
+    monkeypatch.setattr(getpuzzle, 'pool', puzzlepool.PuzzlePool(db, counts, size=4, select=select))
+    monkeypatch.setattr(getpuzzle, 'initTimer', None)
+    monkeypatch.setattr(metrics, 'ENABLED', False)
+    return getpuzzle
+
+def event(proxy, **params):
+    return {'pathParameters': {'proxy': proxy}, 'queryStringParameters': params or None}
+
+def body(response):
+    assert response['statusCode'] == 200
+    return json.loads(response['body'])
+
+
+def test_batch_size_clamped():
+    assert getpuzzle.batchSize(event('two')) == 1
+    assert getpuzzle.batchSize(event('two', n='5')) == 5
+    assert getpuzzle.batchSize(event('two', n='0')) == 1
+    assert getpuzzle.batchSize(event('two', n='-3')) == 1
+    assert getpuzzle.batchSize(event('two', n='999')) == getpuzzle.MAX_BATCH
+    assert getpuzzle.batchSize(event('two', n='lots')) == 1
+    assert getpuzzle.batchSize(event('two', n='2.5')) == 1
+
+def test_batch_bigger_than_pool(served):
+    puzzles = body(served.lambda_handler(event('two', n='7'), None))['puzzles']
+    assert len(puzzles) == 7
+    assert len(set(puzzle['data']['puzzleid'] for puzzle in puzzles)) == 7
+    for puzzle in puzzles:
+        assert served.signer.verify(puzzle['data'], puzzle['hmac'])
+        assert puzzle['data']['difficulty'] == 'two'
+
+def test_pool_drains_then_refills(served):
+    seen = []
+    for _ in range(6):          # 4 from the first fill, then a refill
+        seen.append(body(served.lambda_handler(event('two'), None))['data']['puzzleid'])
+    assert len(set(seen[:4])) == 4
+    assert len(served.pool.pools['two']) == 2
+
+def test_single_is_not_wrapped(served):
+    data = body(served.lambda_handler(event('two', n='1'), None))['data']
+    assert 1 <= data['puzzleid'] <= 12
+
+def test_by_id(served):
+    data = body(served.lambda_handler(event('3'), None))['data']
+    assert data['puzzleid'] == 3
+    assert 'difficulty' not in data
+
+def test_not_found(served):
+    for proxy in ('99', 'four'):        # no such id, and a difficulty with nothing in it
+        response = served.lambda_handler(event(proxy), None)
+        assert response['statusCode'] == 404
+        assert response['headers']['Access-Control-Allow-Origin'] == '*'
+        assert json.loads(response['body']) == {'message': 'no such puzzle'}
+    assert served.lambda_handler(event('four', n='3'), None)['statusCode'] == 404
+
+
+def test_wants_compact():
+    assert not getpuzzle.wantsCompact(event('two'))
+    assert getpuzzle.wantsCompact(event('two', format='compact'))
+    assert not getpuzzle.wantsCompact(event('two', format='json'))
+    for name in ('Accept', 'accept', 'ACCEPT'):
+        accept = dict(event('two'), headers={name: 'text/html, {};q=0.9'.format(getpuzzle.COMPACT_TYPE)})
+        assert getpuzzle.wantsCompact(accept)
+    assert not getpuzzle.wantsCompact(dict(event('two'), headers={'Accept': 'application/json'}))
+    assert not getpuzzle.wantsCompact(dict(event('two'), headers=None))
+
+def test_compact_response(served):
+    response = served.lambda_handler(event('5', format='compact'), None)
+    assert response['headers']['Content-Type'] == getpuzzle.COMPACT_TYPE
+    assert response['headers']['Vary'] == 'Accept'
+    assert ' ' not in response['body']
+    signed = body(response)
+    data = signed['data']
+    assert served.signer.verify(data, signed['hmac'])
+    board, bitmap = sudolib.Board.fromString(data['board']), sudolib.Board.fromString(data['bitmap'])
+    assert len(data['board']) == len(data['bitmap']) == 81
+    assert bitmap == sudolib.getBitmap(board)
+    assert sudolib.countSolutions(board) == 1
+    # the same puzzle as pz_id 5, shuffled
+    stored = puzzledb.decodeRow(served.db.execute('SELECT {} FROM puzzle WHERE pz_id = 5'.format(
+        served.select)).fetchone())[1]
+    assert sudolib.canonicalKey(board) == sudolib.canonicalKey(stored)
+    assert served.signer.checkDigest(sudolib.solveExact(board).toDigits(), data['solution'])
+
+def test_compact_by_accept_header(served):
+    accept = dict(event('two', n='3'), headers={'Accept': getpuzzle.COMPACT_TYPE})
+    response = served.lambda_handler(accept, None)
+    assert response['headers']['Content-Type'] == getpuzzle.COMPACT_TYPE
+    for puzzle in body(response)['puzzles']:
+        assert isinstance(puzzle['data']['board'], str)
+
+def test_default_response_is_lists(served):
+    response = served.lambda_handler(event('5'), None)
+    assert 'Content-Type' not in response['headers']
+    data = body(response)['data']
+    assert [len(row) for row in data['board']] == [9] * 9
+    assert data['bitmap'] == sudolib.getBitmap(data['board'])
+    assert served.signer.checkDigest(sudolib.solveExact(data['board']), data['solution'])
+
+
+@pytest.fixture
+def s3(tmp_path, monkeypatch):
+    """local S3 holding a puzzle file, with /tmp and the package dir in tmp_path"""
+    import locals3
+    os.makedirs(str(tmp_path / 's3' / getpuzzle.BUCKET))
+    with open(str(tmp_path / 's3' / getpuzzle.BUCKET / getpuzzle.OBJECT), 'wb') as f:
+        f.write(b'version 1')
+    client = locals3.LocalS3(str(tmp_path / 's3'))
+    monkeypatch.setattr(getpuzzle, 's3', client)
+    monkeypatch.setattr(getpuzzle, 'download_path', str(tmp_path / 'my-db'))
+    monkeypatch.setattr(getpuzzle, 'bundled_path', str(tmp_path / 'package' / getpuzzle.OBJECT))
+    return client
+
+def test_fetch_cached_reuses_download(s3, monkeypatch):
+    monkeypatch.setattr(getpuzzle, 'DB_MODE', 'cached')
+    assert getpuzzle.fetchDB() == getpuzzle.download_path
+    assert getpuzzle.fetchDB() == getpuzzle.download_path
+    assert [call[0] for call in s3.calls] == ['head_object', 'download_file', 'head_object']
+
+def test_fetch_bundled_missing_raises(s3, monkeypatch):
+    monkeypatch.setattr(getpuzzle, 'DB_MODE', 'bundled')
+    with pytest.raises(FileNotFoundError):
+        getpuzzle.fetchDB()
+    os.makedirs(os.path.dirname(getpuzzle.bundled_path))
+    open(getpuzzle.bundled_path, 'w').close()
+    assert getpuzzle.fetchDB() == getpuzzle.bundled_path
+    assert s3.calls == []
+
+def test_fetch_download_drops_stale_etag(s3, monkeypatch):
+    monkeypatch.setattr(getpuzzle, 'DB_MODE', 'cached')
+    getpuzzle.fetchDB()
+    assert getpuzzle.readETag(getpuzzle.download_path)
+
+    # S3 moves on, and a 'download' run fetches the new file without knowing its ETag
+    with open(os.path.join(s3.root, getpuzzle.BUCKET, getpuzzle.OBJECT), 'wb') as f:
+        f.write(b'version 2')
+    monkeypatch.setattr(getpuzzle, 'DB_MODE', 'download')
+    getpuzzle.fetchDB()
+    assert getpuzzle.readETag(getpuzzle.download_path) is None
+
+    # S3 is rolled back to version 1. The old ETag would match it, but the file is version 2
+    with open(os.path.join(s3.root, getpuzzle.BUCKET, getpuzzle.OBJECT), 'wb') as f:
+        f.write(b'version 1')
+    monkeypatch.setattr(getpuzzle, 'DB_MODE', 'cached')
+    s3.calls.clear()
+    getpuzzle.fetchDB()
+    assert [call[0] for call in s3.calls] == ['head_object', 'download_file']
+    with open(getpuzzle.download_path, 'rb') as f:
+        assert f.read() == b'version 1'
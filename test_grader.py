@@ -0,0 +1,128 @@
+# test_grader.py
+# human-technique grading: each technique makes exactly the deduction it's named for (set up on
+# an otherwise open grid, so nothing else could have made it), grade() on whole puzzles, and
+# carveToGrade() stopping at a grade it was asked for.
+#
+#   python -m pytest test_grader.py
+
+import grader
+import sudolib
+from bench import CORPUS
+from sudolib import ALL_DIGITS
+
+
+def openGrid():
+    """Grader for an empty board: every cell can be anything"""
+    return grader.Grader([[0] * 9 for _ in range(9)])
+
+def bits(*values):
+    return sum(1 << value for value in values)
+
+
+def test_naked_single():
+    solution = sudolib.solveExact(sudolib.s5)
+    board = [list(row) for row in solution]
+    board[4][4] = 0
+    g = grader.Grader(board)
+    assert g.cands[40] == bits(solution[4][4])
+    assert g.nakedSingle()
+    assert g.values == sudolib.flatten(solution)
+    assert not g.nakedSingle()
+
+def test_hidden_single():
+    g = openGrid()
+    g.eliminate([i for i in grader.ROWS[0] if i != 4], bits(5))
+    assert g.hiddenSingle()
+    assert g.values[4] == 5
+    assert not any(g.cands[j] & bits(5) for j in sudolib.PEERS[4])
+
+def test_pointing():
+    g = openGrid()
+    g.eliminate([9, 10, 11, 18, 19, 20], bits(1))     # 1 only on row 0 within sqr 0
+    assert g.pointing()
+    assert [g.cands[i] & bits(1) for i in range(3, 9)] == [0] * 6
+    assert all(g.cands[i] & bits(1) for i in range(27, 81))
+
+def test_claiming():
+    g = openGrid()
+    g.eliminate(range(3, 9), bits(1))                  # 1 only in sqr 0 along row 0
+    assert g.pointing()
+    assert [g.cands[i] & bits(1) for i in (9, 10, 11, 18, 19, 20)] == [0] * 6
+    assert all(g.cands[i] & bits(1) for i in (0, 1, 2))
+
+def test_naked_pair():
+    g = openGrid()
+    g.cands[0] = g.cands[1] = bits(1, 2)
+    assert g.nakedSubset(2)
+    assert [g.cands[i] for i in grader.ROWS[0][2:]] == [ALL_DIGITS & ~bits(1, 2)] * 7
+    assert g.cands[0] == g.cands[1] == bits(1, 2)
+
+def test_naked_triple():
+    g = openGrid()
+    g.cands[0], g.cands[1], g.cands[2] = bits(1, 2), bits(2, 3), bits(1, 3)
+    assert not g.nakedSubset(2)                        # no two of them make a pair
+    assert g.nakedSubset(3)
+    assert [g.cands[i] for i in grader.ROWS[0][3:]] == [ALL_DIGITS & ~bits(1, 2, 3)] * 6
+
+def test_hidden_pair():
+    g = openGrid()
+    g.eliminate(grader.ROWS[0][2:], bits(1, 2))        # 1 and 2 only fit cells 0 and 1 of row 0
+    assert g.hiddenPair()
+    assert g.cands[0] == g.cands[1] == bits(1, 2)
+
+def test_x_wing():
+    g = openGrid()
+    for row in (0, 4):
+        g.eliminate([i for i in grader.ROWS[row] if sudolib.CELL_COL[i] not in (2, 6)], bits(7))
+    assert g.xWing()
+    for col in (2, 6):
+        assert [sudolib.CELL_ROW[i] for i in grader.COLS[col] if g.cands[i] & bits(7)] == [0, 4]
+    assert g.cands[3 * 9 + 3] & bits(7)
+
+
+def test_grade_solves_like_the_solver():
+    for content in CORPUS.values():
+        board = sudolib.unstringify(content)
+        g = grader.Grader(board)
+        level, steps = g.solve()
+        assert all(value in (0, full)
+                   for value, full in zip(g.values, sudolib.flatten(sudolib.solveExact(board))))
+        if level != grader.GUESS:
+            assert 0 not in g.values
+            assert steps >= sudolib.countZeros(board)       # one placement per step, at least
+
+def test_grade_levels():
+    solution = sudolib.solveExact(sudolib.s5)
+    board = [list(row) for row in solution]
+    board[0][0] = 0
+    assert grader.grade(board) == (grader.NAKED_SINGLE, 1)
+    assert grader.grade(sudolib.s4)[0] == grader.grade(sudolib.s5)[0] == grader.HIDDEN_SINGLE
+    assert grader.grade(sudolib.unstringify(CORPUS['inkala2012']))[0] == grader.GUESS
+    assert grader.grade(sudolib.Board.fromRows(sudolib.s4)) == grader.grade(sudolib.s4)
+
+def test_carve_to_grade():
+    solution = sudolib.solveExact(sudolib.s5)
+    puzzle = grader.carveToGrade(solution, (grader.NAKED_SINGLE,), minimum=20, rng=1)
+    assert sudolib.countZeros(puzzle) == 20
+    assert grader.grade(puzzle)[0] == grader.NAKED_SINGLE
+
+    # it stops at the first carve (of at least minimum) with a wanted grade, or carves as far
+    # as it can if none has one. The same rng carves the same cells, so a plain carve() shows
+    # where that should be
+    hard = (grader.POINTING, grader.NAKED_PAIR, grader.HIDDEN_PAIR, grader.NAKED_TRIPLE, grader.X_WING)
+    reached = 0
+    for seed in range(6):
+        grades = []
+        sudolib.carve(solution, count=60, rng=seed,
+                      until=lambda puzzle, removes: grades.append((removes, grader.grade(puzzle)[0])))
+        first = next((removes for removes, level in grades if removes >= 40 and level in hard), None)
+
+        puzzle = grader.carveToGrade(solution, hard, count=60, minimum=40, rng=seed)
+        assert sudolib.countSolutions(puzzle) == 1
+        if first is None:
+            assert sudolib.countZeros(puzzle) == grades[-1][0]
+        else:
+            assert sudolib.countZeros(puzzle) == first
+            assert grader.grade(puzzle)[0] in hard
+            reached += 1
+    assert reached
@@ -0,0 +1,96 @@
+# test_highscore.py
+# leaderboards: both stores keep each board's k fastest times, fastest first, and HighScores
+# hands out record ids only for times that place.
+#
+#   python -m pytest test_highscore.py
+
+import random
+
+import pytest
+
+import highscore
+
+
+STORES = {
+    'memory': highscore.MemoryStore,
+    'sqlite': lambda: highscore.SQLiteStore(':memory:'),
+}
+
+
+@pytest.fixture(params=list(STORES))
+def store(request):
+    return STORES[request.param]()
+
+
+def test_store_keeps_top_k_sorted(store):
+    rng = random.Random(5)
+    times = [rng.uniform(10, 500) for _ in range(100)]
+    for i, usertime in enumerate(times):
+        store.insert('puzzle/1', 10, usertime, 'user{}'.format(i), 1)
+
+    top = store.top('puzzle/1', 10)
+    assert [row[0] for row in top] == sorted(times)[:10]
+    assert [row[2] for row in top] == ['user{}'.format(times.index(t)) for t in sorted(times)[:10]]
+    assert store.top('puzzle/1', 3) == top[:3]
+
+def test_store_insert_places(store):
+    for usertime in (50, 40, 30):
+        recordid, top = store.insert('puzzle/1', 3, usertime, 'a', 1)
+        assert recordid is not None
+    assert [row[0] for row in top] == [30, 40, 50]
+
+    recordid, top = store.insert('puzzle/1', 3, 60, 'slow', 1)     # full, and slower than all
+    assert recordid is None
+    assert [row[0] for row in top] == [30, 40, 50]
+
+    recordid, top = store.insert('puzzle/1', 3, 35, 'b', 1)
+    assert recordid is not None
+    assert [(row[0], row[1]) for row in top] == [(30, top[0][1]), (35, recordid), (40, top[2][1])]
+    assert [row[0] for row in store.top('puzzle/1', 10)] == [30, 35, 40]
+
+def test_store_ties_go_to_the_first(store):
+    first, _ = store.insert('puzzle/1', 1, 20, 'first', 1)
+    second, top = store.insert('puzzle/1', 1, 20, 'second', 1)
+    assert second is None
+    assert [row[2] for row in top] == ['first']
+
+def test_store_boards_are_separate(store):
+    store.insert('puzzle/1', 3, 10, 'a', 1)
+    store.insert('puzzle/2', 3, 20, 'b', 2)
+    assert [row[0] for row in store.top('puzzle/1', 3)] == [10]
+    assert [row[0] for row in store.top('puzzle/2', 3)] == [20]
+    assert store.top('puzzle/3', 3) == []
+
+
+def test_record(store):
+    scores = highscore.HighScores(store, k=2)
+    recordid, new = scores.record(7, 'two', 100.0, 'a')
+    assert new and recordid
+    assert isinstance(recordid, str)
+    assert scores.times(highscore.puzzleBoard(7)) == [100.0]
+    assert scores.times(highscore.difficultyBoard('two')) == [100.0]
+
+    assert scores.record(7, 'two', 90.0, 'b')[1]
+    assert scores.record(7, 'two', 200.0, 'c') == ('', False)      # both boards full of faster times
+    assert [row[2] for row in scores.top(highscore.puzzleBoard(7))] == ['b', 'a']
+
+    # too slow for puzzle 7's board, but puzzle 8's is empty
+    assert scores.record(8, 'two', 200.0, 'c')[1]
+    assert scores.times(highscore.difficultyBoard('two')) == [90.0, 100.0]
+
+def test_record_without_difficulty(store):
+    scores = highscore.HighScores(store)
+    assert scores.record(7, None, 50.0)[1]
+    assert store.top(highscore.puzzleBoard(7), 10)[0][2] == ''
+    assert store.top(highscore.difficultyBoard(None), 10) == []
+
+def test_record_cuts_long_names(store):
+    scores = highscore.HighScores(store)
+    scores.record(7, 'one', 50.0, 'x' * 100)
+    assert store.top(highscore.puzzleBoard(7), 1)[0][2] == 'x' * highscore.MAX_NAME
+
+def test_cache_is_bounded(store):
+    scores = highscore.HighScores(store, maxBoards=4)
+    for puzzleid in range(10):
+        scores.record(puzzleid, 'one', 50.0)
+    assert len(scores.cache) <= 4
@@ -0,0 +1,130 @@
+# test_localapi.py
+# the emulator's container bookkeeping (cold starts, warm reuse, idle timeout, the 429 past
+# maxContainers) with a stand-in handler, then both real handlers through the Gateway over a
+# small generated puzzle file.
+#
+#   python -m pytest test_localapi.py
+
+import json
+import threading
+import types
+
+import pytest
+
+import localapi
+import sudolib
+
+
+@pytest.fixture
+def function(tmp_path, monkeypatch):
+    """Function whose containers start instantly, and whose handler echoes the container number
+    (or blocks until released, for event {'hold': Event})"""
+    function = localapi.Function('fake', str(tmp_path), maxContainers=2, idleTimeout=300)
+
+    def start():
+        function.started += 1
+        number = function.started
+
+        def handler(event, context):
+            if 'hold' in event:
+                event['entered'].set()
+                event['hold'].wait(5)
+            return number
+        function.coldStarts.append(0.0)
+        return localapi.Container(types.SimpleNamespace(lambda_handler=handler), 0.0)
+    monkeypatch.setattr(function, 'start', start)
+    return function
+
+def held(function):
+    """invokes function on a thread, and returns once the handler is running. Set the returned
+    event to let it finish"""
+    release, entered = threading.Event(), threading.Event()
+    thread = threading.Thread(target=function.invoke, args=({'hold': release, 'entered': entered},))
+    thread.start()
+    assert entered.wait(5)
+    return release, thread
+
+
+def test_warm_reuse(function):
+    assert function.invoke({}) == (1, True)
+    assert function.invoke({}) == (1, False)
+    assert function.invoke({}) == (1, False)
+    stats = function.stats()
+    assert (stats['containers'], stats['warm'], stats['throttled']) == (1, 1, 0)
+
+def test_concurrent_requests_get_their_own_container(function):
+    release, thread = held(function)
+    assert function.invoke({}) == (2, True)         # container 1 is busy
+    release.set()
+    thread.join()
+    assert function.stats()['warm'] == 2
+    assert function.invoke({})[1] is False
+
+def test_throttled_past_max_containers(function):
+    holds = [held(function) for _ in range(2)]
+    with pytest.raises(localapi.Throttled):
+        function.invoke({})
+    assert function.stats()['throttled'] == 1
+    for release, thread in holds:
+        release.set()
+        thread.join()
+    assert function.invoke({})[1] is False          # free again, and warm
+    assert function.active == 0
+
+def test_idle_containers_go_cold(function):
+    function.invoke({})
+    function.idleTimeout = -1
+    assert function.invoke({}) == (2, True)
+    assert function.stats()['containers'] == 2
+
+def test_failed_start_frees_its_slot(function, monkeypatch):
+    def start():
+        raise ImportError('broken package')
+    monkeypatch.setattr(function, 'start', start)
+    for _ in range(3):
+        with pytest.raises(ImportError):
+            function.invoke({})
+    assert function.active == 0 and function.throttled == 0
+
+
+@pytest.fixture(scope='module')
+def gateway(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp('localapi')
+    s3root = localapi.makeS3(str(tmp / 's3'), count=8, seed=3)
+    return localapi.makeGateway(s3root, str(tmp), maxContainers=1)
+
+def call(gateway, method, path, body=None, headers=()):
+    status, headers, out = gateway.handle(method, path, list(headers),
+                                          None if body is None else json.dumps(body).encode())
+    return status, headers, json.loads(out) if out else None
+
+def test_gateway_get_and_submit(gateway):
+    status, headers, puzzle = call(gateway, 'GET', '/dev/getpuzzle/two?format=compact')
+    assert status == 200 and headers['Access-Control-Allow-Origin'] == '*'
+    board = sudolib.Board.fromString(puzzle['data']['board']).toRows()
+    status, _, second = call(gateway, 'GET', '/getpuzzle/two', headers=[('Accept', 'application/json')])
+    assert status == 200 and isinstance(second['data']['board'], list)
+    assert gateway.getpuzzle.stats()['containers'] == 1     # the second one was warm
+
+    event = dict(puzzle, submission=sudolib.solveExact(board), username='test')
+    status, _, result = call(gateway, 'POST', '/dev/submitpuzzle', event)
+    assert status == 200
+    assert result['body']['data']['complete']
+
+def test_gateway_errors(gateway):
+    assert call(gateway, 'GET', '/getpuzzle/999999')[0] == 404
+    assert call(gateway, 'GET', '/nothing/here')[0] == 403
+    assert call(gateway, 'DELETE', '/getpuzzle/two')[0] == 405
+    status, headers, _ = call(gateway, 'OPTIONS', '/getpuzzle/two')
+    assert status == 204 and 'Accept' in headers['Access-Control-Allow-Headers']
+    assert gateway.handle('POST', '/submitpuzzle', [], b'{not json')[0] == 400
+
+def test_gateway_throttles(gateway):
+    gateway.getpuzzle.invoke({'pathParameters': {'proxy': 'two'}})     # make sure one is warm
+    container, cold = gateway.getpuzzle.acquire()                       # and busy
+    try:
+        status, _, body = call(gateway, 'GET', '/getpuzzle/two')
+        assert status == 429 and body == {'message': 'Rate Exceeded.'}
+    finally:
+        gateway.getpuzzle.release(container)
+    assert call(gateway, 'GET', '/getpuzzle/two')[0] == 200
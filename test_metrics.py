@@ -0,0 +1,78 @@
+# test_metrics.py
+# EMF log lines: valid JSON, every phase declared as a metric, repeated phases added up.
+#
+#   python -m pytest test_metrics.py
+
+import io
+import json
+import time
+
+import metrics
+
+
+def definitions(line):
+    return [m['Name'] for m in line['_aws']['CloudWatchMetrics'][0]['Metrics']]
+
+
+def test_line_is_emf():
+    timer = metrics.Timer('getpuzzle')
+    timer.set('n', 3)
+    timer.set('compact', True)
+    timer.set('label', 'a"b')
+    for phase in ('query', 'shuffle', 'hmac'):
+        timer.mark(phase)
+    line = json.loads(timer.line())
+
+    assert line['Function'] == 'getpuzzle'
+    assert line['ColdStart'] == 0
+    assert (line['n'], line['compact'], line['label']) == (3, True, 'a"b')
+    assert definitions(line) == ['query', 'shuffle', 'hmac', 'total', 'ColdStart']
+    assert line['_aws']['CloudWatchMetrics'][0]['Dimensions'] == [['Function']]
+    assert abs(line['_aws']['Timestamp'] - time.time() * 1000) < 60000
+    assert line['total'] >= line['query'] + line['shuffle'] + line['hmac'] - 0.001
+
+def test_repeated_phases_add_up():
+    timer = metrics.Timer('getpuzzle')
+    for phase in ('shuffle', 'hmac', 'shuffle', 'hmac'):
+        time.sleep(0.002)
+        timer.mark(phase)
+    line = json.loads(timer.line())
+    assert definitions(line) == ['shuffle', 'hmac', 'total', 'ColdStart']
+    assert line['shuffle'] >= 4 and line['hmac'] >= 4
+
+def test_cold_start_carries_init_phases():
+    init = metrics.Timer('submitpuzzle')
+    init.mark('highscore')
+    timer = metrics.Timer('submitpuzzle', init=init)
+    timer.mark('hmac')
+    line = json.loads(timer.line())
+    assert line['ColdStart'] == 1
+    assert definitions(line) == ['hmac', 'init_highscore', 'total', 'ColdStart']
+
+def test_each_line_gets_its_own_numbers():
+    first, second = metrics.Timer('getpuzzle'), metrics.Timer('getpuzzle')
+    first.set('n', 1)
+    second.set('n', 2)
+    first.mark('query')
+    time.sleep(0.002)
+    second.mark('query')
+    assert json.loads(first.line())['n'] == 1
+    assert json.loads(second.line())['n'] == 2
+    assert json.loads(second.line())['query'] > json.loads(first.line())['query']
+
+def test_emit_writes_one_line(monkeypatch):
+    out = io.StringIO()
+    monkeypatch.setattr(metrics, 'OUT', out)
+    timer = metrics.Timer('getpuzzle')
+    timer.mark('query')
+    timer.emit()
+    assert out.getvalue().count('\n') == 1
+    json.loads(out.getvalue())
+
+def test_null_timer(monkeypatch):
+    monkeypatch.setattr(metrics, 'ENABLED', False)
+    timer = metrics.timer('getpuzzle')
+    assert timer is metrics.NULL
+    timer.mark('query')
+    timer.set('n', 1)
+    timer.emit()
@@ -0,0 +1,176 @@
+# test_puzzledb.py
+# puzzle file schema: migrate() dedupe and pz_seq numbering, and decoding picked rows from text
+# and packed files. pack() has to keep every row and column, and openReadOnly() has to open
+# exactly the path it's given, read only.
+#
+#   python -m pytest test_puzzledb.py
+
+import os
+import sqlite3
+
+import pytest
+
+import puzzledb
+import sudolib
+
+
+def oldFile(boards):
+    """puzzle file from before pz_difficulty/pz_seq/pz_canon_key, one row per board in order"""
+    db = sqlite3.connect(':memory:')
+    db.execute('CREATE TABLE puzzle (pz_id INTEGER PRIMARY KEY, pz_content TEXT NOT NULL, \
+                pz_carved_cells INTEGER NOT NULL)')
+    db.executemany('INSERT INTO puzzle (pz_content, pz_carved_cells) VALUES (?, ?)',
+                   [(sudolib.stringify(board), sudolib.countZeros(board)) for board in boards])
+    return db
+
+def seqs(db):
+    """{difficulty: sorted pz_seqs}"""
+    out = {}
+    for difficulty, seq in db.execute('SELECT pz_difficulty, pz_seq FROM puzzle'):
+        out.setdefault(difficulty, []).append(seq)
+    return {difficulty: sorted(seq) for difficulty, seq in out.items()}
+
+
+def test_migrate_drops_equivalent_copies():
+    s3, s4 = sudolib.s3, sudolib.s4
+    db = oldFile([s3, s4, sudolib.shuffle(s3, 1), s3, sudolib.shuffle(s4, 2), sudolib.s5])
+    puzzledb.migrate(db)
+
+    # the first copy of each puzzle stays
+    assert [row[0] for row in db.execute('SELECT pz_id FROM puzzle ORDER BY pz_id')] == [1, 2, 6]
+    keys = dict(db.execute('SELECT pz_id, pz_canon_key FROM puzzle'))
+    assert keys[1] == sudolib.canonicalKey(s3)[1]
+    assert keys[2] == sudolib.canonicalKey(s4)[1]
+
+def test_migrate_numbers_seq_densely():
+    boards = [sudolib.s3, sudolib.shuffle(sudolib.s3, 3), sudolib.s4, sudolib.s5, sudolib.f1]
+    db = oldFile(boards)
+    puzzledb.migrate(db)
+
+    counts = puzzledb.loadCounts(db)
+    assert set(counts) == set(puzzledb.DIFFICULTIES)
+    assert sum(counts.values()) == 4
+    for difficulty, seq in seqs(db).items():
+        assert seq == list(range(counts[difficulty]))
+    for carved, difficulty in db.execute('SELECT pz_carved_cells, pz_difficulty FROM puzzle'):
+        assert difficulty == puzzledb.difficultyOf(carved)
+
+    # and every surviving row can be picked by its (difficulty, seq)
+    for difficulty in puzzledb.DIFFICULTIES:
+        for seq in range(counts[difficulty]):
+            assert db.execute(puzzledb.PICK_QUERY.format('pz_id'), (difficulty, seq)).fetchone()
+
+def test_migrate_renumbers_after_delete():
+    db = oldFile([sudolib.s3, sudolib.s4, sudolib.s5])
+    puzzledb.migrate(db)
+    db.execute('DELETE FROM puzzle WHERE pz_id = 1')
+    puzzledb.migrate(db)
+
+    counts = puzzledb.loadCounts(db)
+    assert sum(counts.values()) == 2
+    for difficulty, seq in seqs(db).items():
+        assert seq == list(range(counts[difficulty]))
+
+def test_migrate_solves_old_rows():
+    db = oldFile([sudolib.s4])
+    puzzledb.migrate(db)
+    solution, = db.execute('SELECT pz_solution FROM puzzle').fetchone()
+    assert solution == sudolib.solveExact(sudolib.Board.fromRows(sudolib.s4)).toString()
+
+def test_insert_skips_duplicates():
+    db = sqlite3.connect(':memory:')
+    puzzledb.migrate(db)
+    rows = [(sudolib.stringify(board), sudolib.countZeros(board))
+            for board in (sudolib.s3, sudolib.s4, sudolib.shuffle(sudolib.s3, 4))]
+    assert puzzledb.insertPuzzles(db, rows) == 2
+    assert puzzledb.insertPuzzles(db, rows[:1]) == 0
+
+    counts = puzzledb.loadCounts(db)
+    assert sum(counts.values()) == 2
+    for difficulty, seq in seqs(db).items():
+        assert seq == list(range(counts[difficulty]))
+
+
+def textAndPacked(tmp_path, boards):
+    """a migrated text file holding boards, and a packed copy of it"""
+    db = puzzledb.openDB(str(tmp_path / 'text.sqlite'))
+    puzzledb.insertPuzzles(db, [(sudolib.stringify(board), sudolib.countZeros(board)) for board in boards])
+    return db, puzzledb.pack(db, str(tmp_path / 'packed.sqlite'))
+
+def test_decode_row_packed_matches_text(tmp_path):
+    text, packed = textAndPacked(tmp_path, [sudolib.s3, sudolib.s4, sudolib.s5])
+    query = 'SELECT {} FROM puzzle ORDER BY pz_id'
+    textRows = text.execute(query.format(puzzledb.pickColumns(text))).fetchall()
+    packedRows = packed.execute(query.format(puzzledb.pickColumns(packed))).fetchall()
+    assert isinstance(packedRows[0][1], bytes) and len(packedRows[0][1]) == 41
+    assert isinstance(packedRows[0][2], bytes)
+
+    for textRow, packedRow in zip(textRows, packedRows):
+        pz_id, board, solution = puzzledb.decodeRow(packedRow)
+        assert (pz_id, board, solution) == puzzledb.decodeRow(textRow)
+        assert isinstance(board, sudolib.Board) and isinstance(solution, sudolib.Board)
+        assert solution == sudolib.solveExact(board)
+        assert sudolib.countZeros(solution.toRows()) == 0
+
+def test_decode_row_without_solution():
+    pz_id, board, solution = puzzledb.decodeRow((7, sudolib.Board.fromRows(sudolib.s4).toPacked()))
+    assert (pz_id, solution) == (7, None)
+    assert board.toRows() == [list(row) for row in sudolib.s4]
+    assert puzzledb.decodeRow((7, sudolib.stringify(sudolib.s4), None))[2] is None
+
+def test_pick_packed(tmp_path):
+    text, packed = textAndPacked(tmp_path, [sudolib.s3, sudolib.s4, sudolib.s5])
+    counts = puzzledb.loadCounts(packed)
+    assert counts == puzzledb.loadCounts(text)
+    select = puzzledb.pickColumns(packed)
+    for difficulty, count in counts.items():
+        rows = puzzledb.pickRandomMany(packed, difficulty, counts, 10, select)
+        assert len(rows) == count
+        for row in rows:
+            pz_id, board, solution = puzzledb.decodeRow(row)
+            assert solution == sudolib.solveExact(board)
+
+def test_migrate_keeps_lowest_id_over_keyed_copy():
+    # a row keyed by an earlier migrate, and an older unkeyed copy of it: the older one stays
+    db = oldFile([sudolib.s3, sudolib.s4, sudolib.shuffle(sudolib.s3, 5)])
+    db.execute('ALTER TABLE puzzle ADD COLUMN pz_canon_key')
+    db.execute('UPDATE puzzle SET pz_canon_key = ? WHERE pz_id = 3', (sudolib.canonicalKey(sudolib.s3)[1],))
+    puzzledb.migrate(db)
+    assert [row[0] for row in db.execute('SELECT pz_id FROM puzzle ORDER BY pz_id')] == [1, 2]
+    assert dict(db.execute('SELECT pz_id, pz_canon_key FROM puzzle'))[1] == sudolib.canonicalKey(sudolib.s3)[1]
+
+
+def test_packed_round_trip():
+    for board in (sudolib.s3, sudolib.f1, [[0] * 9 for _ in range(9)], [[9] * 9 for _ in range(9)]):
+        compact = sudolib.Board.fromRows(board)
+        packed = compact.toPacked()
+        assert len(packed) == 41
+        assert sudolib.Board.fromPacked(packed) == compact
+        assert puzzledb.decodeBoard(packed) == puzzledb.decodeBoard(compact.toString())
+
+def test_pack_keeps_everything(tmp_path):
+    text, packed = textAndPacked(tmp_path, [sudolib.s3, sudolib.s4, sudolib.s5, sudolib.f1])
+    assert puzzledb.columns(packed, 'puzzle') == puzzledb.columns(text, 'puzzle')
+    query = 'SELECT * FROM puzzle ORDER BY pz_id'
+    for textRow, packedRow in zip(text.execute(query), packed.execute(query)):
+        textRow, packedRow = list(textRow), list(packedRow)
+        for i, col in enumerate(puzzledb.columns(text, 'puzzle')):
+            if col in ('pz_content', 'pz_solution') and textRow[i] is not None:
+                textRow[i], packedRow[i] = puzzledb.decodeBoard(textRow[i]), puzzledb.decodeBoard(packedRow[i])
+        assert packedRow == textRow
+    assert text.execute('SELECT count(*) FROM puzzle').fetchone() == packed.execute(
+        'SELECT count(*) FROM puzzle').fetchone()
+
+def test_open_read_only(tmp_path):
+    folder = tmp_path / 'odd ?#% name'
+    folder.mkdir()
+    text, packed = textAndPacked(folder, [sudolib.s3, sudolib.s4])
+    packed.close()
+    db = puzzledb.openReadOnly(str(folder / 'packed.sqlite'))
+    assert puzzledb.loadCounts(db) == puzzledb.loadCounts(text)
+    assert puzzledb.pickColumns(db).endswith('pz_solution')
+    assert db.execute('PRAGMA mmap_size').fetchone()[0] > 0
+    with pytest.raises(sqlite3.OperationalError):
+        db.execute('DELETE FROM puzzle')
+    # the path was opened as is, not cut short at the '?' (which would open a new, empty file)
+    assert not os.path.exists(str(tmp_path / 'odd '))
@@ -0,0 +1,73 @@
+# test_puzzlepool.py
+# PuzzlePool: batches come back whole and distinct, the pool drains before it refills, and a
+# batch bigger than the pool still gets all its puzzles.
+#
+#   python -m pytest test_puzzlepool.py
+
+import puzzledb
+import puzzlepool
+import sudolib
+
+
+def puzzleFile(tmp_path, count=12):
+    """packed file holding count different 'two' puzzles (44 carved cells each)"""
+    solution = sudolib.solveExact(sudolib.s5)
+    db = puzzledb.openDB(str(tmp_path / 'text.sqlite'))
+    puzzledb.insertPuzzles(db, [(sudolib.stringify(sudolib.carve(solution, count=44, rng=seed)), 44)
+                                for seed in range(count)])
+    path = str(tmp_path / 'packed.sqlite')
+    puzzledb.pack(db, path).close()
+    return puzzledb.openReadOnly(path)
+
+def makePool(db, size):
+    """pool over db, that logs the n of each refill() in pool.refills"""
+    pool = puzzlepool.PuzzlePool(db, puzzledb.loadCounts(db), size=size, select=puzzledb.pickColumns(db))
+    pool.refills = []
+    refill = pool.refill
+    pool.refill = lambda difficulty, n=0: pool.refills.append(n) or refill(difficulty, n)
+    return pool
+
+
+def test_pop_many_drains_then_refills(tmp_path):
+    db = puzzleFile(tmp_path)
+    pool = makePool(db, 4)
+    refills = pool.refills
+
+    first = pool.popMany('two', 3)
+    assert len(first) == 3 and refills == [3]
+    assert len(pool.pools['two']) == 1
+    second = pool.popMany('two', 1)                 # the leftover, no query
+    assert refills == [3]
+    assert second[0][0] not in [puzzle[0] for puzzle in first]
+    assert pool.pools['two'] == []
+
+    third = pool.popMany('two', 2)
+    assert len(third) == 2 and refills == [3, 2]
+    for pz_id, board, solution in first + second + third:
+        assert solution == sudolib.solveExact(board)
+
+def test_pop_many_bigger_than_pool(tmp_path):
+    db = puzzleFile(tmp_path)
+    pool = makePool(db, 4)
+    pool.popMany('two', 3)                          # one left over
+    batch = pool.popMany('two', 7)
+    assert pool.refills == [3, 7]
+    assert len(batch) == 7
+    assert len(set(puzzle[0] for puzzle in batch)) == 7
+
+def test_pop_many_more_than_there_are(tmp_path):
+    db = puzzleFile(tmp_path, count=5)
+    pool = makePool(db, 4)
+    batch = pool.popMany('two', 8)
+    assert sorted(puzzle[0] for puzzle in batch) == [1, 2, 3, 4, 5]
+    assert pool.popMany('four', 3) == []
+
+def test_pool_goes_stale(tmp_path):
+    db = puzzleFile(tmp_path)
+    pool = makePool(db, 4)
+    pool.maxAge = -1                                # everything is already too old
+    pool.popMany('two', 1)
+    assert len(pool.pools['two']) == 3
+    pool.popMany('two', 1)                          # leftovers are stale, so it refills anyway
+    assert pool.refills == [1, 1]
+    assert len(pool.pools['two']) == 3
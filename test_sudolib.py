@@ -0,0 +1,239 @@
+# test_sudolib.py
+# canonical form: every equivalent copy of a puzzle has to land on the same canonical string and
+# key (that's what puzzledb dedupes on), and different puzzles mustn't. shuffle() has to hand out
+# copies that are the same puzzle. Then the solver: countSolutions(), carve(), MaskBoard
+# rollback(), and solve() against solveExact() on the bench corpus. iterPuzzles() has to give the
+# same puzzles for a seed whatever the number of workers.
+#
+#   python -m pytest test_sudolib.py
+
+import sudolib
+from bench import CORPUS
+
+
+def relabel(board, mapping):
+    return [[mapping[value] for value in row] for row in board]
+
+def transpose(board):
+    return [list(col) for col in zip(*board)]
+
+def swapBands(board, a, b):
+    rows = list(board)
+    rows[3*a:3*a+3], rows[3*b:3*b+3] = rows[3*b:3*b+3], rows[3*a:3*a+3]
+    return [list(row) for row in rows]
+
+def swapCols(board, a, b):
+    out = [list(row) for row in board]
+    for row in out:
+        row[a], row[b] = row[b], row[a]
+    return out
+
+def equivalents(board):
+    """hand-made equivalent copies of board, one per kind of symmetry"""
+    digits = {0: 0, 1: 5, 2: 9, 3: 1, 4: 7, 5: 2, 6: 8, 7: 3, 8: 6, 9: 4}
+    return [
+        relabel(board, digits),
+        transpose(board),
+        swapBands(board, 0, 2),
+        swapCols(board, 3, 5),             # two cols in the same stack
+        [row[::-1] for row in board],      # reflection: stacks and cols within them reversed
+        transpose(swapBands(relabel(board, digits), 1, 2)),
+    ]
+
+
+def test_canonicalize_equivalent_boards():
+    for board in (sudolib.s3, sudolib.s4, sudolib.s5, sudolib.f1):
+        canon = sudolib.canonicalize(board)
+        for other in equivalents(board):
+            assert sudolib.canonicalize(other) == canon
+
+def test_canonicalize_is_idempotent():
+    canon = sudolib.canonicalize(sudolib.s5)
+    assert sudolib.canonicalize(canon) == canon
+
+def test_canonicalize_keeps_board_kind():
+    board = sudolib.Board.fromRows(sudolib.s4)
+    canon = sudolib.canonicalize(board)
+    assert isinstance(canon, sudolib.Board)
+    assert canon.toRows() == sudolib.canonicalize(sudolib.s4)
+
+def test_canonicalize_keeps_the_puzzle():
+    canon = sudolib.canonicalize(sudolib.s3)
+    assert sudolib.countZeros(canon) == sudolib.countZeros(sudolib.s3)
+    assert sudolib.countSolutions(canon) == 1
+
+def test_canonical_key_equivalent_boards():
+    canon, key = sudolib.canonicalKey(sudolib.s4)
+    assert canon == sudolib.stringify(sudolib.canonicalize(sudolib.s4))
+    for other in equivalents(sudolib.s4):
+        assert sudolib.canonicalKey(other) == (canon, key)
+    assert sudolib.canonicalKey(sudolib.Board.fromRows(sudolib.s4)) == (canon, key)
+
+def test_canonical_key_different_puzzles():
+    keys = set(sudolib.canonicalKey(board)[1] for board in (sudolib.s3, sudolib.s4, sudolib.s5, sudolib.f1))
+    assert len(keys) == 4
+    for key in keys:
+        assert -2**63 <= key < 2**63
+
+def test_canonical_key_one_clue_apart():
+    # same board with one more clue is a different puzzle
+    board = [list(row) for row in sudolib.s5]
+    solution = sudolib.solveExact(sudolib.Board.fromRows(board)).toRows()
+    y, x = next((y, x) for y in range(9) for x in range(9) if board[y][x] == 0)
+    board[y][x] = solution[y][x]
+    assert sudolib.canonicalKey(board)[1] != sudolib.canonicalKey(sudolib.s5)[1]
+
+
+def test_shuffle_is_the_same_puzzle():
+    for seed in range(20):
+        board = sudolib.shuffle(sudolib.s5, seed)
+        assert sudolib.countZeros(board) == sudolib.countZeros(sudolib.s5)
+        assert sudolib.canonicalKey(board) == sudolib.canonicalKey(sudolib.s5)
+
+def test_shuffle_full_board_stays_valid():
+    for seed in range(20):
+        board = sudolib.shuffle(sudolib.f1, seed)
+        assert sudolib.checkConsistent(board)
+        assert sudolib.countZeros(board) == 0
+
+def test_shuffle_board_kinds_agree():
+    compact = sudolib.Board.fromRows(sudolib.s3)
+    for seed in range(5):
+        shuffled = sudolib.shuffle(compact, seed)
+        assert isinstance(shuffled, sudolib.Board)
+        assert shuffled.toRows() == sudolib.shuffle(sudolib.s3, seed)
+
+def test_shuffle_seeded():
+    assert sudolib.shuffle(sudolib.s4, 7) == sudolib.shuffle(sudolib.s4, 7)
+    assert len(set(sudolib.stringify(sudolib.shuffle(sudolib.s4, seed)) for seed in range(20))) == 20
+
+def test_apply_transform_moves_the_solution_too():
+    transform = sudolib.randomTransform(11)
+    puzzle = sudolib.applyTransform(sudolib.s4, transform)
+    solution = sudolib.solveExact(sudolib.Board.fromRows(sudolib.s4))
+    assert sudolib.solveExact(sudolib.Board.fromRows(puzzle)) == sudolib.applyTransform(solution, transform)
+
+
+def withoutClue(board, y, x):
+    out = [list(row) for row in board]
+    out[y][x] = 0
+    return out
+
+def solvableWith(board, y, x, value):
+    out = [list(row) for row in board]
+    out[y][x] = value
+    return sudolib.checkConsistent(out) and sudolib.solveExact(out) is not None
+
+def test_count_solutions_unique():
+    for board in (sudolib.s3, sudolib.s4, sudolib.s5):
+        assert sudolib.countSolutions(board) == 1
+        assert sudolib.countSolutions(sudolib.Board.fromRows(board)) == 1
+        assert sudolib.countSolutions(sudolib.solveExact(board)) == 1
+
+def test_count_solutions_clue_removed():
+    # taking a clue out leaves >= 2 solutions exactly when some other value fits there too
+    for board in (sudolib.s3, sudolib.s4, sudolib.s5):
+        ambiguous = 0
+        for y, x in [(y, x) for y in range(9) for x in range(9) if board[y][x]]:
+            removed = withoutClue(board, y, x)
+            others = any(solvableWith(removed, y, x, value)
+                         for value in range(1, 10) if value != board[y][x])
+            assert sudolib.countSolutions(removed) == (2 if others else 1)
+            ambiguous += others
+        assert ambiguous > 0
+
+def test_count_solutions_limit_and_none():
+    empty = [[0] * 9 for _ in range(9)]
+    assert sudolib.countSolutions(empty, limit=5) == 5
+    board = [list(row) for row in sudolib.s5]
+    y, x = next((y, x) for y in range(9) for x in range(9) if board[y][x] == 0)
+    board[y][x] = next(value for value in board[y] if value)        # clashes with its row
+    assert sudolib.countSolutions(board) == 0
+
+
+def test_carve_is_unique_and_agrees():
+    solution = sudolib.solveExact(sudolib.s5)
+    for seed in range(5):
+        for count in (30, 50, 64):
+            puzzle = sudolib.carve(solution, count=count, rng=seed)
+            assert sudolib.countSolutions(puzzle) == 1
+            assert sudolib.countZeros(puzzle) <= count
+            assert all(value in (0, full)
+                       for value, full in zip(sudolib.flatten(puzzle), sudolib.flatten(solution)))
+            assert sudolib.solveExact(puzzle) == solution
+
+def test_carve_board_kinds_agree():
+    solution = sudolib.solveExact(sudolib.s4)
+    puzzle = sudolib.carve(sudolib.Board.fromRows(solution), count=45, rng=3)
+    assert isinstance(puzzle, sudolib.Board)
+    assert puzzle.toRows() == sudolib.carve(solution, count=45, rng=3)
+
+def test_carve_stops_early():
+    solution = sudolib.solveExact(sudolib.s3)
+    calls = []
+    def until(puzzle, removes):
+        calls.append(removes)
+        return removes == 20
+    puzzle = sudolib.carve(solution, count=60, until=until, rng=1)
+    assert calls == list(range(1, 21))
+    assert sudolib.countZeros(puzzle) == 20
+    assert sudolib.countSolutions(puzzle) == 1
+
+
+def maskState(mb):
+    return mb.cells[:], mb.rows[:], mb.cols[:], mb.sqrs[:], mb.broken, mb.trail[:]
+
+def test_rollback_restores_everything():
+    board = sudolib.unstringify(CORPUS['inkala2012'])      # propagate() alone won't finish it
+    mb = sudolib.MaskBoard(board)
+    before = maskState(mb)
+    mark = mb.checkpoint()
+    mb.propagate()
+    empty = [i for i in range(81) if mb.cells[i] == 0]
+    mb.place(empty[0], sudolib.MASK_DIGITS[mb.candidates(empty[0])][0])
+    middle = maskState(mb)
+
+    inner = mb.checkpoint()
+    mb.propagate()
+    assert not mb.place(empty[1], mb.cells[next(i for i in sudolib.PEERS[empty[1]] if mb.cells[i])])
+    assert mb.broken
+    mb.rollback(inner)
+    assert maskState(mb) == middle
+
+    mb.rollback(mark)
+    assert maskState(mb) == before
+    assert maskState(sudolib.MaskBoard(board)) == before
+
+def test_solve_agrees_with_solve_exact():
+    # solve() is best effort: on the hard ones it can stop short, but never disagrees
+    for name, content in CORPUS.items():
+        board = sudolib.unstringify(content)
+        exact = sudolib.solveExact(board)
+        assert sudolib.checkComplete(exact) and sudolib.checkConsistent(exact)
+        assert all(value in (0, full) for value, full in zip(sudolib.flatten(board), sudolib.flatten(exact)))
+        solved = sudolib.solve(board)
+        assert all(value in (0, full) for value, full in zip(sudolib.flatten(solved), sudolib.flatten(exact)))
+        if name.startswith('easy') or name == 'escargot':
+            assert solved == exact
+        assert sudolib.solve(sudolib.Board.fromRows(board)).toRows() == solved
+
+
+def generated(**kwargs):
+    return [(solution, puzzle, clues) for solution, puzzle, clues, _ in sudolib.iterPuzzles(**kwargs)]
+
+def test_iter_puzzles_same_for_any_workers():
+    inline = generated(count=6, diff=40, workers=0, seed=21)
+    assert generated(count=6, diff=40, workers=2, seed=21) == inline
+    assert generated(count=6, diff=40, workers=3, seed=21, queue=1) == inline
+    assert generated(count=6, diff=40, workers=0, seed=22) != inline
+    for solution, puzzle, clues in inline:
+        assert sudolib.checkComplete(solution) and sudolib.checkConsistent(solution)
+        assert clues == 81 - sudolib.countZeros(puzzle) == 41
+        assert sudolib.countSolutions(puzzle) == 1
+        assert sudolib.solveExact(puzzle) == solution
+
+def test_iter_puzzles_endless_stops_on_close():
+    puzzles = sudolib.iterPuzzles(diff=30, workers=2, seed=5, queue=2)
+    first = [next(puzzles)[1] for _ in range(3)]
+    puzzles.close()
+    assert first == [puzzle for _, puzzle, _ in generated(count=3, diff=30, workers=0, seed=5)]
@@ -0,0 +1,95 @@
+# test_validate.py
+# checkPuzzleTable(): every stored row has to hold up, the solution included. Then the checks
+# submitpuzzle and the batch jobs run: validateBoard(), keepsClues(), and validateBatch() agreeing
+# with validateBoard() board for board.
+#
+#   python -m pytest test_validate.py
+
+import pytest
+
+import puzzledb
+import sudolib
+import validate
+
+pytest.importorskip('numpy')
+
+
+def puzzleFile(tmp_path, boards):
+    db = puzzledb.openDB(str(tmp_path / 'text.sqlite'))
+    puzzledb.insertPuzzles(db, [(sudolib.stringify(board), sudolib.countZeros(board)) for board in boards])
+    return db
+
+
+def test_check_puzzle_table_clean(tmp_path):
+    db = puzzleFile(tmp_path, [sudolib.s3, sudolib.s4, sudolib.s5])
+    assert validate.checkPuzzleTable(db) == []
+    assert validate.checkPuzzleTable(puzzledb.pack(db, str(tmp_path / 'packed.sqlite'))) == []
+
+def test_check_puzzle_table_wrong_solution(tmp_path):
+    db = puzzleFile(tmp_path, [sudolib.s3, sudolib.s4])
+    # a full board that's right, but not s4's solution
+    other = sudolib.solveExact(sudolib.Board.fromRows(sudolib.s3)).toString()
+    db.execute('UPDATE puzzle SET pz_solution = ? WHERE pz_id = 2', (other,))
+    db.execute('UPDATE puzzle SET pz_solution = NULL WHERE pz_id = 1')
+    assert validate.checkPuzzleTable(db) == [(1, 'pz_solution missing'), (2, 'pz_solution wrong')]
+    assert validate.checkPuzzleTable(db, chunk=1) == [(1, 'pz_solution missing'), (2, 'pz_solution wrong')]
+
+def test_check_puzzle_table_bad_rows(tmp_path):
+    db = puzzleFile(tmp_path, [sudolib.s3, sudolib.s4])
+    board = [list(row) for row in sudolib.s4]
+    board[0][0] = board[0][1] = 9
+    db.execute('UPDATE puzzle SET pz_content = ?, pz_carved_cells = ? WHERE pz_id = 2',
+               (sudolib.stringify(board), sudolib.countZeros(board)))
+    db.execute('UPDATE puzzle SET pz_carved_cells = 0 WHERE pz_id = 1')
+    assert validate.checkPuzzleTable(db) == [(2, 'inconsistent'), (1, 'pz_carved_cells mismatch')]
+
+
+def solved(board):
+    return sudolib.solveExact(sudolib.Board.fromRows(board)).toRows()
+
+def test_validate_board():
+    solution = solved(sudolib.s5)
+    assert validate.validateBoard(solution)
+    assert validate.validateBoard(sudolib.Board.fromRows(solution))
+    assert not validate.validateBoard(sudolib.s5)                  # incomplete
+    swapped = [list(row) for row in solution]
+    swapped[0][0], swapped[1][0] = swapped[1][0], swapped[0][0]     # rows fine, cols clash
+    assert not validate.validateBoard(swapped)
+    assert not validate.validateBoard([[str(v) for v in row] for row in solution])
+    assert not validate.validateBoard(solution[:8])
+
+def test_keeps_clues():
+    solution = solved(sudolib.s4)
+    assert validate.keepsClues(solution, sudolib.s4)
+    assert validate.keepsClues(solution, sudolib.Board.fromRows(sudolib.s4).toDigits())
+    assert validate.keepsClues(sudolib.Board.fromRows(solution), sudolib.s4)
+    # a valid full board, but not one that keeps s4's clues
+    assert not validate.keepsClues(solved(sudolib.s3), sudolib.s4)
+    assert not validate.keepsClues(sudolib.s4, solution)
+
+def test_validate_batch_matches_board():
+    solution = solved(sudolib.s5)
+    swapped = [list(row) for row in solution]
+    swapped[0][0], swapped[1][0] = swapped[1][0], swapped[0][0]
+    outOfRange = [list(row) for row in sudolib.s5]
+    outOfRange[0][0] = 10
+    negative = [list(row) for row in sudolib.s5]
+    negative[0][0] = -1
+    repeated = [list(row) for row in sudolib.s5]
+    y, x = next((y, x) for x in range(9) for y in range(9) if repeated[y][x] == 0)
+    repeated[y][x] = next(v for v in repeated[y] if v)
+    boards = [solution, sudolib.s5, swapped, outOfRange, negative, repeated, sudolib.f1]
+
+    complete, consistent = validate.validateBatch(boards)
+    assert complete.tolist() == [True, False, True, False, False, False, True]
+    assert consistent.tolist() == [True, True, False, False, False, False, True]
+    assert (complete & consistent).tolist() == [validate.validateBoard(board) for board in boards]
+
+def test_validate_batch_from_strings():
+    boards = [sudolib.s3, sudolib.s4, solved(sudolib.s5)]
+    for contents in ([sudolib.stringify(board) for board in boards],
+                     [sudolib.Board.fromRows(board).toPacked() for board in boards]):
+        array = validate.stringsToArray(contents)
+        assert array.shape == (3, 9, 9)
+        assert array.tolist() == [[list(row) for row in board] for board in boards]
+    assert validate.validateBatch(validate.stringsToArray([sudolib.stringify(solved(sudolib.s5))]))[0].all()
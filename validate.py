@@ -0,0 +1,120 @@
+# validate.py
+# fast board validation. validateBoard() checks one board in pure python (this is what
+# submitpuzzle uses). validateBatch() checks an (N, 9, 9) stack of boards at once with numpy,
+# for offline jobs like re-verifying every row of the puzzle table:
+#
+#   python validate.py pseudoku.sqlite
+
+import puzzledb
+import sudolib
+
+try:
+    import numpy as np
+except ImportError:     # the lambda runtime doesn't ship numpy, and only the batch path needs it
+    np = None
+
+
+FULL_UNIT = frozenset(range(1, 10))
+
+
+def validateBoard(board):
+    """True if board is complete and consistent, eg a correct solution. Takes a list board or
+    a Board. Every unit has to hold exactly 1-9, so stray values (10, -1, '5') fail too."""
+    flat = sudolib.flatten(board)
+    if len(flat) != 81:
+        return False
+    for unit in sudolib.UNITS:
+        if {flat[i] for i in unit} != FULL_UNIT:
+            return False
+    return True
+
+def keepsClues(board, puzzle):
+    """True if board still has every given cell of puzzle. puzzle can also be the compact
+    format's 81-char string"""
+    if isinstance(puzzle, str):
+        puzzle = sudolib.Board.fromString(puzzle)
+    flat = sudolib.flatten(board)
+    return all(flat[i] == value for i, value in enumerate(sudolib.flatten(puzzle)) if value)
+
+def validateBatch(boards):
+    """Checks N boards at once. boards is anything numpy can turn into an (N, 9, 9) int array.
+    Returns (complete, consistent), two length-N bool arrays:
+        complete    every cell is 1-9
+        consistent  no value outside 0-9, and no digit twice in a row/col/sqr (0 is ignored)
+    A correct solution is complete & consistent."""
+    if np is None:
+        raise ImportError('validateBatch() needs numpy')
+
+    boards = np.asarray(boards, dtype=np.int8).reshape(-1, 9, 9)
+    inRange = ((boards >= 0) & (boards <= 9)).all(axis=(1, 2))
+    complete = ((boards >= 1) & (boards <= 9)).all(axis=(1, 2))
+
+    # one-hot digits: hot[n, y, x, d] is True if cell y,x of board n holds d+1
+    hot = boards[..., None] == np.arange(1, 10, dtype=np.int8)
+    rows = hot.sum(axis=2)                                              # (N, 9, 9)
+    cols = hot.sum(axis=1)                                              # (N, 9, 9)
+    sqrs = hot.reshape(-1, 3, 3, 3, 3, 9).sum(axis=(2, 4))              # (N, 3, 3, 9)
+    consistent = (inRange
+                  & (rows <= 1).all(axis=(1, 2))
+                  & (cols <= 1).all(axis=(1, 2))
+                  & (sqrs <= 1).all(axis=(1, 2, 3)))
+    return complete, consistent
+
+def stringsToArray(contents):
+    """list of pz_content strings (or packed BLOBs) -> (N, 9, 9) int8 array, without going
+    through lists"""
+    if contents and isinstance(contents[0], bytes):
+        raw = b''.join(sudolib.Board.fromPacked(c).cells.tobytes() for c in contents)
+        return np.frombuffer(raw, dtype=np.int8).reshape(-1, 9, 9)
+    raw = ''.join(contents).replace(';', '').encode()
+    return (np.frombuffer(raw, dtype=np.uint8) - ord('0')).astype(np.int8).reshape(-1, 9, 9)
+
+def checkPuzzleTable(db, chunk=100000):
+    """Re-verifies every row of the puzzle table: the stored puzzle has to be consistent,
+    pz_carved_cells has to match it, and (in files that have the column) pz_solution has to be
+    what solveExact() makes of it--getpuzzle signs a digest of that column, so a wrong one would
+    fail every correct submission. Returns list of (pz_id, problem) for bad rows."""
+    select = 'pz_id, pz_content, pz_carved_cells'
+    hasSolution = 'pz_solution' in puzzledb.columns(db, 'puzzle')
+    if hasSolution:
+        select += ', pz_solution'
+    bad = []
+    lastId = -1
+    while True:
+        rows = db.execute('SELECT {} FROM puzzle WHERE pz_id > ? ORDER BY pz_id LIMIT ?'.format(select),
+                          (lastId, chunk)).fetchall()
+        if not rows:
+            return bad
+        lastId = rows[-1][0]
+
+        ids = np.array([row[0] for row in rows])
+        boards = stringsToArray([row[1] for row in rows])
+        carved = np.array([row[2] for row in rows])
+
+        complete, consistent = validateBatch(boards)
+        for pz_id in ids[~consistent]:
+            bad.append((int(pz_id), 'inconsistent'))
+        for pz_id in ids[(boards == 0).sum(axis=(1, 2)) != carved]:
+            bad.append((int(pz_id), 'pz_carved_cells mismatch'))
+        if hasSolution:
+            # the solver is the slow part, so only for rows that passed the rest
+            for row, ok in zip(rows, consistent):
+                if not ok:
+                    continue
+                if row[3] is None:
+                    bad.append((row[0], 'pz_solution missing'))
+                elif puzzledb.decodeBoard(row[3]) != sudolib.solveExact(puzzledb.decodeBoard(row[1])):
+                    bad.append((row[0], 'pz_solution wrong'))
+
+if __name__ == '__main__':
+    import sqlite3
+    import sys
+    import time
+
+    start = time.perf_counter()
+    db = sqlite3.connect(sys.argv[1])
+    bad = checkPuzzleTable(db)
+    total = db.execute('SELECT count(*) FROM puzzle').fetchone()[0]
+    for pz_id, problem in bad:
+        print(pz_id, problem)
+    print('checked {} puzzles in {:.2f}s, {} bad'.format(total, time.perf_counter() - start, len(bad)))